@@ -0,0 +1,372 @@
+import os
+import sys
+import json
+import time
+import base64
+import struct
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import keyring
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.backends import default_backend
+
+try:
+    import fcntl # Serializes journal appends with compaction across processes (app and daemon)
+except ImportError:
+    fcntl = None
+
+from config import (TEMPLATE_DIR, MODEL_PATH, KEYRING_SERVICE_NAME, SECRET_DERIVATION_SALT, KDF_ITERATIONS, ANCHOR_INDEX_PATH,
+                    ANCHOR_INDEX_PROBES, ANCHOR_INDEX_TRAIN_MIN, ANCHOR_INDEX_COMPACT_BYTES)
+from esn import model_fingerprint
+from reservoir import read_model
+from profile_store import ProfileStore, profile_key
+
+
+# Encrypted IVF index over the users' ESN anchors, for 1:N lookups (is a new enrollment too close
+# to an existing user? who is this typist?) without decrypting every profile. A k-means coarse
+# quantizer splits the anchors into about 4*sqrt(N) lists; a search scans only the `probes` lists
+# whose centroids are nearest the query, so its cost grows with sqrt(N) rather than N. Below
+# ANCHOR_INDEX_TRAIN_MIN anchors the index is searched exhaustively.
+#
+# Storage follows the profile store: an AES-GCM snapshot (INDEX_MAGIC, u16 version, nonce,
+# ciphertext) plus an append-only journal of encrypted upsert/remove frames. Updates only append
+# to the journal; once it passes ANCHOR_INDEX_COMPACT_BYTES it is folded into a new snapshot,
+# retraining the quantizer when the index has grown 4x since it was trained. The snapshot records
+# the model fingerprint, so after a model rollout the index reads as empty until --rebuild.
+INDEX_MAGIC = b'KSAI'
+INDEX_VERSION = 1
+NONCE_SIZE = 12
+FRAME_LENGTH = struct.Struct('<I')
+OP_UPSERT, OP_REMOVE = 1, 2
+KMEANS_ITERATIONS = 15
+KMEANS_SAMPLES_PER_LIST = 32
+
+
+def index_key():
+    """The index's AES-GCM key, derived from a secret kept in the OS keyring."""
+    secret = keyring.get_password(KEYRING_SERVICE_NAME, 'anchor_index_key')
+    if not secret:
+        secret = base64.urlsafe_b64encode(os.urandom(32)).decode('utf-8')
+        keyring.set_password(KEYRING_SERVICE_NAME, 'anchor_index_key', secret)
+    kdf = PBKDF2HMAC(hashes.SHA256(), 32, SECRET_DERIVATION_SALT, KDF_ITERATIONS, default_backend())
+    return kdf.derive(secret.encode())
+
+
+def _nearest(points, centroids, chunk=8192):
+    """Index of the nearest centroid for every point (squared euclidean distance)."""
+    centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+    return np.concatenate([np.argmin(centroid_norms - 2 * points[i:i + chunk] @ centroids.T, axis=1)
+                           for i in range(0, len(points), chunk)]) if len(points) else np.zeros(0, dtype=np.int64)
+
+
+def kmeans(points, n_lists, iterations=KMEANS_ITERATIONS, seed=0):
+    """Lloyd's k-means on a sample of the points; empty lists are re-seeded from the sample."""
+    rng = np.random.default_rng(seed)
+    sample = points[rng.choice(len(points), min(len(points), n_lists * KMEANS_SAMPLES_PER_LIST), replace=False)]
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _nearest(sample, centroids)
+        counts = np.bincount(assignment, minlength=n_lists)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        centroids[~filled] = sample[rng.choice(len(sample), int((~filled).sum()))]
+    return centroids
+
+
+class AnchorIndex:
+    def __init__(self, path=ANCHOR_INDEX_PATH, key=None, fingerprint=None, probes=ANCHOR_INDEX_PROBES):
+        self.path, self.journal_path, self.lock_path = path, f"{path}.journal", f"{path}.lock"
+        self.aead = AESGCM(key or index_key())
+        self.fingerprint = fingerprint # Model fingerprint of the anchors; None accepts any snapshot
+        self.probes = probes
+        self._lock = threading.RLock()
+        self._snapshot_stamp, self._journal_offset = None, 0
+        self._clear()
+
+    def _clear(self):
+        self._names, self._rows = [], {} # row -> username (None once removed), username -> row
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._list_of = np.zeros(0, dtype=np.int32)
+        self.centroids, self._members, self.trained_size = None, [], 0
+        self.stale = False # Snapshot written for another model
+
+    # Files
+    def _file_lock(self, exclusive):
+        lock_file = open(self.lock_path, 'a')
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        return lock_file # Closing it releases the lock
+
+    @staticmethod
+    def _stamp(path):
+        try:
+            st = os.stat(path)
+            return st.st_ino, st.st_mtime_ns, st.st_size
+        except FileNotFoundError:
+            return None
+
+    def _encode_snapshot(self):
+        live = np.array([row for row, name in enumerate(self._names) if name is not None], dtype=np.int64)
+        header = {"fingerprint": self.fingerprint, "names": [self._names[row] for row in live],
+                  "dim": int(self._vectors.shape[1]) if len(live) else 0, "lists": 0 if self.centroids is None else len(self.centroids),
+                  "trained_size": self.trained_size}
+        encoded = json.dumps(header).encode('utf-8')
+        body = [FRAME_LENGTH.pack(len(encoded)), encoded]
+        if len(live):
+            body.append(np.ascontiguousarray(self._vectors[live], dtype='<f4').tobytes())
+        if self.centroids is not None:
+            body += [np.ascontiguousarray(self.centroids, dtype='<f4').tobytes(), self._list_of[live].astype('<i4').tobytes()]
+        nonce = os.urandom(NONCE_SIZE)
+        prefix = INDEX_MAGIC + struct.pack('<H', INDEX_VERSION)
+        return prefix + nonce + self.aead.encrypt(nonce, b''.join(body), prefix)
+
+    def _load_snapshot(self):
+        self._clear()
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        prefix = data[:len(INDEX_MAGIC) + 2]
+        if prefix[:len(INDEX_MAGIC)] != INDEX_MAGIC or struct.unpack('<H', prefix[len(INDEX_MAGIC):])[0] != INDEX_VERSION:
+            raise ValueError(f"{self.path} is not a version {INDEX_VERSION} anchor index")
+        plaintext = self.aead.decrypt(data[len(prefix):len(prefix) + NONCE_SIZE], data[len(prefix) + NONCE_SIZE:], prefix)
+        (header_length,) = FRAME_LENGTH.unpack_from(plaintext)
+        header = json.loads(plaintext[FRAME_LENGTH.size:FRAME_LENGTH.size + header_length])
+        if self.fingerprint is not None and header['fingerprint'] not in (None, self.fingerprint):
+            self.stale = True # Anchors embedded by another model, and so is the journal, until --rebuild
+            return
+        offset, count, dim, lists = FRAME_LENGTH.size + header_length, len(header['names']), header['dim'], header['lists']
+        vectors = np.frombuffer(plaintext, dtype='<f4', count=count * dim, offset=offset).reshape(count, dim)
+        offset += vectors.nbytes
+        if lists:
+            self.centroids = np.frombuffer(plaintext, dtype='<f4', count=lists * dim, offset=offset).reshape(lists, dim).copy()
+            offset += self.centroids.nbytes
+            self._list_of = np.frombuffer(plaintext, dtype='<i4', count=count, offset=offset).copy()
+            self._members = [set() for _ in range(lists)]
+            for row, list_id in enumerate(self._list_of):
+                self._members[list_id].add(row)
+        else:
+            self._list_of = np.zeros(count, dtype=np.int32)
+        self.trained_size = header['trained_size']
+        self._vectors = vectors.copy()
+        self._names = list(header['names'])
+        self._rows = {name: row for row, name in enumerate(self._names)}
+
+    def _encode_frame(self, op, username, vector=None):
+        name = username.encode('utf-8')
+        plaintext = struct.pack('<BH', op, len(name)) + name + (b'' if vector is None else np.asarray(vector, dtype='<f4').tobytes())
+        nonce = os.urandom(NONCE_SIZE)
+        ciphertext = self.aead.encrypt(nonce, plaintext, INDEX_MAGIC + b'journal')
+        return FRAME_LENGTH.pack(len(ciphertext)) + nonce + ciphertext
+
+    def _replay(self, data):
+        offset = 0
+        while offset + FRAME_LENGTH.size + NONCE_SIZE <= len(data):
+            (length,) = FRAME_LENGTH.unpack_from(data, offset)
+            start = offset + FRAME_LENGTH.size + NONCE_SIZE
+            if start + length > len(data):
+                break # Frame still being written by another process
+            plaintext = self.aead.decrypt(data[start - NONCE_SIZE:start], data[start:start + length], INDEX_MAGIC + b'journal')
+            op, name_length = struct.unpack_from('<BH', plaintext)
+            username = plaintext[3:3 + name_length].decode('utf-8')
+            if op == OP_UPSERT:
+                self._apply_upsert(username, np.frombuffer(plaintext, dtype='<f4', offset=3 + name_length))
+            else:
+                self._apply_remove(username)
+            offset = start + length
+        return offset
+
+    def _sync(self, full=False):
+        # Caller holds self._lock and the file lock
+        stamp = self._stamp(self.path)
+        journal_size = os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+        if full or stamp != self._snapshot_stamp or journal_size < self._journal_offset:
+            self._load_snapshot()
+            self._snapshot_stamp, self._journal_offset = stamp, 0
+        if self.stale:
+            self._journal_offset = journal_size
+        elif journal_size > self._journal_offset:
+            with open(self.journal_path, 'rb') as f:
+                f.seek(self._journal_offset)
+                self._journal_offset += self._replay(f.read())
+
+    def refresh(self):
+        """Picks up snapshots and journal frames written since the last call, e.g. by another process."""
+        with self._lock, self._file_lock(exclusive=False):
+            self._sync()
+
+    def _write_snapshot(self, retrain):
+        # Caller holds self._lock and the exclusive file lock, with everything journaled applied
+        if retrain:
+            self._train()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(self._encode_snapshot())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        open(self.journal_path, 'wb').close()
+        self._snapshot_stamp, self._journal_offset = self._stamp(self.path), 0
+
+    def _should_retrain(self):
+        return len(self) >= ANCHOR_INDEX_TRAIN_MIN and (self.centroids is None or len(self) >= 4 * self.trained_size)
+
+    # In-memory updates
+    def _apply_upsert(self, username, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        if not self._rows and not self._vectors.shape[1]:
+            self._vectors = np.zeros((0, len(vector)), dtype=np.float32)
+        if len(vector) != self._vectors.shape[1]:
+            raise ValueError(f"Anchor has {len(vector)} dimensions, the index {self._vectors.shape[1]}")
+        row = self._rows.get(username)
+        if row is None:
+            row = len(self._names)
+            if row == len(self._vectors): # Amortized growth
+                grown = max(16, 2 * len(self._vectors))
+                self._vectors = np.resize(self._vectors, (grown, self._vectors.shape[1]))
+                self._list_of = np.resize(self._list_of, grown)
+            self._names.append(username)
+            self._rows[username] = row
+        elif self.centroids is not None:
+            self._members[self._list_of[row]].discard(row)
+        self._vectors[row] = vector
+        if self.centroids is not None:
+            self._list_of[row] = _nearest(vector[None, :], self.centroids)[0]
+            self._members[self._list_of[row]].add(row)
+
+    def _apply_remove(self, username):
+        row = self._rows.pop(username, None)
+        if row is not None:
+            self._names[row] = None
+            if self.centroids is not None:
+                self._members[self._list_of[row]].discard(row)
+
+    def __len__(self):
+        return len(self._rows)
+
+    # Public API
+    def upsert(self, username, vector):
+        """Adds or moves one user's anchor (on enrollment and re-anchor)."""
+        self._append(self._encode_frame(OP_UPSERT, username, vector))
+
+    def remove(self, username):
+        self._append(self._encode_frame(OP_REMOVE, username))
+
+    def _append(self, frame):
+        with self._lock, self._file_lock(exclusive=True):
+            with open(self.journal_path, 'ab') as f:
+                f.write(frame)
+            self._sync()
+            if self._journal_offset >= ANCHOR_INDEX_COMPACT_BYTES and not self.stale:
+                self._write_snapshot(self._should_retrain())
+
+    def compact(self, retrain=None):
+        """Folds the journal into a new snapshot; retrains the quantizer when the index has outgrown it."""
+        with self._lock, self._file_lock(exclusive=True):
+            self._sync(full=True)
+            self._write_snapshot(self._should_retrain() if retrain is None else retrain)
+
+    def rebuild(self, anchors):
+        """Replaces the whole index with (username, anchor) pairs, e.g. after a model rollout."""
+        with self._lock, self._file_lock(exclusive=True):
+            self._clear()
+            for username, anchor in anchors:
+                self._apply_upsert(username, anchor)
+            self._write_snapshot(len(self) >= ANCHOR_INDEX_TRAIN_MIN)
+
+    def _train(self):
+        rows = np.fromiter(self._rows.values(), dtype=np.int64, count=len(self._rows))
+        vectors = self._vectors[rows]
+        n_lists = max(1, min(len(rows), int(4 * np.sqrt(len(rows)))))
+        self.centroids = kmeans(vectors, n_lists).astype(np.float32)
+        self._list_of[rows] = _nearest(vectors, self.centroids)
+        self._members = [set() for _ in range(n_lists)]
+        for row in rows:
+            self._members[self._list_of[row]].add(int(row))
+        self.trained_size = len(rows)
+
+    def get(self, username):
+        self.refresh()
+        row = self._rows.get(username)
+        return None if row is None else self._vectors[row].copy()
+
+    def search(self, vector, k=10, probes=None):
+        """The k nearest indexed users as [(username, euclidean distance)], nearest first."""
+        self.refresh()
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            if not self._rows:
+                return []
+            if self.centroids is None:
+                rows = np.fromiter(self._rows.values(), dtype=np.int64, count=len(self._rows))
+            else:
+                probes = min(probes or self.probes, len(self.centroids))
+                nearest_lists = np.argpartition(np.linalg.norm(self.centroids - vector, axis=1), probes - 1)[:probes]
+                rows = np.fromiter((row for list_id in nearest_lists for row in self._members[list_id]), dtype=np.int64)
+            distances = np.linalg.norm(self._vectors[rows] - vector, axis=1)
+            top = np.argsort(distances)[:k] if len(rows) <= k else np.argpartition(distances, k - 1)[:k]
+            top = top[np.argsort(distances[top])]
+            return [(self._names[rows[i]], float(distances[i])) for i in top]
+
+    def stats(self):
+        self.refresh()
+        sizes = [len(m) for m in self._members]
+        return {"anchors": len(self), "lists": len(sizes), "trained_size": self.trained_size,
+                "largest_list": max(sizes, default=0), "probes": self.probes,
+                "journal_bytes": os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0}
+
+
+def _read_anchor(args):
+    username, template_dir = args
+    try:
+        return username, ProfileStore(username, profile_key(username, create=False), template_dir).load()['esn_anchor']
+    except Exception as e:
+        return username, e
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and query the encrypted index of enrolled anchors.")
+    parser.add_argument('--model', default=MODEL_PATH, help="The model the anchors were embedded with")
+    parser.add_argument('--template-dir', default=TEMPLATE_DIR)
+    parser.add_argument('--index', default=ANCHOR_INDEX_PATH)
+    parser.add_argument('--rebuild', action='store_true', help="Re-index every profile (e.g. after a model rollout)")
+    parser.add_argument('--similar', default=None, help="List the indexed users nearest to this user's anchor")
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    fingerprint = model_fingerprint(read_model(args.model))
+    index = AnchorIndex(args.index, fingerprint=fingerprint)
+
+    if args.rebuild:
+        start = time.perf_counter()
+        usernames = sorted(name[:-len('.dat')] for name in os.listdir(args.template_dir) if name.endswith('.dat'))
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            anchors = list(executor.map(_read_anchor, [(u, args.template_dir) for u in usernames], chunksize=16))
+        failed = [(u, a) for u, a in anchors if isinstance(a, Exception)]
+        index.rebuild((u, a) for u, a in anchors if not isinstance(a, Exception))
+        print(f"Indexed {len(anchors) - len(failed)} anchors in {time.perf_counter() - start:.2f} s")
+        for username, error in failed:
+            print(f"  {username}: {error}")
+
+    if args.similar:
+        anchor = index.get(args.similar)
+        if anchor is None:
+            print(f"{args.similar} is not indexed")
+            sys.exit(1)
+        start = time.perf_counter()
+        matches = [(u, d) for u, d in index.search(anchor, args.k + 1) if u != args.similar][:args.k]
+        elapsed = (time.perf_counter() - start) * 1000
+        for username, distance in matches:
+            print(f"  {username:<24} {distance:.4f}")
+        print(f"Searched in {elapsed:.2f} ms")
+    print(json.dumps(index.stats()))
+    sys.exit(0)
@@ -1,25 +1,23 @@
 import sys
 import os
-import pickle
 import numpy as np
-import pandas as pd
 import random
 import time
-import io
+import math
 import zipfile
 import hashlib
 import uuid
 import json
-from datetime import datetime, timedelta, UTC
+from datetime import datetime, UTC
 import re
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
-from cryptography.fernet import Fernet, InvalidToken
+from cryptography.fernet import InvalidToken
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.backends import default_backend
-import base64
-from sklearn.metrics.pairwise import cosine_similarity, euclidean_distances
-import keyring
 
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QPushButton, QLabel, QLineEdit,
@@ -27,14 +25,29 @@ from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QMessageBox, QDialog, QTextEdit,
                              QDialogButtonBox, QFrame, QGraphicsDropShadowEffect,
                              QCheckBox)
-from PyQt6.QtGui import QFont, QColor, QMouseEvent, QPainter, QPen, QBrush
-from PyQt6.QtCore import Qt, QEvent, pyqtSignal, QRect
-
-# Add Matplotlib imports
-import matplotlib
-matplotlib.use('QtAgg')
-from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg
-from matplotlib.figure import Figure
+from PyQt6.QtGui import QFont, QColor, QMouseEvent, QPainter, QPen, QBrush, QPixmap, QPolygonF
+from PyQt6.QtCore import Qt, QEvent, pyqtSignal, QRect, QRectF, QPointF, QTimer, QObject, QRunnable, QThreadPool
+
+from config import (MODEL_PATH, TEMPLATE_DIR, ENROLL_QUOTES_PATH, VERIFY_QUOTES_PATH, DICTIONARY_PATH,
+                    STARTUP_CACHE_DIR, DICTIONARY_INDEX_PATH, LOG_FILE_PATH, ADMIN_CONFIG_PATH, POLICY_PATH,
+                    RATE_LIMIT_DB_PATH, WORKER_THREADS, PIPELINE_THREADS, SCORING_CASCADE, VERIFY_DAEMON_ADDRESS,
+                    NUM_ENROLL_SAMPLES, MIN_CHAR_ACCURACY, MIN_WORD_ACCURACY, MAX_WINDOW_SIZE,
+                    DRIFT_SESSIONS_FOR_REANCHOR, CONSECUTIVE_ANOMALY_LIMIT, RETAIN_ENROLLMENT_TIMINGS,
+                    PROFILE_PREFETCH_TTL_SECONDS, ANCHOR_INDEX_ENABLED, ANCHOR_INDEX_CANDIDATES,
+                    GIBBERISH_VALIDITY_THRESHOLD, GIBBERISH_NGRAM_FALLBACK, KDF_ITERATIONS, LOG_RETENTION_DAYS)
+from startup_data import StartupData
+from rolling_window import RollingWindow
+from profile_store import ProfileStore, ProfileIntegrityError, profile_key
+from rate_limiter import RateLimiter
+from audit_log import SecureLogger
+from pipeline import Pipeline
+from verify_client import VerifyClient, ProtocolError, DaemonError
+from anchor_index import AnchorIndex
+from esn import extract_esn_features, model_fingerprint, compile_model, embed_sample
+from reservoir import read_model
+from auth_core import (process_events_to_features, enroll_vectors, score_probe, decide, load_policy, DEFAULT_POLICY,
+                       advance_drift_counter, template_health, update_template, audit_record, typing_pattern,
+                       score_against_templates, is_match)
 
 
 # STYLESHEET
@@ -159,119 +172,62 @@ QMessageBox QPushButton:hover {
 }
 """
 
-# CONSTANTS AND PATHS 
-MODEL_PATH = './model/esn_svm.pkl'
-TEMPLATE_DIR = './data/app_data/'
-ENROLL_QUOTES_PATH = './data/raw/enroll_quotes.csv'
-VERIFY_QUOTES_PATH = './data/raw/verify_quotes.csv'
-DICTIONARY_PATH = './data/raw/dictionary.txt'
-LOG_FILE_PATH = os.path.join(TEMPLATE_DIR, 'secure_audit.log')
-ADMIN_CONFIG_PATH = os.path.join(TEMPLATE_DIR, 'admin.cfg')
-
-# Application Info
-APP_NAME = "KeystrokeDynamics"
-APP_VERSION = "9.0.4" # Version incremented for gibberish check feature
-
-# Keystroke Config
-NUM_ENROLL_SAMPLES = 3
-
-# Accuracy Config
-MIN_CHAR_ACCURACY = 93.0
-MIN_WORD_ACCURACY = 80.0
-
-# Rate Limiting Config
-MAX_FAILED_ATTEMPTS = 5
-LOCKOUT_PERIOD_SECONDS = 900 # 15 minutes
-
-# Security Thresholds
-MIN_SECURE_SVM_THRESHOLD = 0.70
-MIN_SECURE_COSINE_THRESHOLD = 0.90 # Fallback only
-
-# Multi-layer defense thresholds (Optimized from simulation)
-CONFIDENCE_FLOOR = 0.67
-SUSPICIOUS_SCORE_THRESHOLD = 0.75
-
-# Adaptive Threshold Config
-MAX_WINDOW_SIZE = 10
-ANCHOR_WEIGHT = 0.7
-WINDOW_WEIGHT = 0.3
-DRIFT_SESSIONS_FOR_REANCHOR = 5
-MIN_SAMPLES_FOR_DYNAMIC_THRESH = 4
-TIGHT_CONSISTENCY_STD_DEV = 0.18 # Fallback for old profiles
-LOOSE_CONSISTENCY_STD_DEV = 0.30 # Fallback for old profiles
-
-# Proactive Health & Security Config
-PROACTIVE_HEALTH_THRESHOLD = 40
-PROACTIVE_MIN_SAMPLES = 5
-CONSISTENCY_WEIGHT = 0.5
-PERFORMANCE_WEIGHT = 0.5
-PROACTIVE_SNOOZE_SESSIONS = 15
-CONSECUTIVE_ANOMALY_LIMIT = 3
-MAX_QUARANTINE_SIZE = 20
-
-# Gibberish Check Config
-GIBBERISH_VALIDITY_THRESHOLD = 60.0 # <-- NEW
-
-# Security & Logging Config
-KEYRING_SERVICE_NAME = 'KeystrokeDynamicsApp'
-SECRET_DERIVATION_SALT = b'\x8a\x0b\x2d\x1f\x9c\x0e\x4a\xd3\xbf\x7e\x6d\x5c\x89\xab\xcd\xef'
-KDF_ITERATIONS = 100000
-LOG_RETENTION_DAYS = 90
+# CONSTANTS AND PATHS (shared with the headless tools, see config.py)
 HIGHLIGHT_STYLE = "background-color: #333333; color: #D0D0D0; border-radius: 3px; padding: 0px 2px;"
 
 
 # GLOBAL DATA LOADING
 MODEL = None
-ENROLL_QUOTES = []
-VERIFY_QUOTES = []
-DICTIONARY_WORDS = set() # <-- NEW
+MODEL_FINGERPRINT = None # esn.model_fingerprint(MODEL), recorded in every profile header
+_MODEL_LOCK = threading.Lock()
+STARTUP_DATA = None # Lazily loaded quotes and dictionary index, see startup_data.py
+POLICY = DEFAULT_POLICY # Decision parameters, optionally overridden by POLICY_PATH
 
 def load_model():
-    global MODEL
-    try:
-        with open(MODEL_PATH, 'rb') as f:
-            MODEL = pickle.load(f)
-        return True
-    except FileNotFoundError:
+    """Unpickles the ESN-SVM model on first use; this is also what first imports sklearn."""
+    global MODEL, MODEL_FINGERPRINT
+    with _MODEL_LOCK:
+        if MODEL is None:
+            model = read_model(MODEL_PATH)
+            MODEL_FINGERPRINT = model_fingerprint(model)
+            MODEL = compile_model(model) # Folds the scalers in, so logins make no sklearn transform calls
+    return MODEL
+
+def check_model():
+    if VERIFY_DAEMON_ADDRESS:
+        return True # The daemon scores logins; the app only loads the model to enroll
+    if not os.path.exists(MODEL_PATH):
         QMessageBox.critical(None, "Startup Error", f"FATAL ERROR: Model file not found at {MODEL_PATH}")
         return False
+    return True
 
-def load_quotes_from_csv(path, quote_list, is_verify_list=False):
+def warm_model():
+    """Loads the model in the background once the first window is up."""
     try:
-        df = pd.read_csv(path, header=None, names=['Quote'], on_bad_lines='skip')
-        if 'Quote' not in df.columns:
-            raise ValueError("CSV must contain a 'Quote' column.")
-        quotes_data = df['Quote'].dropna().tolist()
-        if is_verify_list:
-            default_quote_text = "What we plant in the soil of contemplation, we shall reap in the harvest of action."
-            if not any(quote_text.startswith(default_quote_text) for quote_text in quotes_data):
-                quotes_data.insert(0, default_quote_text)
-        quote_list.extend(quotes_data)
-        return True
-    except FileNotFoundError:
-        QMessageBox.critical(None, "Startup Error", f"Quote file not found: {path}")
-        return False
+        load_model()
     except Exception as e:
-        QMessageBox.critical(None, "Startup Error", f"Error reading quote file {path}: {e}")
+        print(f"Error preloading model: {e}")
+
+def load_startup_data():
+    """Registers the quote and dictionary sources; they are parsed (or read from cache) on first use."""
+    global STARTUP_DATA
+    data = StartupData(ENROLL_QUOTES_PATH, VERIFY_QUOTES_PATH, DICTIONARY_PATH, DICTIONARY_INDEX_PATH, cache_dir=STARTUP_CACHE_DIR)
+    missing = data.missing_sources()
+    if missing:
+        QMessageBox.critical(None, "Startup Error", f"Data file not found: {missing[0]}")
         return False
+    STARTUP_DATA = data
+    return True
 
-def load_dictionary(path, word_set):
-    """Loads words from the dictionary file into a set."""
+def load_decision_policy():
+    """Applies the deployment's policy.json (written by policy_sim.py), if there is one."""
+    global POLICY
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            # Use a generator expression for memory efficiency and strip newlines
-            words = (line.strip().lower() for line in f)
-            word_set.update(words)
-        if not word_set:
-            QMessageBox.critical(None, "Startup Error", f"Dictionary file is empty or could not be read: {path}")
-            return False
-        return True
-    except FileNotFoundError:
-        QMessageBox.critical(None, "Startup Error", f"Dictionary file not found: {path}")
-        return False
-    except Exception as e:
-        QMessageBox.critical(None, "Startup Error", f"Error reading dictionary file {path}: {e}")
+        POLICY = load_policy(POLICY_PATH)
+    except (ValueError, TypeError) as e:
+        QMessageBox.critical(None, "Startup Error", f"Invalid decision policy {POLICY_PATH}: {e}")
         return False
+    return True
 
 
 # DIALOGS AND CUSTOM WIDGETS
@@ -413,7 +369,7 @@ class ProactiveReAnchorDialog(QDialog):
         layout.addWidget(buttons)
 
 class LogViewerDialog(QDialog):
-    def __init__(self, logs, parent=None):
+    def __init__(self, logs, parent=None, writer_stats=None):
         super().__init__(parent)
         self.setWindowTitle("Secure Audit Log Viewer")
         self.setGeometry(150, 150, 800, 600)
@@ -422,6 +378,10 @@ class LogViewerDialog(QDialog):
             QTextEdit { background-color: #181818; color: #D0D0D0; font-family: 'Consolas', 'Courier New', monospace; border: 1px solid #30363d; }
             """)
         layout = QVBoxLayout(self)
+        if writer_stats:
+            layout.addWidget(QLabel(f"Writer: {writer_stats['written']} records in {writer_stats['batches']} batches, "
+                                    f"{writer_stats['failed']} failed · queue peak {writer_stats['max_queue_depth']}/{writer_stats['queue_size']}, "
+                                    f"{writer_stats['blocked_puts']} blocked ({writer_stats['blocked_seconds'] * 1000:.1f} ms)"))
         self.log_display = QTextEdit()
         self.log_display.setReadOnly(True)
         layout.addWidget(self.log_display)
@@ -473,87 +433,140 @@ class HealthGaugeWidget(QWidget):
         painter.setPen(pen)
         painter.drawText(rect, Qt.AlignmentFlag.AlignCenter, f"{int(self._value)}%")
 
-class MplChartWidget(QWidget):
-    """A widget to display a Matplotlib chart."""
+class ScoreSparklineWidget(QWidget):
+    """A widget to display recent scores as a sparkline with value labels."""
+    Y_MAX = 1.2
+    MARGINS = (30, 18, 10, 10) # left, top, right, bottom
+
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.canvas = FigureCanvasQTAgg(Figure(figsize=(5, 3), dpi=100))
-        self.ax = self.canvas.figure.subplots()
-        layout = QVBoxLayout(self)
-        layout.setContentsMargins(0, 0, 0, 0)
-        layout.addWidget(self.canvas)
-        self.setup_chart()
-
-    def setup_chart(self):
-        self.canvas.figure.patch.set_facecolor('#181818')
-        self.ax.set_facecolor('#181818')
-        self.ax.spines['top'].set_visible(False)
-        self.ax.spines['right'].set_visible(False)
-        self.ax.spines['left'].set_color('#4A4A4A')
-        self.ax.spines['bottom'].set_color('#4A4A4A')
-        self.ax.tick_params(axis='x', colors='#A0A0A0', labelsize=8)
-        self.ax.tick_params(axis='y', colors='#A0A0A0', labelsize=8)
-        self.ax.set_ylim(0, 1.2)
-
-    def update_chart(self, scores):
-        self.ax.clear()
-        self.setup_chart()
-        if not scores:
-            self.ax.text(0.5, 0.5, 'No score data available.', ha='center', va='center', color='#A0A0A0', fontsize=10)
+        self._scores = []
+        self._background = None # Axes and gridlines, rendered once per size
+        self._points = None # Point positions, recomputed only when the scores or the size change
+
+    def set_scores(self, scores):
+        scores = [float(s) for s in scores]
+        if scores == self._scores:
+            return
+        self._scores, self._points = scores, None
+        self.update()
+
+    def resizeEvent(self, event):
+        self._background, self._points = None, None
+        super().resizeEvent(event)
+
+    def _plot_rect(self):
+        left, top, right, bottom = self.MARGINS
+        return QRectF(left, top, self.width() - left - right, self.height() - top - bottom)
+
+    def _render_background(self):
+        pixmap = QPixmap(self.size() * self.devicePixelRatioF())
+        pixmap.setDevicePixelRatio(self.devicePixelRatioF())
+        pixmap.fill(QColor("#181818"))
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        rect = self._plot_rect()
+        painter.setFont(QFont("Segoe UI", 7))
+        for value in (0.0, 0.5, 1.0):
+            y = rect.bottom() - value / self.Y_MAX * rect.height()
+            painter.setPen(QPen(QColor("#2A2A2A"), 1))
+            painter.drawLine(QPointF(rect.left(), y), QPointF(rect.right(), y))
+            painter.setPen(QColor("#A0A0A0"))
+            painter.drawText(QRectF(0, y - 7, rect.left() - 4, 14), Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter, f"{value:.1f}")
+        painter.setPen(QPen(QColor("#4A4A4A"), 1))
+        painter.drawLine(rect.bottomLeft(), rect.bottomRight())
+        painter.drawLine(rect.bottomLeft(), rect.topLeft())
+        painter.end()
+        return pixmap
+
+    def _layout_points(self):
+        rect = self._plot_rect().adjusted(8, 0, -8, 0)
+        step = rect.width() / max(1, len(self._scores) - 1)
+        x0 = rect.left() if len(self._scores) > 1 else rect.center().x()
+        return [QPointF(x0 + i * step, rect.bottom() - min(max(score, 0.0), self.Y_MAX) / self.Y_MAX * rect.height())
+                for i, score in enumerate(self._scores)]
+
+    def paintEvent(self, event):
+        if self._background is None:
+            self._background = self._render_background()
+        painter = QPainter(self)
+        painter.drawPixmap(0, 0, self._background)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        if not self._scores:
+            painter.setPen(QColor("#A0A0A0"))
+            painter.setFont(QFont("Segoe UI", 10))
+            painter.drawText(self._plot_rect(), Qt.AlignmentFlag.AlignCenter, "No score data available.")
+            return
+        if self._points is None:
+            self._points = self._layout_points()
+        painter.setPen(QPen(QColor("#5865F2"), 2))
+        painter.drawPolyline(QPolygonF(self._points))
+        painter.setBrush(QBrush(QColor("#FFFFFF")))
+        painter.setFont(QFont("Segoe UI", 7))
+        for point, score in zip(self._points, self._scores):
+            painter.setPen(QPen(QColor("#5865F2"), 1.5))
+            painter.drawEllipse(point, 3, 3)
+            painter.setPen(QColor("#D0D0D0"))
+            painter.drawText(QRectF(point.x() - 20, point.y() - 18, 40, 12), Qt.AlignmentFlag.AlignCenter, f"{score:.2f}")
+
+
+# BACKGROUND TASKS
+class TaskSignals(QObject):
+    finished = pyqtSignal(object, object) # task, result
+    failed = pyqtSignal(object, object) # task, exception
+
+class Task(QRunnable):
+    """Runs fn(*args) on a pool thread; the outcome is delivered to the GUI thread through `signals`."""
+    def __init__(self, fn, args, on_done):
+        super().__init__()
+        self.fn, self.args, self.on_done = fn, args, on_done
+        self.signals = TaskSignals()
+
+    def run(self):
+        try:
+            result = self.fn(*self.args)
+        except Exception as e:
+            self.signals.failed.emit(self, e)
         else:
-            self.ax.plot(scores, marker='o', color='#5865F2', markersize=5, markerfacecolor='#FFFFFF')
-            for i, score in enumerate(scores):
-                self.ax.text(i, score + 0.05, f'{score:.2f}', ha='center', va='bottom', color='#D0D0D0', fontsize=8)
-        self.canvas.figure.tight_layout(pad=0.5)
-        self.canvas.draw()
-
-
-# SECURE LOGGER IMPLEMENTATION
-class SecureLogger:
-    def __init__(self, log_path, retention_days):
-        self.log_path, self.retention_period = log_path, timedelta(days=retention_days)
-        self.fernet = Fernet(self._get_log_encryption_key())
-        os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
-        if not os.path.exists(self.log_path): open(self.log_path, 'w').close()
-
-    def _get_log_encryption_key(self):
-        secret = keyring.get_password(KEYRING_SERVICE_NAME, 'log_encryption_key')
-        if not secret:
-            secret = base64.urlsafe_b64encode(os.urandom(32)).decode('utf-8')
-            keyring.set_password(KEYRING_SERVICE_NAME, 'log_encryption_key', secret)
-        kdf = PBKDF2HMAC(hashes.SHA256(), 32, SECRET_DERIVATION_SALT, KDF_ITERATIONS, default_backend())
-        return base64.urlsafe_b64encode(kdf.derive(secret.encode()))
-
-    def log_event(self, event_data):
-        log_entry = event_data
+            self.signals.finished.emit(self, result)
+
+
+class ProfilePrefetch:
+    """A profile decrypted while the user types; single use and tied to one login session."""
+    def __init__(self, username, session_id):
+        self.username, self.session_id = username, session_id
+        self.expires_at = time.monotonic() + PROFILE_PREFETCH_TTL_SECONDS
+        self._done = threading.Event()
+        self._lock = threading.Lock() # The load finishes on a worker thread, discard() runs on the GUI thread
+        self._loaded = None
+        self._discarded = False
+
+    def run(self, load):
         try:
-            with open(self.log_path, 'ab') as f:
-                f.write(self.fernet.encrypt(json.dumps(log_entry).encode('utf-8')) + b'\n')
+            loaded = load(self.username)
+            with self._lock:
+                if not self._discarded:
+                    self._loaded = loaded
         except Exception as e:
-            print(f"Error writing to log: {e}")
-
-    def read_logs(self):
-        if not os.path.exists(self.log_path): return []
-        logs = []
-        with open(self.log_path, 'rb') as f:
-            for line in f:
-                if line.strip():
-                    try:
-                        logs.append(json.loads(self.fernet.decrypt(line.strip())))
-                    except (InvalidToken, Exception) as e:
-                        print(f"Error reading log line: {e}")
-        return logs
-
-    def purge_old_logs(self):
-        all_logs, now, valid_logs = self.read_logs(), datetime.now(UTC), []
-        for log in all_logs:
-            log_time_str = log['timestamp'].replace('Z', '+00:00')
-            if now - datetime.fromisoformat(log_time_str) < self.retention_period:
-                valid_logs.append(log)
-        if len(valid_logs) < len(all_logs):
-            with open(self.log_path, 'wb') as f:
-                for log in valid_logs:
-                    f.write(self.fernet.encrypt(json.dumps(log).encode('utf-8')) + b'\n')
+            print(f"Profile prefetch failed: {e}")
+        finally:
+            self._done.set()
+
+    def matches(self, username, session_id):
+        return (self.username == username and self.session_id == session_id and not self._discarded
+                and time.monotonic() < self.expires_at)
+
+    def discard(self):
+        """Drops the decrypted profile, now or as soon as the load finishes, so it doesn't outlive its use."""
+        with self._lock:
+            self._discarded, self._loaded = True, None
+
+    def take(self):
+        """Waits for the load (on a worker thread) and hands over the result, or None if it failed."""
+        self._done.wait()
+        with self._lock:
+            loaded, self._loaded, self._discarded = self._loaded, None, True
+        return loaded if loaded and 'error' not in loaded else None
 
 
 # MAIN APPLICATION
@@ -579,10 +592,21 @@ class KeystrokeApp(QMainWindow):
         self.last_auth_was_success = False
         self.is_re_enrolling = False
         
-        self.failed_attempts = {} # For rate limiting
-
-        self.current_enroll_quote_data = random.choice(ENROLL_QUOTES) if ENROLL_QUOTES else "Please check enroll_quotes.csv"
-        self.current_verify_quote_data = random.choice(VERIFY_QUOTES) if VERIFY_QUOTES else "Please check verify_quotes.csv"
+        self.rate_limiter = RateLimiter(RATE_LIMIT_DB_PATH) # Persistent, shared with other app processes
+
+        # Key derivation, decryption, embedding and profile writes run here; the GUI thread only captures and renders
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(WORKER_THREADS)
+        self.stage_pool = ThreadPoolExecutor(PIPELINE_THREADS, thread_name_prefix="verify-stage") # Stages of one verification
+        self._tasks = set()
+        self._idle_button_texts = {}
+        self._prefetch = None # ProfilePrefetch for the username typed on the login page
+        self.verify_client = None # Connection to verify_daemon.py, when VERIFY_DAEMON_ADDRESS is set
+        self.anchor_index = None # AnchorIndex, opened on first use when ANCHOR_INDEX_ENABLED
+
+        # Quotes are picked when a page is shown, so the enrollment CSV is only read if it's needed
+        self.current_enroll_quote_data = ""
+        self.current_verify_quote_data = ""
 
         self.stacked_widget = QStackedWidget()
         self.setCentralWidget(self.stacked_widget)
@@ -595,11 +619,64 @@ class KeystrokeApp(QMainWindow):
         self.stacked_widget.addWidget(self.enroll_widget)
         self.stacked_widget.addWidget(self.admin_widget)
 
-        self.dashboard_widget = self.create_dashboard_widget()
-        self.stacked_widget.addWidget(self.dashboard_widget)
+        self.dashboard_widget = None # Built on first visit, see go_to_dashboard_page
 
         self.go_to_login_page()
 
+    def closeEvent(self, event):
+        self.shutdown()
+        super().closeEvent(event)
+
+    def shutdown(self):
+        """Finishes in-flight tasks (so profile writes complete) and flushes the audit log."""
+        self.wait_for_idle()
+        self._drop_prefetch()
+        self.thread_pool.waitForDone()
+        self.stage_pool.shutdown()
+        if self.verify_client:
+            self.verify_client.close()
+        self.logger.close()
+
+    def _run_task(self, progress_text, fn, args, on_done):
+        """Runs fn(*args) on the worker pool and on_done(result) back on the GUI thread."""
+        task = Task(fn, args, on_done)
+        task.signals.finished.connect(self._on_task_finished)
+        task.signals.failed.connect(self._on_task_failed)
+        self._tasks.add(task)
+        self._set_progress(progress_text)
+        self.thread_pool.start(task)
+
+    def _on_task_finished(self, task, result):
+        self._tasks.discard(task)
+        task.on_done(result)
+        if not self._tasks:
+            self._set_progress(None)
+
+    def _on_task_failed(self, task, error):
+        self._tasks.discard(task)
+        if not self._tasks:
+            self._set_progress(None)
+        self.show_message_box("Processing Error", f"The operation could not be completed: {error}", QMessageBox.Icon.Critical)
+
+    def _set_progress(self, text):
+        """Shows a task's progress on the Verify/Enroll buttons, which stay disabled until every task is done."""
+        for button in (self.verify_button, self.enroll_submit_button):
+            if text:
+                self._idle_button_texts.setdefault(button, button.text())
+                button.setText(text)
+                button.setEnabled(False)
+            elif button in self._idle_button_texts:
+                button.setText(self._idle_button_texts.pop(button))
+        if not text:
+            self._update_button_state(self.login_typing_entry, self.current_verify_quote_data, self.verify_button)
+            self._update_button_state(self.enroll_typing_entry, self.current_enroll_quote_data, self.enroll_submit_button)
+
+    def wait_for_idle(self):
+        """Blocks until every task and the GUI callbacks it triggers have run (for scripted use)."""
+        while self._tasks:
+            self.thread_pool.waitForDone(10)
+            QApplication.processEvents()
+
     def create_styled_card(self, add_shadow=True):
         card = QFrame()
         card.setObjectName("Card")
@@ -649,6 +726,7 @@ class KeystrokeApp(QMainWindow):
         login_input_layout.addWidget(QLabel("Recognize users through their typing style"))
         login_input_layout.addSpacerItem(QSpacerItem(20, 10, QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Fixed))
         username_layout, self.login_username_entry = self.create_input_group("Username (required)")
+        self.login_username_entry.editingFinished.connect(self._prefetch_profile)
         login_input_layout.addLayout(username_layout)
         login_input_layout.addSpacerItem(QSpacerItem(20, 5))
         login_input_layout.addWidget(QLabel("Verify", objectName="FieldLabel"))
@@ -826,7 +904,7 @@ class KeystrokeApp(QMainWindow):
         
         # Score Trend Section
         layout.addWidget(QLabel("Score Trend", objectName="DashboardTitle"))
-        self.score_chart = MplChartWidget()
+        self.score_chart = ScoreSparklineWidget()
         self.score_chart.setMinimumHeight(130)
         self.score_chart.setMaximumHeight(130)
         layout.addWidget(self.score_chart)
@@ -896,6 +974,19 @@ class KeystrokeApp(QMainWindow):
                 return False
         return False
 
+    def _confirm_reanchor(self, reason, username, metadata):
+        """Password confirmation for a re-anchor requested by update_template."""
+        if reason != "PERSISTENT_ANOMALY":
+            return self.re_anchor_prompt(username, metadata)
+        dialog = MandatoryReAnchorDialog(self)
+        if dialog.exec() == QDialog.DialogCode.Accepted and self.verify_password(metadata['password_hash'], metadata['salt'], dialog.get_password()):
+            return True
+        self.show_message_box("Update Failed", "Incorrect password. Profile not updated.", QMessageBox.Icon.Warning)
+        return False
+
+    def _accept_proactive_prompt(self):
+        return ProactiveReAnchorDialog(self).exec() == QDialog.DialogCode.Accepted
+
     def eventFilter(self, source, event):
         if event.type() == QEvent.Type.KeyPress and event.key() not in [Qt.Key.Key_Tab, Qt.Key.Key_Shift, Qt.Key.Key_Alt, Qt.Key.Key_Control]:
             if event.key() not in self.press_times:
@@ -905,28 +996,15 @@ class KeystrokeApp(QMainWindow):
         return super().eventFilter(source, event)
 
     def _get_user_metadata(self, username):
-        dat_path = os.path.join(TEMPLATE_DIR, f"{username}.dat")
-        if not os.path.exists(dat_path): return None
+        store = self._profile_store(username)
+        if not store.exists(): return None
         try:
-            with open(dat_path, 'rb') as f: encrypted_data = f.read()
-            decrypted_data = Fernet(self.get_encryption_key(username)).decrypt(encrypted_data)
-            with zipfile.ZipFile(io.BytesIO(decrypted_data), 'r') as zf:
-                return json.loads(zf.read('metadata.json'))
+            return store.read_metadata()
         except (InvalidToken, zipfile.BadZipFile, KeyError, Exception):
             return None
 
     def _get_typing_pattern(self, live_timings, stored_template):
-        if stored_template is None or stored_template.size == 0 or not live_timings:
-            return "normal"
-        live_mean_speed = np.mean([item[3] for item in live_timings])
-        stored_mean_speed = stored_template[3]
-        if stored_mean_speed == 0: return "normal"
-        ratio = live_mean_speed / stored_mean_speed
-        if ratio < 0.75: return "much_faster"
-        if ratio < 0.90: return "slightly_faster"
-        if ratio > 1.25: return "much_slower"
-        if ratio > 1.10: return "slightly_slower"
-        return "normal"
+        return typing_pattern(live_timings, stored_template)
 
     def _calculate_levenshtein_distance(self, s1, s2):
         s1, s2 = s1.lower(), s2.lower()
@@ -953,6 +1031,14 @@ class KeystrokeApp(QMainWindow):
         if word_accuracy < MIN_WORD_ACCURACY: return False, "Too many typos, please re-type."
         return True, ""
 
+    def _random_quote(self, kind, fallback):
+        try:
+            quotes = getattr(STARTUP_DATA, kind)
+        except Exception as e:
+            print(f"Error loading {kind}: {e}")
+            quotes = []
+        return random.choice(quotes) if quotes else fallback
+
     def go_to_enroll_page(self):
         self.current_session_id = f"sess-enroll-{uuid.uuid4().hex[:12]}"
         self.reset_keystroke_data()
@@ -962,13 +1048,14 @@ class KeystrokeApp(QMainWindow):
         self.enroll_password_entry.clear()
         self.re_enroll_checkbox.setChecked(False)
         self.is_re_enrolling = False
-        self.current_enroll_quote_data = random.choice(ENROLL_QUOTES) if ENROLL_QUOTES else "Please check enroll_quotes.csv"
+        self.current_enroll_quote_data = self._random_quote('enroll_quotes', "Please check enroll_quotes.csv")
         self.update_enroll_prompt()
         self.stacked_widget.setCurrentIndex(1)
         self._update_button_state(self.enroll_typing_entry, self.current_enroll_quote_data, self.enroll_submit_button)
 
     def go_to_login_page(self):
         self.current_session_id = f"sess-auth-{uuid.uuid4().hex[:12]}"
+        self._drop_prefetch()
         self.current_session_token = uuid.uuid4().hex # Generate new single-use token
         self.status_widget.hide()
         self.login_input_widget.show()
@@ -976,7 +1063,7 @@ class KeystrokeApp(QMainWindow):
         self.login_username_entry.clear()
         self.admin_username_entry.clear()
         self.admin_password_entry.clear()
-        self.current_verify_quote_data = random.choice(VERIFY_QUOTES) if VERIFY_QUOTES else "Please check verify_quotes.csv"
+        self.current_verify_quote_data = self._random_quote('verify_quotes', "Please check verify_quotes.csv")
         quote = self.current_verify_quote_data
         safe_quote = quote.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
         self.login_quote_label.setText(f"<span style='{HIGHLIGHT_STYLE}'>{safe_quote}</span>")
@@ -985,10 +1072,13 @@ class KeystrokeApp(QMainWindow):
         self.dashboard_button.hide()
 
     def go_to_dashboard_page(self, data):
+        if self.dashboard_widget is None:
+            self.dashboard_widget = self.create_dashboard_widget()
+            self.stacked_widget.addWidget(self.dashboard_widget)
         self.health_gauge.setValue(data.get('health', 0))
         self.consistency_label.setText(f"Consistency: {data.get('consistency', 0):.1f}%")
         self.performance_label.setText(f"Performance: {data.get('performance', 0):.1f}%")
-        self.score_chart.update_chart(data.get('scores', []))
+        self.score_chart.set_scores(data.get('scores', []))
         self.logins_value.setText(str(data.get('logins', 0)))
         self.drift_value.setText(f"{data.get('drift', 0)} / {DRIFT_SESSIONS_FOR_REANCHOR}")
         self.anomalies_value.setText(f"{data.get('anomalies', 0)} / {CONSECUTIVE_ANOMALY_LIMIT}")
@@ -1031,6 +1121,8 @@ class KeystrokeApp(QMainWindow):
         self._update_highlight(self.enroll_typing_entry, self.enroll_quote_label, self.current_enroll_quote_data, self.enroll_submit_button)
 
     def _update_button_state(self, typing_entry, quote, button):
+        if self._tasks:
+            button.setEnabled(False); return
         typed_length = len(typing_entry.toPlainText())
         is_login_page_free_type = (button == self.verify_button and hasattr(self, 'free_type_checkbox') and self.free_type_checkbox.isChecked())
         if is_login_page_free_type:
@@ -1054,17 +1146,13 @@ class KeystrokeApp(QMainWindow):
         quote_label.blockSignals(False)
 
     def process_events_to_features(self, events):
-        if len(events) < 2: return None
-        return [[max(0, p_rel - p_pre), max(0, c_pre - p_pre), max(0, c_rel - p_pre), max(0, c_pre - p_rel), max(0, c_rel - p_rel)]
-                for (_, p_pre, p_rel), (_, c_pre, c_rel) in zip(events, events[1:])]
+        return process_events_to_features(events)
 
     def get_encryption_key(self, username):
-        secret = keyring.get_password(KEYRING_SERVICE_NAME, username)
-        if not secret:
-            secret = base64.urlsafe_b64encode(os.urandom(32)).decode('utf-8')
-            keyring.set_password(KEYRING_SERVICE_NAME, username, secret)
-        kdf = PBKDF2HMAC(hashes.SHA256(), 32, SECRET_DERIVATION_SALT, KDF_ITERATIONS, default_backend())
-        return base64.urlsafe_b64encode(kdf.derive(secret.encode()))
+        return profile_key(username)
+
+    def _profile_store(self, username):
+        return ProfileStore(username, self.get_encryption_key(username))
 
     @staticmethod
     def hash_password(password):
@@ -1077,60 +1165,8 @@ class KeystrokeApp(QMainWindow):
         kdf = PBKDF2HMAC(hashes.SHA256(), 32, salt, KDF_ITERATIONS, default_backend())
         return kdf.derive(provided_password.encode()) == stored_hash
 
-    def _calculate_template_health(self, rolling_window, recent_anchor_scores, baseline_variability=None):
-        if len(rolling_window) < MIN_SAMPLES_FOR_DYNAMIC_THRESH:
-            consistency_score = 100.0
-        else:
-            if baseline_variability is not None:
-                personal_tight_bound = baseline_variability * 0.8
-                personal_loose_bound = baseline_variability * 1.5
-            else:
-                personal_tight_bound = TIGHT_CONSISTENCY_STD_DEV
-                personal_loose_bound = LOOSE_CONSISTENCY_STD_DEV
-
-            consistency_metric = np.mean(np.std(rolling_window, axis=0))
-
-            if consistency_metric <= personal_tight_bound:
-                consistency_score = 100.0
-            elif consistency_metric >= personal_loose_bound:
-                consistency_score = 0.0
-            else:
-                dev_range = personal_loose_bound - personal_tight_bound
-                if dev_range > 0:
-                    normalized_dev = (consistency_metric - personal_tight_bound) / dev_range
-                    consistency_score = 100 * (1 - normalized_dev)
-                else:
-                    consistency_score = 100.0
-
-        if not recent_anchor_scores:
-            performance_score = 100.0
-        else:
-            performance_score = np.mean(recent_anchor_scores) * 100
-
-        health_score = (CONSISTENCY_WEIGHT * consistency_score) + (PERFORMANCE_WEIGHT * performance_score)
-        return max(0, min(100, health_score)), max(0, min(100, consistency_score)), performance_score
-
     def extract_esn_features(self, sequence, mask):
-        W_in, W_res, washout, leak_rate = MODEL['W_input'], MODEL['W_reservoir'], MODEL['washout_period'], MODEL['leak_rate']
-        sequence_length = len(sequence)
-        reservoir_size = W_res.shape[0]
-
-        states = np.zeros((sequence_length, reservoir_size))
-
-        for t in range(1, sequence_length):
-            if mask[t]:
-                u_t = np.array(sequence[t])
-                input_contribution = W_in @ u_t
-                reservoir_contribution = W_res @ states[t-1]
-                new_activation = np.tanh(input_contribution + reservoir_contribution)
-                states[t] = (1 - leak_rate) * states[t-1] + leak_rate * new_activation
-            else:
-                states[t] = states[t-1]
-
-        post_washout_mask = mask[washout:]
-        valid_states = states[washout:][post_washout_mask]
-
-        return np.mean(valid_states, axis=0) if len(valid_states) > 0 else states[-1]
+        return extract_esn_features(load_model(), sequence, mask)
 
     def enroll_submit(self):
         if self.enrollment_step == 0:
@@ -1150,10 +1186,7 @@ class KeystrokeApp(QMainWindow):
                         self.enrollment_samples.clear()
                         self.enrollment_step = 0
                         try:
-                            dat_path_to_delete = os.path.join(TEMPLATE_DIR, f"{self.enroll_username}.dat")
-                            hash_path_to_delete = os.path.join(TEMPLATE_DIR, f"{self.enroll_username}.hash")
-                            if os.path.exists(dat_path_to_delete): os.remove(dat_path_to_delete)
-                            if os.path.exists(hash_path_to_delete): os.remove(hash_path_to_delete)
+                            self._profile_store(self.enroll_username).delete()
                         except OSError as e:
                             self.show_message_box("File Error", f"Could not delete the old profile: {e}", QMessageBox.Icon.Critical)
                             return
@@ -1184,43 +1217,27 @@ class KeystrokeApp(QMainWindow):
 
         if self.enrollment_step < NUM_ENROLL_SAMPLES:
             self.show_message_box("Sample Captured", f"Sample {self.enrollment_step}/{NUM_ENROLL_SAMPLES} captured successfully.")
-            self.current_enroll_quote_data = random.choice(ENROLL_QUOTES) if ENROLL_QUOTES else "Check file."
+            self.current_enroll_quote_data = self._random_quote('enroll_quotes', "Check file.")
             self.update_enroll_prompt()
         else:
-            self.create_user_profile(self.enroll_username, self.enroll_password, self.enrollment_samples)
-            msg = "Your profile has been re-enrolled successfully." if self.is_re_enrolling else "Your profile has been created successfully."
-            self.show_message_box("Enrollment Complete", msg)
-            self.go_to_login_page()
+            self._run_task("Creating profile…", self.create_user_profile, (self.enroll_username, self.enroll_password, list(self.enrollment_samples)),
+                           lambda result: self._on_profile_created(self.enroll_username, *result))
 
     def create_user_profile(self, username, password, all_samples):
-        from itertools import combinations
-
-        esn_vectors = []
-        for s in all_samples:
-            scaled_s = MODEL['input_scaler'].transform(np.array(s))
-            mask = np.ones(len(scaled_s), dtype=bool)
-            esn_features = self.extract_esn_features(scaled_s, mask)
-            esn_vectors.append(MODEL['feature_scaler'].transform(esn_features.reshape(1, -1)).flatten())
-        
-        if len(esn_vectors) > 1:
-            baseline_variability = np.mean(np.std(esn_vectors, axis=0))
-        else:
-            baseline_variability = 0.20
-        
-        svm_scores, cos_sims, euc_dists = [], [], []
-        for v1, v2 in combinations(esn_vectors, 2):
-            svm_scores.append(MODEL['svm_classifier'].predict_proba(np.abs(v1 - v2).reshape(1, -1))[0, 1])
-            cos_sims.append(cosine_similarity([v1], [v2])[0, 0])
-            euc_dists.append(euclidean_distances([v1], [v2])[0, 0])
+        """Embeds the enrollment samples and writes the new profile; runs on a worker thread.
+
+        Returns the metadata and, with the anchor index enabled, the existing users the new anchor would match.
+        """
+        # All samples share one batched reservoir pass and all pairs one predict_proba call
+        model = load_model()
+        esn_vectors, esn_anchor, thresholds, baseline_variability = enroll_vectors(model, all_samples)
         password_hash, salt = self.hash_password(password)
         statistical_template = np.mean(np.vstack([np.array(s) for s in all_samples]), axis=0)
         user_id = hashlib.sha3_256(username.encode()).hexdigest()[:16]
 
         # THRESHOLD LOGIC
         metadata = {"user_id": user_id, "username": username,
-                    "svm_threshold": max(MIN_SECURE_SVM_THRESHOLD, (np.percentile(svm_scores, 5) - 0.08) if svm_scores else MIN_SECURE_SVM_THRESHOLD),
-                    "cosine_threshold": (np.percentile(cos_sims, 5) - 0.02) if cos_sims else MIN_SECURE_COSINE_THRESHOLD,
-                    "distance_threshold": (np.percentile(euc_dists, 95) + 1.0) if euc_dists else 10.0,
+                    **thresholds,
                     "password_hash": password_hash, "salt": salt, "drift_counter": 0,
                     "first_login_pending": True,
                     "login_count": 0,
@@ -1230,27 +1247,42 @@ class KeystrokeApp(QMainWindow):
                     "consecutive_anomaly_count": 0
                     }
 
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-            zf.writestr('metadata.json', json.dumps(metadata))
-            npz_buffer = io.BytesIO()
-            np.savez(npz_buffer,
-                     esn_anchor=np.mean(esn_vectors, axis=0),
-                     statistical_template=statistical_template,
-                     rolling_window=np.array([]),
-                     quarantined_samples=np.array([]))
-            zf.writestr('template.npz', npz_buffer.getvalue())
-        encrypted_data = Fernet(self.get_encryption_key(username)).encrypt(zip_buffer.getvalue())
-        dat_path = os.path.join(TEMPLATE_DIR, f"{username}.dat")
-        with open(dat_path, 'wb') as f: f.write(encrypted_data)
-        with open(dat_path.replace('.dat', '.hash'), 'w') as f: f.write(hashlib.sha3_256(encrypted_data).hexdigest())
-
+        self._profile_store(username).write_snapshot({
+            "metadata": metadata, "esn_anchor": esn_anchor, "statistical_template": statistical_template,
+            "rolling_window": RollingWindow(MAX_WINDOW_SIZE), "quarantined_samples": [], "event_seq": 0,
+            "model_fingerprint": MODEL_FINGERPRINT,
+            "enrollment_samples": all_samples if RETAIN_ENROLLMENT_TIMINGS else None
+        })
+        if not ANCHOR_INDEX_ENABLED:
+            return metadata, []
+        similar_users = self._similar_users(username, esn_anchor, thresholds)
+        self._anchor_index().upsert(username, esn_anchor)
+        return metadata, similar_users
+
+    def _anchor_index(self):
+        if self.anchor_index is None:
+            self.anchor_index = AnchorIndex(fingerprint=MODEL_FINGERPRINT)
+        return self.anchor_index
+
+    def _similar_users(self, username, esn_anchor, thresholds):
+        """Indexed users whose anchor the new anchor matches under the new thresholds (a likely duplicate or collision)."""
+        index = self._anchor_index()
+        candidates = [(name, index.get(name)) for name, _ in index.search(esn_anchor, ANCHOR_INDEX_CANDIDATES + 1) if name != username]
+        candidates = [(name, vector) for name, vector in candidates if vector is not None][:ANCHOR_INDEX_CANDIDATES]
+        if not candidates:
+            return []
+        vectors = np.vstack([vector for _, vector in candidates])
+        svm, cos, euc = score_against_templates(load_model(), np.broadcast_to(esn_anchor, vectors.shape), vectors)
+        matches = is_match(svm, cos, euc, thresholds['svm_threshold'], thresholds['cosine_threshold'], thresholds['distance_threshold'])
+        return [name for (name, _), matched in zip(candidates, matches) if matched]
+
+    def _on_profile_created(self, username, metadata, similar_users=()):
         log_event = {
             "timestamp": datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ"),
             "user_id": metadata["user_id"],
             "username": username,
             "samples": NUM_ENROLL_SAMPLES,
-            "thresholds": f"svm:{metadata['svm_threshold']:.2f} cos:{metadata['cosine_threshold']:.2f} euc:{metadata['distance_threshold']:.1f}"
+            "thresholds": {name: float(metadata[name]) for name in ('svm_threshold', 'cosine_threshold', 'distance_threshold')}
         }
         if self.is_re_enrolling:
             log_event["event_type"] = "REENROLL_SUCCESS"
@@ -1259,11 +1291,21 @@ class KeystrokeApp(QMainWindow):
         else:
             log_event["event_type"] = "ENROLL_SUCCESS"
             log_event["session_id"] = self.current_session_id
+        if similar_users:
+            log_event["similar_users"] = similar_users # For the administrator; the user is not told
         self.logger.log_event(log_event)
+        msg = "Your profile has been re-enrolled successfully." if self.is_re_enrolling else "Your profile has been created successfully."
+        self.show_message_box("Enrollment Complete", msg)
+        self.go_to_login_page()
 
     def is_text_linguistically_valid(self, text):
         """Checks if the input text is likely real language using the loaded dictionary."""
-        if not DICTIONARY_WORDS:
+        try:
+            dictionary_index = STARTUP_DATA.dictionary_index
+        except Exception as e:
+            print(f"Error loading dictionary index: {e}")
+            dictionary_index = None
+        if dictionary_index is None:
             # Fallback in case dictionary failed to load. This prevents the app from being
             # unusable if the dictionary file is missing post-startup.
             print("Warning: Dictionary not loaded, cannot perform gibberish check.")
@@ -1274,7 +1316,7 @@ class KeystrokeApp(QMainWindow):
         if not words:
             return False, 0.0
 
-        valid_word_count = sum(1 for word in words if word in DICTIONARY_WORDS)
+        valid_word_count = int(dictionary_index.lookup(words, ngram_fallback=GIBBERISH_NGRAM_FALLBACK).sum())
         validity_ratio = (valid_word_count / len(words)) * 100.0
 
         is_valid = validity_ratio >= GIBBERISH_VALIDITY_THRESHOLD
@@ -1293,27 +1335,21 @@ class KeystrokeApp(QMainWindow):
         if not username:
             self.show_message_box("Input Error", "Please provide a username.", QMessageBox.Icon.Warning); return
 
-        now = time.time()
-        if username in self.failed_attempts:
-            self.failed_attempts[username] = [t for t in self.failed_attempts[username] if now - t < LOCKOUT_PERIOD_SECONDS]
-
-            if len(self.failed_attempts[username]) >= MAX_FAILED_ATTEMPTS:
-                oldest_fail_time = self.failed_attempts[username][0]
-                time_left = int(LOCKOUT_PERIOD_SECONDS - (now - oldest_fail_time))
-                self.show_message_box("Account Locked",
-                                      f"Too many failed attempts. Please try again in {time_left // 60} minutes and {time_left % 60} seconds.",
-                                      QMessageBox.Icon.Critical)
+        if not VERIFY_DAEMON_ADDRESS: # The daemon checks lockouts and profiles itself
+            lockout_scope, retry_after = self.rate_limiter.check(username)
+            if lockout_scope:
+                self._show_lockout(lockout_scope, retry_after)
                 return
 
-        dat_path = os.path.join(TEMPLATE_DIR, f"{username}.dat")
-        if not os.path.exists(dat_path):
-            self.show_message_box("Authentication Failed", "User not found. Please check the username or enroll.", QMessageBox.Icon.Warning)
-            self.logger.log_event({
-                "timestamp": datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ"),
-                "event_type": "AUTH_FAIL", "username": username, "error": "UserNotFound",
-                "session_id": self.current_session_id
-            })
-            return
+            dat_path = os.path.join(TEMPLATE_DIR, f"{username}.dat")
+            if not os.path.exists(dat_path):
+                self._show_user_not_found()
+                self.logger.log_event({
+                    "timestamp": datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "event_type": "AUTH_FAIL", "username": username, "error": "UserNotFound",
+                    "session_id": self.current_session_id
+                })
+                return
 
         typed_text = self.login_typing_entry.toPlainText()
 
@@ -1336,8 +1372,7 @@ class KeystrokeApp(QMainWindow):
                     "details": f"Word validity ratio was {validity_ratio:.1f}%, which is below the {GIBBERISH_VALIDITY_THRESHOLD:.1f}% threshold."
                 })
                 # It's a failed attempt, so update the rate limiter
-                if username not in self.failed_attempts: self.failed_attempts[username] = []
-                self.failed_attempts[username].append(time.time())
+                self.rate_limiter.record_failure(username)
                 self.go_to_login_page() # Reset for another attempt
                 return
         else:
@@ -1352,9 +1387,26 @@ class KeystrokeApp(QMainWindow):
         if not live_timings:
             self.show_message_box("Processing Error", "Could not generate features from keystrokes.", QMessageBox.Icon.Warning); return
 
-        verification_result = self.verify_user(username, live_timings)
-        if not verification_result:
-            # Error messages are shown within verify_user if profile is incompatible
+        if VERIFY_DAEMON_ADDRESS:
+            self._run_task("Verifying…", self._verify_remote, (username, list(self.completed_events)),
+                           lambda reply: self._on_remote_verified(username, reply))
+            return
+
+        verification_start = time.perf_counter()
+        prefetch, self._prefetch = self._prefetch, None
+        if prefetch and not prefetch.matches(username, self.current_session_id):
+            prefetch.discard()
+            prefetch = None
+        self._run_task("Verifying…", self.verify_user, (username, live_timings, prefetch),
+                       lambda result: self._on_verified(username, result, verification_start))
+
+    def _on_verified(self, username, verification_result, verification_start):
+        """GUI half of a login: the decision, step-up and re-anchor dialogs, and the audit records."""
+        if verification_result.get('error') == "ProfileModelMismatch":
+            self._report_model_mismatch(username, verification_result['details'])
+        elif verification_result.get('error') == "ProfileTampered":
+            self.logger.log_event({"event_type": "TAMPER_ALERT", "file": f"{username}.dat"})
+        if verification_result.get('error'):
             self.show_rejection_screen("Profile Error")
             self.logger.log_event({
                 "timestamp": datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ"),
@@ -1368,31 +1420,22 @@ class KeystrokeApp(QMainWindow):
         is_adaptive_match = verification_result['is_adaptive_match']
         is_anchor_match = verification_result['is_anchor_match']
 
-        if scores['svm_adaptive'] >= SUSPICIOUS_SCORE_THRESHOLD or scores['svm_anchor'] >= SUSPICIOUS_SCORE_THRESHOLD:
-            is_authenticated = is_adaptive_match or is_anchor_match
-        else:
-            is_authenticated = is_adaptive_match and is_anchor_match
-
-        auth_override_reason = ""
-        if is_authenticated and (scores['svm_adaptive'] < CONFIDENCE_FLOOR and scores['svm_anchor'] < CONFIDENCE_FLOOR):
-            is_authenticated = False
-            auth_override_reason = "OVERRIDE_FAIL(ConfidenceTooLow)"
+        is_authenticated, confidence_override, is_suspicious = decide(scores['svm_adaptive'], scores['svm_anchor'], is_adaptive_match, is_anchor_match,
+                                                                    POLICY['confidence_floor'], POLICY['suspicious_threshold'])
+        is_authenticated, is_suspicious = bool(is_authenticated), bool(is_suspicious)
+        verification_ms = (time.perf_counter() - verification_start) * 1000
 
         self.last_auth_was_success = is_authenticated
         
         if is_authenticated:
-            if username in self.failed_attempts:
-                del self.failed_attempts[username]
+            self.rate_limiter.reset(username)
         else:
-            if username not in self.failed_attempts:
-                self.failed_attempts[username] = []
-            self.failed_attempts[username].append(time.time())
+            self.rate_limiter.record_failure(username)
 
         self.login_input_widget.hide()
         self.status_widget.show()
 
         if is_authenticated:
-            is_suspicious = scores['svm_adaptive'] < SUSPICIOUS_SCORE_THRESHOLD and scores['svm_anchor'] < SUSPICIOUS_SCORE_THRESHOLD
             is_first_login = metadata.get("first_login_pending", False)
 
             if is_suspicious and not is_first_login:
@@ -1420,20 +1463,7 @@ class KeystrokeApp(QMainWindow):
             self.show_rejection_screen("Rejected")
             self.dashboard_button.hide()
 
-        drift_counter = metadata.get('drift_counter', 0)
-        next_drift_counter = drift_counter
-        if is_authenticated:
-            if is_adaptive_match and not is_anchor_match:
-                next_drift_counter = drift_counter + 1
-            else:
-                next_drift_counter = 0
-
-        primary_res = "PASS" if is_adaptive_match else "FAIL"
-        safety_res = "PASS" if is_anchor_match else "FAIL"
-        auth_results_str = (f"ADAPTIVE_{primary_res}(svm:{scores['svm_adaptive']:.2f},cos:{scores['cos_adaptive']:.2f},euc:{scores['euc_adaptive']:.1f}) | "
-                            f"ANCHOR_{safety_res}(svm:{scores['svm_anchor']:.2f},cos:{scores['cos_anchor']:.2f},euc:{scores['euc_anchor']:.1f})")
-        if auth_override_reason:
-            auth_results_str += f" | {auth_override_reason}"
+        next_drift_counter = advance_drift_counter(metadata.get('drift_counter', 0), is_authenticated, is_adaptive_match, is_anchor_match)
 
         log_data = {
             "timestamp": datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ"),
@@ -1441,185 +1471,246 @@ class KeystrokeApp(QMainWindow):
             "user_id": metadata.get("user_id", ""),
             "username": username,
             "session_id": self.current_session_id,
-            "auth_results": auth_results_str,
-            "baseline_thresholds": f"svm:{metadata['svm_threshold']:.2f} cos:{metadata['cosine_threshold']:.2f} euc:{metadata['distance_threshold']:.1f}",
-            "drift": f"{next_drift_counter}/{DRIFT_SESSIONS_FOR_REANCHOR}",
+            "scores": {name: float(value) for name, value in scores.items()},
+            "thresholds": {name: float(metadata[name]) for name in ('svm_threshold', 'cosine_threshold', 'distance_threshold')},
+            "is_adaptive_match": bool(is_adaptive_match), "is_anchor_match": bool(is_anchor_match),
+            "confidence_override": bool(confidence_override), "is_suspicious": is_suspicious,
+            "latency_ms": verification_ms,
+            "critical_path": verification_result['pipeline']['critical_path'],
+            "stage_ms": {name: round(ms, 1) for name, ms in verification_result['pipeline']['stage_ms'].items()},
+            "drift_counter": next_drift_counter,
             "threshold_mode": verification_result.get("threshold_mode", "NORMAL"),
             "method": "ADAPTIVE" if is_adaptive_match else ("ANCHOR" if is_anchor_match else "NONE"),
-            "typing_pattern": verification_result.get("typing_pattern", "unknown")
+            "typing_pattern": verification_result.get("typing_pattern", "unknown"),
+            "decided_by": verification_result['decided_by']
         }
+        if verification_result['decided_by'] == "vector":
+            del log_data['is_suspicious'] # No SVM scores, so the confidence check never ran
         self.logger.log_event(log_data)
 
         if is_authenticated:
             self.dashboard_data = self.save_user_profile(username, verification_result, next_drift_counter)
 
-    def verify_user(self, username, timings):
-        dat_path = os.path.join(TEMPLATE_DIR, f"{username}.dat")
+    def _report_model_mismatch(self, username, details):
+        self.logger.log_event({
+            "timestamp": datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "event_type": "AUTH_FAIL", "username": username, "error": "ProfileModelMismatch", "details": details
+        })
+        self._show_model_mismatch()
+
+    def _show_model_mismatch(self):
+        self.show_message_box("Profile Outdated",
+                              "Your profile is incompatible with the current system model. "
+                              "Please use the 'Re-enroll' option on the enrollment page to update your profile, "
+                              "or ask the administrator to migrate it.",
+                              QMessageBox.Icon.Critical)
+
+    def _show_lockout(self, lockout_scope, retry_after):
+        time_left = int(math.ceil(retry_after))
+        if lockout_scope == "global":
+            message = f"Too many failed attempts on this system. Please try again in {time_left // 60} minutes and {time_left % 60} seconds."
+        else:
+            message = f"Too many failed attempts. Please try again in {time_left // 60} minutes and {time_left % 60} seconds."
+        self.show_message_box("Account Locked", message, QMessageBox.Icon.Critical)
+
+    def _show_user_not_found(self):
+        self.show_message_box("Authentication Failed", "User not found. Please check the username or enroll.", QMessageBox.Icon.Warning)
+
+    def _verify_remote(self, username, events):
+        """Sends the captured session to the verification daemon; runs on a worker thread."""
+        return self._daemon_request("verify", username, self.current_session_id, events)
+
+    def _daemon_request(self, method, *args):
+        """Calls a VerifyClient method on a worker thread. Failures come back as {'status': 'DAEMON_ERROR'}
+        so the GUI half can reject the login, e.g. when a ticket expired behind a dialog or the daemon restarted."""
         try:
-            with open(dat_path, 'rb') as f: encrypted_data = f.read()
-            hash_path = dat_path.replace('.dat', '.hash')
-            if not os.path.exists(hash_path) or hashlib.sha3_256(encrypted_data).hexdigest() != open(hash_path, 'r').read():
-                self.logger.log_event({"event_type": "TAMPER_ALERT", "file": f"{username}.dat"})
-                return None
-
-            decrypted_data = Fernet(self.get_encryption_key(username)).decrypt(encrypted_data)
-            with zipfile.ZipFile(io.BytesIO(decrypted_data), 'r') as zf:
-                metadata = json.loads(zf.read('metadata.json'))
-                with io.BytesIO(zf.read('template.npz')) as npz_buffer:
-                    npz_files = np.load(npz_buffer, allow_pickle=True)
-                    esn_anchor = npz_files['esn_anchor']
-                    statistical_template = npz_files['statistical_template']
-                    rolling_window = list(npz_files['rolling_window']) if 'rolling_window' in npz_files and npz_files['rolling_window'].size > 0 else []
-                    quarantined_samples = list(npz_files['quarantined_samples']) if 'quarantined_samples' in npz_files and npz_files['quarantined_samples'].size > 0 else []
-        except Exception:
-            return None
+            if self.verify_client is None:
+                self.verify_client = VerifyClient(VERIFY_DAEMON_ADDRESS)
+            return getattr(self.verify_client, method)(*args)
+        except DaemonError as e:
+            return {"status": "DAEMON_ERROR", "error": str(e)}
+        except (OSError, ProtocolError) as e:
+            self.verify_client = None # Reconnect on the next attempt
+            return {"status": "DAEMON_ERROR", "error": str(e)}
+
+    def _on_remote_verified(self, username, reply):
+        """GUI half of a daemon login. The daemon decides, logs and stores; this only runs the dialogs."""
+        status = reply['status']
+        if status == "LOCKED":
+            self._show_lockout(reply['scope'], reply['retry_after']); return
+        if status == "USER_NOT_FOUND":
+            self._show_user_not_found(); return
+        self.login_input_widget.hide()
+        self.status_widget.show()
+        if status == "PROFILE_ERROR":
+            if reply['error'] == "ProfileModelMismatch":
+                self._show_model_mismatch()
+            self.show_rejection_screen("Profile Error")
+            return
+        if status == "DAEMON_ERROR":
+            self._show_remote_rejection("Rejected", reply['error'])
+            return
 
-        scaled_timings = MODEL['input_scaler'].transform(np.array(timings))
-        mask = np.ones(len(scaled_timings), dtype=bool)
-        esn_features = self.extract_esn_features(scaled_timings, mask)
-        new_feature_vector = MODEL['feature_scaler'].transform(esn_features.reshape(1, -1)).flatten()
+        if status == "STEP_UP_REQUIRED":
+            step_up_dialog = StepUpDialog(self)
+            password = step_up_dialog.get_password() if step_up_dialog.exec() == QDialog.DialogCode.Accepted else None
+            rejection = "Rejected" if password is not None else "Cancelled"
+            self._run_task("Verifying…", self._daemon_request, ("step_up", reply['ticket'], password),
+                           lambda result: self._on_remote_decided(reply['ticket'], result['status'], rejection, result.get('error')))
+            return
+        self._on_remote_decided(reply['ticket'], status, "Rejected")
 
+    def _on_remote_decided(self, ticket, status, rejection, error=None):
+        self.last_auth_was_success = status == "AUTHENTICATED"
+        if not self.last_auth_was_success:
+            self._show_remote_rejection(rejection, error)
+            return
+        self.show_success_screen("Authenticated")
+        self.dashboard_button.show()
+        self._commit_remote(ticket, {"reanchor": {}}, {})
+
+    def _show_remote_rejection(self, rejection, error):
+        if error is not None:
+            print(f"Verification daemon error: {error}")
+            rejection = "Verification Error"
+        self.last_auth_was_success = False
+        self.show_rejection_screen(rejection)
+        self.dashboard_button.hide()
+
+    def _commit_remote(self, ticket, answers, passwords):
+        """Records the login through the daemon, one request per round; the dialogs it asks for run here, between rounds."""
+        self._run_task("Updating profile…", self._daemon_request, ("commit_step", ticket, answers),
+                       lambda result: self._on_remote_commit_step(ticket, answers, passwords, result))
+
+    def _on_remote_commit_step(self, ticket, answers, passwords, result):
+        if result.get('status') == "DAEMON_ERROR":
+            self._show_remote_rejection("Rejected", result['error'])
+            return
+        prompt = result.get('prompt')
+        if prompt is not None:
+            if prompt['kind'] == "REANCHOR":
+                reason = prompt['reason']
+                dialog = MandatoryReAnchorDialog(self) if reason == "PERSISTENT_ANOMALY" else ReAnchorDialog(parent=self)
+                passwords[reason] = dialog.get_password() if dialog.exec() == QDialog.DialogCode.Accepted else None
+                answers['reanchor'][reason] = passwords[reason]
+            else:
+                answers['proactive'] = bool(self._accept_proactive_prompt())
+            self._commit_remote(ticket, answers, passwords)
+            return
+
+        for reason in result['reanchor_denied']:
+            if reason == "PERSISTENT_ANOMALY" or passwords.get(reason) is not None:
+                self.show_message_box("Update Failed", "Incorrect password. Profile not updated.", QMessageBox.Icon.Warning)
+        for event in result['events']:
+            if event['event_type'] == "REANCHOR_SUCCESS" and event['reason'] == "PERSISTENT_ANOMALY":
+                self.show_message_box("Profile Secured", "Your biometric anchor has been updated based on your recent typing.", QMessageBox.Icon.Information)
+            elif event['event_type'] == "REANCHOR_SUCCESS":
+                self.show_message_box("Profile Updated", "Your biometric anchor has been successfully updated.")
+        self.dashboard_data = result['dashboard']
+
+    def _prefetch_profile(self):
+        """Starts key derivation and decryption when the username is entered, so Verify finds the profile ready."""
+        username = self.login_username_entry.text().strip()
+        if VERIFY_DAEMON_ADDRESS or not username or self._tasks or not os.path.exists(os.path.join(TEMPLATE_DIR, f"{username}.dat")):
+            return # The daemon loads and caches profiles itself
+        if self._prefetch and self._prefetch.matches(username, self.current_session_id):
+            return
+        self._drop_prefetch()
+        self._prefetch = ProfilePrefetch(username, self.current_session_id)
+        # The TTL only stops reuse; the timer also drops the decrypted profile if Verify is never pressed
+        QTimer.singleShot(int(PROFILE_PREFETCH_TTL_SECONDS * 1000), self._prefetch.discard)
+        self.thread_pool.start(functools.partial(self._prefetch.run, self._load_profile))
+
+    def _drop_prefetch(self):
+        if self._prefetch:
+            self._prefetch.discard()
+        self._prefetch = None
+
+    def _load_profile(self, username):
+        """Derives the user's key and decrypts the profile; runs on a worker thread, so failures are returned as {'error': ...}."""
+        store = self._profile_store(username)
+        stamp = store.stamp() # Taken first, so a write during the load makes the result stale rather than wrong
+        load_model()
+        try:
+            # The header check is cheap and spares decrypting a profile embedded by another model
+            stored_fingerprint = store.read_header().get('model_fingerprint')
+            if stored_fingerprint is not None and stored_fingerprint != MODEL_FINGERPRINT:
+                return {"error": "ProfileModelMismatch", "details": f"Profile model: {stored_fingerprint}, current model: {MODEL_FINGERPRINT}"}
+            profile = store.load()
+        except ProfileIntegrityError:
+            return {"error": "ProfileTampered"}
+        except Exception:
+            return {"error": "ProfileUnreadable"}
+        return {"store": store, "profile": profile, "stamp": stamp}
+
+    def verify_user(self, username, timings, prefetch=None):
+        """Scores a login against the user's profile; runs on a worker thread.
+
+        Loading (key derivation and decryption, or the prefetched profile if the files haven't changed since)
+        and embedding the probe don't depend on each other, so they run as overlapping pipeline stages.
+        """
+        pipeline = Pipeline(self.stage_pool)
+        pipeline.stage("load", lambda: self._take_or_load_profile(username, prefetch))
+        pipeline.stage("embed", lambda: embed_sample(load_model(), timings))
+        pipeline.stage("score", lambda loaded, probe: self._score_login(loaded, probe, timings), "load", "embed")
+        results, report = pipeline.run()
+        return {**results["score"], "pipeline": report}
+
+    def _take_or_load_profile(self, username, prefetch):
+        loaded = prefetch.take() if prefetch else None
+        if loaded is None or loaded['store'].stamp() != loaded['stamp']:
+            loaded = self._load_profile(username)
+        return loaded
+
+    def _score_login(self, loaded, new_feature_vector, timings):
+        if 'error' in loaded:
+            return loaded
+        store, profile = loaded['store'], loaded['profile']
+        metadata, esn_anchor, rolling_window = profile['metadata'], profile['esn_anchor'], profile['rolling_window']
+
+        # Profiles written before fingerprints were recorded fall back to the shape check. They stay
+        # unstamped until migrate_profiles.py has checked them against this model
         if new_feature_vector.shape[0] != esn_anchor.shape[0]:
-            self.logger.log_event({
-                "timestamp": datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ"),
-                "event_type": "AUTH_FAIL", "username": username, "error": "ProfileModelMismatch",
-                "details": f"Live vector shape: {new_feature_vector.shape}, Stored anchor shape: {esn_anchor.shape}"
-            })
-            self.show_message_box("Profile Outdated",
-                                  "Your profile is incompatible with the current system model. "
-                                  "Please use the 'Re-enroll' option on the enrollment page to update your profile.",
-                                  QMessageBox.Icon.Critical)
-            return None
-        base_svm_thresh, base_cos_thresh, base_dist_thresh = metadata['svm_threshold'], metadata['cosine_threshold'], metadata['distance_threshold']
-        dynamic_svm_thresh, dynamic_cos_thresh, dynamic_dist_thresh = base_svm_thresh, base_cos_thresh, base_dist_thresh
-        threshold_mode = "NORMAL"
-
-        if len(rolling_window) >= MIN_SAMPLES_FOR_DYNAMIC_THRESH:
-            consistency_metric = np.mean(np.std(rolling_window, axis=0))
-            if consistency_metric < TIGHT_CONSISTENCY_STD_DEV:
-                dynamic_svm_thresh *= 1.05; dynamic_cos_thresh *= 1.05; dynamic_dist_thresh *= 0.95
-                threshold_mode = "STRICT"
-            elif consistency_metric > LOOSE_CONSISTENCY_STD_DEV:
-                dynamic_svm_thresh *= 0.85; dynamic_cos_thresh *= 0.95; dynamic_dist_thresh *= 2
-                threshold_mode = "LENIENT"
-
-        adaptive_template = (ANCHOR_WEIGHT * esn_anchor) + (WINDOW_WEIGHT * np.mean(rolling_window, axis=0)) if rolling_window else esn_anchor
-        svm_adaptive = MODEL['svm_classifier'].predict_proba(np.abs(new_feature_vector - adaptive_template).reshape(1, -1))[0, 1]
-        cos_adaptive = cosine_similarity([new_feature_vector], [adaptive_template])[0, 0]
-        euc_adaptive = euclidean_distances([new_feature_vector], [adaptive_template])[0, 0]
-        is_adaptive_match = (svm_adaptive >= dynamic_svm_thresh and cos_adaptive >= dynamic_cos_thresh and euc_adaptive <= dynamic_dist_thresh)
-
-        svm_anchor_score = MODEL['svm_classifier'].predict_proba(np.abs(new_feature_vector - esn_anchor).reshape(1, -1))[0, 1]
-        cos_anchor_score = cosine_similarity([new_feature_vector], [esn_anchor])[0, 0]
-        euc_anchor_score = euclidean_distances([new_feature_vector], [esn_anchor])[0, 0]
-        is_anchor_match = (svm_anchor_score >= base_svm_thresh and cos_anchor_score >= base_cos_thresh and euc_anchor_score <= base_dist_thresh)
+            return {"error": "ProfileModelMismatch", "details": f"Live vector shape: {new_feature_vector.shape}, Stored anchor shape: {esn_anchor.shape}"}
+        probe_result = score_probe(load_model(), new_feature_vector, esn_anchor, rolling_window, metadata, POLICY, None, SCORING_CASCADE)
 
         return {
-            "metadata": metadata,
-            "esn_anchor": esn_anchor,
-            "statistical_template": statistical_template,
-            "rolling_window": rolling_window,
+            **profile,
+            "store": store, # Reused to persist the login without deriving the key again
             "new_feature_vector": new_feature_vector,
-            "is_adaptive_match": is_adaptive_match,
-            "is_anchor_match": is_anchor_match,
-            "quarantined_samples": quarantined_samples,
-            "scores": {
-                'svm_adaptive': float(svm_adaptive), 'cos_adaptive': float(cos_adaptive), 'euc_adaptive': float(euc_adaptive),
-                'svm_anchor': float(svm_anchor_score), 'cos_anchor': float(cos_anchor_score), 'euc_anchor': float(euc_anchor_score)
-            },
-            "threshold_mode": threshold_mode,
-            "baseline_variability": metadata.get("baseline_variability", None),
-            "typing_pattern": self._get_typing_pattern(timings, statistical_template)
+            "is_adaptive_match": probe_result['is_adaptive_match'],
+            "is_anchor_match": probe_result['is_anchor_match'],
+            "scores": probe_result['scores'],
+            "threshold_mode": probe_result['threshold_mode'],
+            "decided_by": probe_result['decided_by'],
+            "typing_pattern": self._get_typing_pattern(timings, profile['statistical_template'])
         }
 
     def save_user_profile(self, username, verification_result, drift_counter):
         metadata = verification_result['metadata']
-        esn_anchor = verification_result['esn_anchor']
-        statistical_template = verification_result['statistical_template']
         rolling_window = verification_result['rolling_window']
-        quarantined_samples = verification_result['quarantined_samples']
-        new_sample = verification_result['new_feature_vector']
-        scores = verification_result['scores']
-        is_anchor_match = verification_result['is_anchor_match']
-        baseline_variability = verification_result.get('baseline_variability')
-
-        sample_disposition = "DISCARDED"
-        if scores['svm_adaptive'] >= SUSPICIOUS_SCORE_THRESHOLD and is_anchor_match:
-            sample_disposition = "TRUSTED"
-            rolling_window.append(new_sample)
-            if quarantined_samples:
-                rolling_window.extend(quarantined_samples)
-                quarantined_samples.clear()
-            metadata['consecutive_anomaly_count'] = 0
-        elif scores['svm_adaptive'] >= SUSPICIOUS_SCORE_THRESHOLD and not is_anchor_match:
-            sample_disposition = "DRIFT"
-            rolling_window.append(new_sample)
-            metadata['consecutive_anomaly_count'] = 0
-        else:
-            sample_disposition = "QUARANTINED"
-            quarantined_samples.append(new_sample)
-            metadata['consecutive_anomaly_count'] = metadata.get('consecutive_anomaly_count', 0) + 1
-        self.logger.log_event({"timestamp": datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ"), "event_type": "SAMPLE_FILTER", "disposition": sample_disposition, "user_id": metadata.get('user_id'), "username": username, "anomaly_count": metadata.get('consecutive_anomaly_count', 0)})
-
-        if metadata.get('consecutive_anomaly_count', 0) >= CONSECUTIVE_ANOMALY_LIMIT and quarantined_samples:
-            dialog = MandatoryReAnchorDialog(self)
-            password_verified = False
-            if dialog.exec() == QDialog.DialogCode.Accepted:
-                password = dialog.get_password()
-                if self.verify_password(metadata['password_hash'], metadata['salt'], password):
-                    password_verified = True
-
-            if password_verified:
-                esn_anchor = np.mean(quarantined_samples, axis=0)
-                self.logger.log_event({"timestamp": datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ"), "event_type": "REANCHOR_SUCCESS", "reason": "PERSISTENT_ANOMALY", "user_id": metadata.get('user_id'), "username": username, "samples_used": len(quarantined_samples)})
-                rolling_window, quarantined_samples, drift_counter = [], [], 0
-                metadata['consecutive_anomaly_count'] = 0
-                metadata['recent_anchor_scores'] = []
-                self.show_message_box("Profile Secured", "Your biometric anchor has been updated based on your recent typing.", QMessageBox.Icon.Information)
-            else:
-                self.show_message_box("Update Failed", "Incorrect password. Profile not updated.", QMessageBox.Icon.Warning)
 
-        if metadata.get("first_login_pending", False): metadata["first_login_pending"] = False
-        login_count = metadata.get('login_count', 0) + 1
-        metadata['login_count'] = login_count
-        recent_scores = metadata.get('recent_anchor_scores', [])
-        recent_scores.append(scores['svm_anchor'])
-        metadata['recent_anchor_scores'] = recent_scores[-MAX_WINDOW_SIZE:]
-
-        if drift_counter >= DRIFT_SESSIONS_FOR_REANCHOR and rolling_window:
-            if self.re_anchor_prompt(username, metadata):
-                esn_anchor = np.mean(rolling_window, axis=0)
-                self.logger.log_event({"timestamp": datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ"), "event_type": "REANCHOR_SUCCESS", "reason": "DRIFT", "user_id": metadata.get('user_id'), "username": username, "session_id": self.current_session_id})
-                rolling_window, drift_counter, quarantined_samples = [], 0, []
-                metadata['recent_anchor_scores'] = []
-                metadata['consecutive_anomaly_count'] = 0
+        events = update_template(verification_result, verification_result['scores'], verification_result['is_anchor_match'],
+                                 verification_result['new_feature_vector'], drift_counter,
+                                 lambda reason: self._confirm_reanchor(reason, username, metadata), self._accept_proactive_prompt, POLICY)
+        timestamp = datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
+        for event in events:
+            if event['event_type'] == "LOGIN_RECORDED": continue
+            self.logger.log_event({"timestamp": timestamp, **audit_record(event), "user_id": metadata.get('user_id'),
+                                   "username": username, "session_id": self.current_session_id})
+            if event['event_type'] == "REANCHOR_SUCCESS" and event['reason'] == "PERSISTENT_ANOMALY":
+                self.show_message_box("Profile Secured", "Your biometric anchor has been updated based on your recent typing.", QMessageBox.Icon.Information)
+            elif event['event_type'] == "REANCHOR_SUCCESS":
                 self.show_message_box("Profile Updated", "Your biometric anchor has been successfully updated.")
 
-        proactive_snooze_until = metadata.get('proactive_snooze_until', 0)
-        if login_count >= PROACTIVE_MIN_SAMPLES and login_count > proactive_snooze_until:
-            health_score, _, _ = self._calculate_template_health(rolling_window, metadata['recent_anchor_scores'], baseline_variability)
-            if health_score < PROACTIVE_HEALTH_THRESHOLD:
-                self.logger.log_event({"timestamp": datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ"), "event_type": "PROACTIVE_PROMPT_TRIGGERED", "health_score": f"{health_score:.1f}", "user_id": metadata.get('user_id'), "username": username})
-                dialog = ProactiveReAnchorDialog(self)
-                if dialog.exec() == QDialog.DialogCode.Accepted:
-                    if self.re_anchor_prompt(username, metadata) and rolling_window:
-                        esn_anchor = np.mean(rolling_window, axis=0)
-                        self.logger.log_event({"timestamp": datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ"), "event_type": "REANCHOR_SUCCESS", "reason": "PROACTIVE", "user_id": metadata.get('user_id'), "username": username})
-                        rolling_window, drift_counter, quarantined_samples = [], 0, []
-                        metadata['recent_anchor_scores'] = []
-                        metadata['consecutive_anomaly_count'] = 0
-                        self.show_message_box("Profile Updated", "Your biometric anchor has been successfully updated.")
-                else:
-                    metadata['proactive_snooze_until'] = login_count + PROACTIVE_SNOOZE_SESSIONS
-                    self.logger.log_event({"timestamp": datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ"), "event_type": "PROACTIVE_PROMPT_SNOOZED", "user_id": metadata.get('user_id'), "username": username, "snooze_until": metadata['proactive_snooze_until']})
-
-        metadata['drift_counter'] = drift_counter
-        rolling_window = rolling_window[-MAX_WINDOW_SIZE:]
-        quarantined_samples = quarantined_samples[-MAX_QUARANTINE_SIZE:] 
+        # Only this login's events are appended; the full profile is rewritten every PROFILE_SNAPSHOT_INTERVAL events.
+        # The write runs on a worker, and Verify stays disabled until it is done, so the next login reads it back.
+        store = verification_result.pop('store')
+        self._run_task("Saving profile…", self._persist_login, (store, username, verification_result, events, timestamp, self.current_session_id),
+                       lambda _: None)
 
-        health, consistency, performance = self._calculate_template_health(rolling_window, metadata['recent_anchor_scores'], baseline_variability)
-        
-        dashboard_payload = {
+        health, consistency, performance = template_health(rolling_window, metadata['recent_anchor_scores'], verification_result.get('baseline_variability'))
+        return {
             'health': health,
             'consistency': consistency,
             'performance': performance,
@@ -1629,23 +1720,10 @@ class KeystrokeApp(QMainWindow):
             'anomalies': metadata['consecutive_anomaly_count']
         }
 
-        dat_path = os.path.join(TEMPLATE_DIR, f"{username}.dat")
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-            zf.writestr('metadata.json', json.dumps(metadata))
-            npz_buffer = io.BytesIO()
-            np.savez(npz_buffer,
-                     esn_anchor=esn_anchor,
-                     statistical_template=statistical_template,
-                     rolling_window=np.array(rolling_window),
-                     quarantined_samples=np.array(quarantined_samples))
-            zf.writestr('template.npz', npz_buffer.getvalue())
-
-        new_encrypted_data = Fernet(self.get_encryption_key(username)).encrypt(zip_buffer.getvalue())
-        with open(dat_path, 'wb') as f: f.write(new_encrypted_data)
-        with open(dat_path.replace('.dat', '.hash'), 'w') as f: f.write(hashlib.sha3_256(new_encrypted_data).hexdigest())
-
-        return dashboard_payload
+    def _persist_login(self, store, username, profile, events, timestamp, session_id):
+        store.append_events(profile, events, timestamp=timestamp, session_id=session_id)
+        if ANCHOR_INDEX_ENABLED and any(event['event_type'] == "REANCHOR_SUCCESS" for event in events):
+            self._anchor_index().upsert(username, profile['esn_anchor'])
 
     def admin_login(self):
         username_attempt = self.admin_username_entry.text().strip()
@@ -1674,7 +1752,7 @@ class KeystrokeApp(QMainWindow):
                 "session_id": session_id,
                 "action": "VIEW_LOGS"
             })
-            log_dialog = LogViewerDialog(self.logger.read_logs(), self)
+            log_dialog = LogViewerDialog(self.logger.read_logs(), self, self.logger.stats())
             log_dialog.exec()
         else:
             self.logger.log_event({
@@ -1729,18 +1807,20 @@ def initial_admin_setup():
             sys.exit(0)
 
 if __name__ == "__main__":
+    # --startup-probe: quit as soon as the first window is shown (used by startup_budget.py)
+    startup_probe = '--startup-probe' in sys.argv
     os.makedirs(TEMPLATE_DIR, exist_ok=True)
     app = QApplication(sys.argv)
     app.setStyleSheet(APP_STYLESHEET)
     
     # Run the secure admin setup check on startup
-    initial_admin_setup()
+    if not startup_probe:
+        initial_admin_setup()
 
     try:
-        if not all([load_model(),
-                    load_quotes_from_csv(ENROLL_QUOTES_PATH, ENROLL_QUOTES),
-                    load_quotes_from_csv(VERIFY_QUOTES_PATH, VERIFY_QUOTES, is_verify_list=True),
-                    load_dictionary(DICTIONARY_PATH, DICTIONARY_WORDS)]):
+        if not all([check_model(),
+                    load_startup_data(),
+                    load_decision_policy()]):
             sys.exit(1)
     except Exception as e:
         QMessageBox.critical(None, "Fatal Error", f"A critical error occurred on startup: {e}")
@@ -1748,4 +1828,8 @@ if __name__ == "__main__":
 
     window = KeystrokeApp()
     window.show()
+    if not VERIFY_DAEMON_ADDRESS:
+        threading.Thread(target=warm_model, daemon=True).start()
+    if startup_probe:
+        QTimer.singleShot(0, lambda: (print("STARTUP_PROBE first_window", flush=True), app.quit()))
     sys.exit(app.exec())
\ No newline at end of file
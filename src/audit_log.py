@@ -0,0 +1,445 @@
+import os
+import json
+import time
+import queue
+import atexit
+import base64
+import struct
+import hashlib
+import threading
+from datetime import datetime, timedelta, UTC
+
+import numpy as np
+import keyring
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.backends import default_backend
+
+from config import (KEYRING_SERVICE_NAME, SECRET_DERIVATION_SALT, KDF_ITERATIONS, AUDIT_QUEUE_SIZE, AUDIT_BATCH_SIZE,
+                    AUDIT_FSYNC, AUDIT_COMPACT_MIN_FRAMES, AUDIT_COMPACT_FRAME_RECORDS)
+
+
+# Encrypted audit log with a background writer.
+#
+# log_event only enqueues the record, so the GUI thread never waits on encryption or disk I/O.
+# The writer thread takes whatever has queued up (up to AUDIT_BATCH_SIZE records), encrypts it,
+# and appends it with one write and, if AUDIT_FSYNC is set, one fsync per batch (group commit).
+# The queue is bounded. When it is full, log_event blocks until the writer catches up, so audit
+# records are never dropped. Each stall is counted in stats(). Pending records are flushed by
+# read_logs, purge_old_logs and close, which also runs at interpreter exit.
+#
+# File layout (format 2; format 1 was one Fernet-encrypted JSON line per record):
+#   b'KSAL' | format version (u16)
+#   then one frame per batch:
+#     ciphertext length (u32) | record count (u32) | first and last timestamp (f64, f64)
+#     | 12-byte nonce | AES-GCM ciphertext, with the magic and frame header as associated data
+#   plaintext: record schema version (u16) | count x RECORD_DTYPE | JSON list of the other fields
+# The typed columns hold the numeric scores, thresholds and timings, so queries filter and
+# aggregate whole frames with numpy. Frames outside a time range are skipped without decrypting,
+# and only the rows a query returns have their JSON decoded. A quiet writer appends one record per
+# frame, so purge_old_logs also merges runs of small frames into large ones.
+LOG_MAGIC = b'KSAL'
+LOG_FORMAT_VERSION = 2
+FRAME_HEADER = struct.Struct('<IIdd')
+NONCE_SIZE = 12
+RECORD_SCHEMA_VERSION = 1
+
+# Append-only: a record stores its event type's position in this tuple (0 for unlisted types,
+# whose name is kept with the other fields)
+EVENT_TYPES = ("ENROLL_SUCCESS", "REENROLL_SUCCESS", "AUTH_SUCCESS", "AUTH_FAIL", "STEP_UP_SUCCESS", "STEP_UP_FAIL",
+               "STEP_UP_CANCEL", "TAMPER_ALERT", "ADMIN_SUCCESS", "ADMIN_FAIL", "SAMPLE_FILTER", "REANCHOR_SUCCESS",
+               "PROACTIVE_PROMPT_TRIGGERED", "PROACTIVE_PROMPT_SNOOZED", "MODEL_MIGRATED")
+THRESHOLD_MODES = ("NORMAL", "STRICT", "LENIENT")
+METHODS = ("ADAPTIVE", "ANCHOR", "NONE")
+SCORE_FIELDS = ("svm_adaptive", "cos_adaptive", "euc_adaptive", "svm_anchor", "cos_anchor", "euc_anchor")
+THRESHOLD_FIELDS = ("svm_threshold", "cosine_threshold", "distance_threshold")
+FLAG_FIELDS = ("is_adaptive_match", "is_anchor_match", "confidence_override", "is_suspicious")
+SCALAR_FIELDS = ("latency_ms", "health_score")
+COUNTER_FIELDS = ("drift_counter", "anomaly_count")
+
+RECORD_DTYPES = {
+    1: np.dtype([('event', '<u2'), ('flags', '<u2'), ('timestamp', '<f8'), ('user', '<u8')]
+                + [(name, '<f4') for name in SCORE_FIELDS + THRESHOLD_FIELDS + SCALAR_FIELDS]
+                + [(name, '<i2') for name in COUNTER_FIELDS]
+                + [('threshold_mode', 'u1'), ('method', 'u1')]),
+}
+RECORD_DTYPE = RECORD_DTYPES[RECORD_SCHEMA_VERSION]
+# flags: bit i is FLAG_FIELDS[i]'s value, bit 8 + i says it was recorded at all
+FLAG_SET_SHIFT = 8
+_STOP = object()
+
+
+def log_key():
+    """The audit log's Fernet key, derived from a secret kept in the OS keyring."""
+    secret = keyring.get_password(KEYRING_SERVICE_NAME, 'log_encryption_key')
+    if not secret:
+        secret = base64.urlsafe_b64encode(os.urandom(32)).decode('utf-8')
+        keyring.set_password(KEYRING_SERVICE_NAME, 'log_encryption_key', secret)
+    kdf = PBKDF2HMAC(hashes.SHA256(), 32, SECRET_DERIVATION_SALT, KDF_ITERATIONS, default_backend())
+    return base64.urlsafe_b64encode(kdf.derive(secret.encode()))
+
+
+def _frame_key(key):
+    return HKDF(hashes.SHA256(), 32, None, b'keystroke-audit-frames', default_backend()).derive(base64.urlsafe_b64decode(key))
+
+
+def user_hash(username):
+    """64-bit digest stored per record so user filters never decode the JSON fields; 0 means no user."""
+    if not username:
+        return 0
+    return int.from_bytes(hashlib.blake2b(username.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+
+
+def parse_timestamp(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+def format_timestamp(seconds):
+    return datetime.fromtimestamp(seconds, UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def encode_records(events):
+    """Audit dicts -> (typed records, list of the remaining fields per record)."""
+    records = np.zeros(len(events), dtype=RECORD_DTYPE)
+    for name in SCORE_FIELDS + THRESHOLD_FIELDS + SCALAR_FIELDS:
+        records[name] = np.nan
+    for name in COUNTER_FIELDS:
+        records[name] = -1
+    extras = []
+    for i, event in enumerate(events):
+        rest = dict(event)
+        record = records[i]
+        event_type = rest.get('event_type')
+        if event_type in EVENT_TYPES:
+            record['event'] = EVENT_TYPES.index(event_type) + 1
+            del rest['event_type']
+        timestamp = rest.pop('timestamp', None)
+        record['timestamp'] = parse_timestamp(timestamp) if timestamp else time.time()
+        record['user'] = user_hash(rest.get('username'))
+        for group, fields in (('scores', SCORE_FIELDS), ('thresholds', THRESHOLD_FIELDS)):
+            values = rest.get(group)
+            if isinstance(values, dict) and set(values) <= set(fields): # Anything else (e.g. format 1 strings) stays as is
+                for name, value in rest.pop(group).items():
+                    record[name] = value
+        for name in SCALAR_FIELDS + COUNTER_FIELDS:
+            if isinstance(rest.get(name), (int, float, np.number)) and not isinstance(rest[name], bool):
+                record[name] = rest.pop(name)
+        flags = 0
+        for bit, name in enumerate(FLAG_FIELDS):
+            if name in rest:
+                flags |= (1 << (FLAG_SET_SHIFT + bit)) | (int(bool(rest.pop(name))) << bit)
+        record['flags'] = flags
+        if rest.get('threshold_mode') in THRESHOLD_MODES:
+            record['threshold_mode'] = THRESHOLD_MODES.index(rest.pop('threshold_mode')) + 1
+        if rest.get('method') in METHODS:
+            record['method'] = METHODS.index(rest.pop('method')) + 1
+        extras.append(rest)
+    return records, extras
+
+
+def _float(value):
+    return float(str(value)) # Shortest repr of the float32, so 0.87 reads back as 0.87
+
+
+def decode_record(record, extra):
+    """One typed record and its remaining fields -> the audit dict."""
+    event = {"timestamp": format_timestamp(float(record['timestamp']))}
+    if record['event']:
+        event["event_type"] = EVENT_TYPES[record['event'] - 1]
+    event.update(extra)
+    scores = {name: _float(record[name]) for name in SCORE_FIELDS if not np.isnan(record[name])}
+    if scores:
+        event["scores"] = scores
+    thresholds = {name: _float(record[name]) for name in THRESHOLD_FIELDS if not np.isnan(record[name])}
+    if thresholds:
+        event["thresholds"] = thresholds
+    for name in SCALAR_FIELDS:
+        if not np.isnan(record[name]):
+            event[name] = _float(record[name])
+    for name in COUNTER_FIELDS:
+        if record[name] >= 0:
+            event[name] = int(record[name])
+    for bit, name in enumerate(FLAG_FIELDS):
+        if record['flags'] >> (FLAG_SET_SHIFT + bit) & 1:
+            event[name] = bool(record['flags'] >> bit & 1)
+    if record['threshold_mode']:
+        event["threshold_mode"] = THRESHOLD_MODES[record['threshold_mode'] - 1]
+    if record['method']:
+        event["method"] = METHODS[record['method'] - 1]
+    return event
+
+
+def encode_frame(aead, records, extras):
+    plaintext = struct.pack('<H', RECORD_SCHEMA_VERSION) + records.tobytes() + json.dumps(extras, separators=(',', ':')).encode('utf-8')
+    nonce = os.urandom(NONCE_SIZE)
+    timestamps = records['timestamp']
+    # The ciphertext is the plaintext plus a 16-byte tag
+    header = FRAME_HEADER.pack(len(plaintext) + 16, len(records), timestamps.min(), timestamps.max())
+    return header + nonce + aead.encrypt(nonce, plaintext, LOG_MAGIC + header)
+
+
+class Frame:
+    """A frame located in the log; decrypted on first access."""
+    def __init__(self, aead, header, nonce, ciphertext):
+        self._aead, self._header, self._nonce, self._ciphertext = aead, header, nonce, ciphertext
+        _, self.count, self.first_timestamp, self.last_timestamp = FRAME_HEADER.unpack(header)
+        self._records, self._extras = None, None
+
+    def raw(self):
+        return self._header + self._nonce + self._ciphertext
+
+    def _decrypt(self):
+        plaintext = self._aead.decrypt(self._nonce, self._ciphertext, LOG_MAGIC + self._header)
+        schema, = struct.unpack_from('<H', plaintext)
+        dtype = RECORD_DTYPES[schema]
+        end = 2 + self.count * dtype.itemsize
+        self._records = np.frombuffer(plaintext, dtype=dtype, count=self.count, offset=2)
+        if dtype != RECORD_DTYPE: # Older schema: carry the shared columns over, leave new ones unset
+            records = encode_records([{}] * self.count)[0]
+            for name in dtype.names:
+                records[name] = self._records[name]
+            self._records = records
+        self._extras = plaintext[end:]
+
+    @property
+    def records(self):
+        if self._records is None:
+            self._decrypt()
+        return self._records
+
+    def extras(self):
+        if self._records is None:
+            self._decrypt()
+        if not isinstance(self._extras, list):
+            self._extras = json.loads(self._extras)
+        return self._extras
+
+    def events(self, rows=None):
+        rows = range(self.count) if rows is None else rows
+        extras = self.extras()
+        return [decode_record(self.records[i], extras[i]) for i in rows]
+
+
+def read_frames(path, key, since=None, until=None):
+    """Yields the frames of a format 2 log overlapping [since, until] (epoch seconds)."""
+    aead = AESGCM(_frame_key(key))
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:len(LOG_MAGIC)] != LOG_MAGIC:
+        raise ValueError(f"{path} is not a format {LOG_FORMAT_VERSION} audit log")
+    offset = len(LOG_MAGIC) + 2
+    while offset + FRAME_HEADER.size + NONCE_SIZE <= len(data):
+        header = data[offset:offset + FRAME_HEADER.size]
+        length, _, first, last = FRAME_HEADER.unpack(header)
+        start = offset + FRAME_HEADER.size + NONCE_SIZE
+        if start + length > len(data):
+            print(f"Truncated audit log frame at byte {offset}, ignoring the rest of the file")
+            return
+        if (since is None or last >= since) and (until is None or first <= until):
+            yield Frame(aead, header, data[start - NONCE_SIZE:start], data[start:start + length])
+        offset = start + length
+
+
+def is_legacy_log(path):
+    """True for a non-empty format 1 log (Fernet lines)."""
+    with open(path, 'rb') as f:
+        head = f.read(len(LOG_MAGIC))
+    return bool(head) and head != LOG_MAGIC
+
+
+def read_legacy_log(path, fernet):
+    logs = []
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                try:
+                    logs.append(json.loads(fernet.decrypt(line.strip())))
+                except (InvalidToken, Exception) as e:
+                    print(f"Error reading log line: {e}")
+    return logs
+
+
+class SecureLogger:
+    def __init__(self, log_path, retention_days, queue_size=AUDIT_QUEUE_SIZE, batch_size=AUDIT_BATCH_SIZE,
+                 fsync=AUDIT_FSYNC):
+        self.log_path, self.retention_period = log_path, timedelta(days=retention_days)
+        self.batch_size, self.fsync = batch_size, fsync
+        self.key = log_key()
+        self.aead = AESGCM(_frame_key(self.key))
+        os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+        if not os.path.exists(self.log_path) or os.path.getsize(self.log_path) == 0:
+            with open(self.log_path, 'wb') as f:
+                f.write(LOG_MAGIC + struct.pack('<H', LOG_FORMAT_VERSION))
+        elif is_legacy_log(self.log_path):
+            self._convert_legacy()
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file_lock = threading.Lock() # Serializes batch appends with purge rewrites
+        self._stats_lock = threading.Lock()
+        self._stats = {"enqueued": 0, "written": 0, "batches": 0, "failed": 0, "max_batch": 0, "max_queue_depth": 0,
+                       "blocked_puts": 0, "blocked_seconds": 0.0, "write_seconds": 0.0}
+        self._closed = False
+        self._writer = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _convert_legacy(self):
+        """Rewrites a format 1 log in frames of AUDIT_BATCH_SIZE records."""
+        logs = read_legacy_log(self.log_path, Fernet(self.key))
+        self._rewrite([encode_frame(self.aead, *encode_records(logs[i:i + self.batch_size]))
+                       for i in range(0, len(logs), self.batch_size)])
+
+    def _rewrite(self, frames):
+        tmp_path = self.log_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(LOG_MAGIC + struct.pack('<H', LOG_FORMAT_VERSION))
+            f.writelines(frames)
+        os.replace(tmp_path, self.log_path)
+
+    def log_event(self, event_data):
+        if self._closed:
+            print(f"Audit log closed, dropping event: {event_data.get('event_type')}")
+            return
+        try:
+            self._queue.put_nowait(event_data)
+        except queue.Full:
+            start = time.perf_counter()
+            self._queue.put(event_data)
+            with self._stats_lock:
+                self._stats["blocked_puts"] += 1
+                self._stats["blocked_seconds"] += time.perf_counter() - start
+        with self._stats_lock:
+            self._stats["enqueued"] += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._queue.qsize())
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(item is _STOP for item in batch)
+            records = [item for item in batch if item is not _STOP]
+            if records:
+                self._write_batch(records)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    @staticmethod
+    def _encode_batch(events):
+        """(records, extras, failed) for a batch; one bad event costs only its own record."""
+        try:
+            records, extras = encode_records(events)
+            json.dumps(extras, separators=(',', ':'))
+            return records, extras, 0
+        except Exception:
+            pass
+        encoded, failed = [], 0
+        for event in events:
+            try:
+                records, (extra,) = encode_records([event])
+                try:
+                    json.dumps(extra)
+                except (TypeError, ValueError):
+                    # Keep the record, with anything JSON can't carry stored as its string form
+                    extra = json.loads(json.dumps(extra, default=str))
+                encoded.append((records, extra))
+            except Exception as e:
+                print(f"Error encoding {event.get('event_type')} log record: {e}")
+                failed += 1
+        if not encoded:
+            return None, [], failed
+        return np.concatenate([records for records, _ in encoded]), [extra for _, extra in encoded], failed
+
+    def _write_batch(self, events):
+        start = time.perf_counter()
+        records, extras, failed = self._encode_batch(events)
+        written = 0
+        if records is not None:
+            try:
+                frame = encode_frame(self.aead, records, extras)
+                with self._file_lock, open(self.log_path, 'ab') as f:
+                    f.write(frame)
+                    if self.fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+                written = len(records)
+            except Exception as e:
+                print(f"Error writing to log: {e}")
+                failed += len(records)
+        with self._stats_lock:
+            self._stats["written"] += written
+            self._stats["failed"] += failed
+            self._stats["batches"] += 1
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(events))
+            self._stats["write_seconds"] += time.perf_counter() - start
+
+    def flush(self):
+        """Blocks until every record logged so far is on disk."""
+        if self._writer.is_alive():
+            self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+
+    def stats(self):
+        """Writer and back-pressure counters, plus the current queue depth."""
+        with self._stats_lock:
+            return {**self._stats, "queue_depth": self._queue.qsize(), "queue_size": self._queue.maxsize}
+
+    def read_logs(self):
+        self.flush()
+        try:
+            return [event for frame in read_frames(self.log_path, self.key) for event in frame.events()]
+        except Exception as e:
+            print(f"Error reading log: {e}")
+            return []
+
+    def purge_old_logs(self):
+        """Drops records past the retention period and merges runs of small frames.
+
+        Only the frame straddling the cutoff and the small frames are decrypted; the rest are copied as is.
+        """
+        self.flush()
+        cutoff = (datetime.now(UTC) - self.retention_period).timestamp()
+        with self._file_lock: # Batches written meanwhile wait for the rewrite instead of being lost
+            frames, pending, purged, small = [], [], False, 0
+            for frame in read_frames(self.log_path, self.key):
+                if frame.last_timestamp < cutoff:
+                    purged = True
+                    continue
+                if frame.first_timestamp < cutoff:
+                    purged = True
+                    keep = np.flatnonzero(frame.records['timestamp'] >= cutoff)
+                    pending.append((frame.records[keep], [frame.extras()[i] for i in keep]))
+                elif frame.count < self.batch_size:
+                    small += 1
+                    pending.append((frame.records, frame.extras()))
+                else:
+                    frames.extend(self._merge(pending))
+                    pending = []
+                    frames.append(frame.raw())
+            frames.extend(self._merge(pending))
+            if purged or small >= AUDIT_COMPACT_MIN_FRAMES:
+                self._rewrite(frames)
+
+    def _merge(self, parts):
+        """Re-encodes consecutive (records, extras) parts in frames of up to AUDIT_COMPACT_FRAME_RECORDS."""
+        if not parts:
+            return []
+        records = np.frombuffer(b''.join(part.tobytes() for part, _ in parts), dtype=RECORD_DTYPE)
+        extras = [extra for _, part_extras in parts for extra in part_extras]
+        return [encode_frame(self.aead, records[i:i + AUDIT_COMPACT_FRAME_RECORDS], extras[i:i + AUDIT_COMPACT_FRAME_RECORDS])
+                for i in range(0, len(records), AUDIT_COMPACT_FRAME_RECORDS)]
@@ -0,0 +1,194 @@
+import sys
+import csv
+import json
+import time
+import argparse
+from datetime import datetime, timedelta, UTC
+
+import numpy as np
+
+from config import LOG_FILE_PATH
+from audit_log import (EVENT_TYPES, RECORD_DTYPE, FLAG_FIELDS, FLAG_SET_SHIFT, log_key, read_frames, user_hash, is_legacy_log,
+                       format_timestamp)
+
+
+# Headless audit log queries. Filters on user, time range and event type run on the typed record
+# columns of each frame; frames outside the time range are never decrypted, and the JSON fields
+# are only decoded for the rows that get printed. --daily aggregates the login decisions per UTC day.
+#
+# The log records decisions, not ground truth, so the daily table reports the observable side of
+# FAR/FRR: the biometric reject rate (an upper bound on FRR while impostor attempts are rare) and
+# how often a step-up challenge was failed or cancelled (logins that passed the biometric check
+# but not the password, i.e. likely false accepts).
+DAILY_COLUMNS = ('day', 'decisions', 'accepted', 'reject_rate', 'overrides', 'step_ups', 'step_up_fail_rate',
+                 'other_failures', 'mean_svm_accepted', 'mean_svm_rejected', 'latency_p50_ms', 'latency_p95_ms')
+QUERY_BLOCK_RECORDS = 65536
+
+
+def parse_time(value, end_of_day=False):
+    """ISO date or datetime (UTC) -> epoch seconds; a bare date as `until` covers that whole day."""
+    moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=UTC)
+    if end_of_day and len(value) == 10:
+        moment += timedelta(days=1, microseconds=-1)
+    return moment.timestamp()
+
+
+def event_codes(names):
+    unknown = set(names) - set(EVENT_TYPES)
+    if unknown:
+        raise ValueError(f"Unknown event types: {', '.join(sorted(unknown))}")
+    return np.array([EVENT_TYPES.index(name) + 1 for name in names], dtype=np.uint16)
+
+
+def _match(block, hashes, codes, since, until):
+    # Masks are computed per block, so single-record frames don't pay numpy's per-call overhead,
+    # and joining raw bytes is much cheaper than concatenating thousands of structured arrays
+    records = np.frombuffer(b''.join(frame.records.tobytes() for frame in block), dtype=RECORD_DTYPE)
+    mask = np.ones(len(records), dtype=bool)
+    if since is not None:
+        mask &= records['timestamp'] >= since
+    if until is not None:
+        mask &= records['timestamp'] <= until
+    if len(hashes):
+        mask &= np.isin(records['user'], hashes)
+    if len(codes):
+        mask &= np.isin(records['event'], codes)
+    return block, records, mask
+
+
+def _blocks(path, key, users, since, until, events):
+    """Yields (frames, their records joined, match mask) over blocks of about QUERY_BLOCK_RECORDS records."""
+    hashes = np.array([user_hash(u) for u in users], dtype=np.uint64)
+    codes = event_codes(events)
+    block, block_records = [], 0
+    for frame in read_frames(path, key, since, until):
+        block.append(frame)
+        block_records += frame.count
+        if block_records >= QUERY_BLOCK_RECORDS:
+            yield _match(block, hashes, codes, since, until)
+            block, block_records = [], 0
+    if block:
+        yield _match(block, hashes, codes, since, until)
+
+
+def select_records(path, key, users=(), since=None, until=None, events=()):
+    """The typed records matching the filters, as one array."""
+    return np.frombuffer(b''.join(records[mask].tobytes() for _, records, mask in _blocks(path, key, users, since, until, events)),
+                         dtype=RECORD_DTYPE)
+
+
+def query(path, key, users=(), since=None, until=None, events=()):
+    """Yields (frame, matching row indices) for every frame with at least one match."""
+    for block, _, mask in _blocks(path, key, users, since, until, events):
+        matches = np.flatnonzero(mask)
+        offsets = np.cumsum([0] + [frame.count for frame in block])
+        owners = np.searchsorted(offsets, matches, side='right') - 1
+        if not len(matches):
+            continue
+        starts = np.flatnonzero(np.diff(owners)) + 1
+        for owner, rows in zip(owners[np.r_[0, starts]], np.split(matches - offsets[owners], starts)):
+            yield block[owner], rows
+
+
+def _flag(records, name):
+    bit = FLAG_FIELDS.index(name)
+    return (records['flags'] >> bit & 1).astype(bool), (records['flags'] >> (FLAG_SET_SHIFT + bit) & 1).astype(bool)
+
+
+def daily_aggregates(records):
+    """Columnar per-day login metrics: {column: array}, one entry per UTC day present in `records`."""
+    days, day_index = np.unique(np.floor(records['timestamp'] / 86400).astype(np.int64), return_inverse=True)
+    count = lambda mask: np.bincount(day_index[mask], minlength=len(days))
+    code = {name: EVENT_TYPES.index(name) + 1 for name in EVENT_TYPES}
+    is_auth = np.isin(records['event'], [code['AUTH_SUCCESS'], code['AUTH_FAIL']])
+    decided = is_auth & ~np.isnan(records['cos_adaptive']) # Logins that reached the biometric decision
+    svm_adaptive = records['svm_adaptive'].astype(np.float64)
+    svm_scored = ~np.isnan(svm_adaptive) # The scoring cascade leaves it unset on logins the vector gates rejected
+    accepted = decided & (records['event'] == code['AUTH_SUCCESS'])
+    rejected = decided & ~accepted
+    override, _ = _flag(records, 'confidence_override')
+    step_up = np.isin(records['event'], [code['STEP_UP_SUCCESS'], code['STEP_UP_FAIL'], code['STEP_UP_CANCEL']])
+    step_up_failed = step_up & (records['event'] != code['STEP_UP_SUCCESS'])
+
+    def mean_of(values, mask):
+        totals = np.bincount(day_index[mask], weights=values[mask], minlength=len(days))
+        return np.divide(totals, count(mask), out=np.full(len(days), np.nan), where=count(mask) > 0)
+
+    def percentile_of(values, mask, q):
+        return np.array([np.percentile(values[mask & (day_index == d)], q) if (mask & (day_index == d)).any() else np.nan
+                         for d in range(len(days))])
+
+    decisions = count(decided)
+    step_ups = count(step_up)
+    latency = records['latency_ms'].astype(np.float64)
+    timed = decided & ~np.isnan(latency)
+    return {
+        'day': np.array([format_timestamp(d * 86400)[:10] for d in days]),
+        'decisions': decisions,
+        'accepted': count(accepted),
+        'reject_rate': np.divide(count(rejected), decisions, out=np.full(len(days), np.nan), where=decisions > 0),
+        'overrides': count(decided & override),
+        'step_ups': step_ups,
+        'step_up_fail_rate': np.divide(count(step_up_failed), step_ups, out=np.full(len(days), np.nan), where=step_ups > 0),
+        'other_failures': count(is_auth & ~decided & (records['event'] == code['AUTH_FAIL'])),
+        'mean_svm_accepted': mean_of(svm_adaptive, accepted & svm_scored),
+        'mean_svm_rejected': mean_of(svm_adaptive, rejected & svm_scored),
+        'latency_p50_ms': percentile_of(latency, timed, 50),
+        'latency_p95_ms': percentile_of(latency, timed, 95),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Filter and aggregate the encrypted audit log.")
+    parser.add_argument('--log', default=LOG_FILE_PATH)
+    parser.add_argument('--user', nargs='*', default=[], help="Only these usernames")
+    parser.add_argument('--since', default=None, help="ISO date or datetime, UTC")
+    parser.add_argument('--until', default=None, help="ISO date or datetime, UTC (a date includes the whole day)")
+    parser.add_argument('--event', nargs='*', default=[], help=f"Only these event types: {', '.join(EVENT_TYPES)}")
+    parser.add_argument('--daily', action='store_true', help="Print per-day login aggregates instead of records")
+    parser.add_argument('--csv', default=None, help="With --daily, also write the aggregates as CSV")
+    parser.add_argument('--limit', type=int, default=None, help="Print at most this many records")
+    parser.add_argument('--count', action='store_true', help="Only print the number of matching records")
+    args = parser.parse_args()
+
+    if is_legacy_log(args.log):
+        print(f"{args.log} is a format 1 log; start the app once to convert it.")
+        sys.exit(1)
+    since = parse_time(args.since) if args.since else None
+    until = parse_time(args.until, end_of_day=True) if args.until else None
+
+    start = time.perf_counter()
+    key = log_key()
+    if args.daily or args.count:
+        records = select_records(args.log, key, args.user, since, until, args.event)
+        matches = len(records)
+    else:
+        matches = 0
+        for frame, rows in query(args.log, key, args.user, since, until, args.event):
+            rows = rows if args.limit is None else rows[:args.limit - matches]
+            for event in frame.events(rows):
+                # Hash collisions are practically impossible, but the decoded username settles it
+                if not args.user or event.get('username') in args.user:
+                    print(json.dumps(event))
+                    matches += 1
+            if args.limit is not None and matches >= args.limit:
+                break
+    elapsed = time.perf_counter() - start
+
+    if args.daily:
+        table = daily_aggregates(records)
+        print("  ".join(f"{name:>17}" if name != 'day' else f"{name:<10}" for name in DAILY_COLUMNS))
+        for i in range(len(table['day'])):
+            print("  ".join(f"{table[name][i]:<10}" if name == 'day' else f"{table[name][i]:>17.4g}" for name in DAILY_COLUMNS))
+        if args.csv:
+            with open(args.csv, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(DAILY_COLUMNS)
+                writer.writerows(zip(*(table[name] for name in DAILY_COLUMNS)))
+            print(f"Aggregates written to {args.csv}")
+    if args.count or args.daily:
+        print(f"{matches} matching records")
+    print(f"Scanned in {elapsed:.2f} s", file=sys.stderr)
+    sys.exit(0)
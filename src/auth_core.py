@@ -0,0 +1,348 @@
+import json
+
+import numpy as np
+
+from config import (MIN_SECURE_SVM_THRESHOLD, MIN_SECURE_COSINE_THRESHOLD, CONFIDENCE_FLOOR,
+                    SUSPICIOUS_SCORE_THRESHOLD, ANCHOR_WEIGHT, WINDOW_WEIGHT, MIN_SAMPLES_FOR_DYNAMIC_THRESH,
+                    TIGHT_CONSISTENCY_STD_DEV, LOOSE_CONSISTENCY_STD_DEV, STRICT_THRESHOLD_MULTIPLIERS,
+                    LENIENT_THRESHOLD_MULTIPLIERS, MAX_WINDOW_SIZE, DRIFT_SESSIONS_FOR_REANCHOR,
+                    CONSECUTIVE_ANOMALY_LIMIT, MAX_QUARANTINE_SIZE, PROACTIVE_MIN_SAMPLES,
+                    PROACTIVE_HEALTH_THRESHOLD, PROACTIVE_SNOOZE_SESSIONS, CONSISTENCY_WEIGHT, PERFORMANCE_WEIGHT)
+from esn import embed_samples, pairwise_scores
+from rolling_window import RollingWindow
+
+
+# Headless enrollment, scoring and decision rules shared by the app and the offline tools.
+# The threshold and decision helpers only use elementwise numpy operations, so they accept
+# scalars for a single login as well as broadcastable arrays for batch evaluation.
+
+THRESHOLD_MODES = ("NORMAL", "STRICT", "LENIENT")
+MODE_NORMAL, MODE_STRICT, MODE_LENIENT = range(3)
+DEFAULT_BASELINE_VARIABILITY = 0.20
+SCORING_CASCADE_MODES = ("full", "cascade", "verify")
+
+
+class CascadeMismatchError(RuntimeError):
+    """The early-exit cascade and the full scores disagree on a login (only raised in "verify" mode)."""
+
+
+# Tunable decision parameters. A deployment can override any of them with a JSON file
+# (see load_policy); policy_sim.py searches this space and writes such files.
+DEFAULT_POLICY = {
+    "confidence_floor": CONFIDENCE_FLOOR,
+    "suspicious_threshold": SUSPICIOUS_SCORE_THRESHOLD,
+    "anchor_weight": ANCHOR_WEIGHT,
+    "window_weight": WINDOW_WEIGHT,
+    "strict_multipliers": STRICT_THRESHOLD_MULTIPLIERS,
+    "lenient_multipliers": LENIENT_THRESHOLD_MULTIPLIERS,
+}
+
+
+def load_policy(path):
+    """DEFAULT_POLICY updated with the overrides in `path`, if that file exists."""
+    policy = dict(DEFAULT_POLICY)
+    try:
+        with open(path, 'r') as f:
+            overrides = json.load(f)
+    except FileNotFoundError:
+        return policy
+    unknown = set(overrides) - set(DEFAULT_POLICY)
+    if unknown:
+        raise ValueError(f"Unknown policy keys in {path}: {', '.join(sorted(unknown))}")
+    for key in ("strict_multipliers", "lenient_multipliers"):
+        if key in overrides:
+            overrides[key] = tuple(float(m) for m in overrides[key])
+            if len(overrides[key]) != 3:
+                raise ValueError(f"{key} needs three (svm, cosine, distance) multipliers")
+    policy.update(overrides)
+    return policy
+
+
+def process_events_to_features(events):
+    """Turns (key, press, release) events into per-digraph [H, DD, DU, UD, UU] timing rows."""
+    if len(events) < 2: return None
+    return [[max(0, p_rel - p_pre), max(0, c_pre - p_pre), max(0, c_rel - p_pre), max(0, c_pre - p_rel), max(0, c_rel - p_rel)]
+            for (_, p_pre, p_rel), (_, c_pre, c_rel) in zip(events, events[1:])]
+
+
+def typing_pattern(live_timings, stored_template):
+    """Speed of a login relative to the enrolled statistical template, shown on the result screen."""
+    if stored_template is None or stored_template.size == 0 or not live_timings:
+        return "normal"
+    live_mean_speed = np.mean([item[3] for item in live_timings])
+    stored_mean_speed = stored_template[3]
+    if stored_mean_speed == 0: return "normal"
+    ratio = live_mean_speed / stored_mean_speed
+    if ratio < 0.75: return "much_faster"
+    if ratio < 0.90: return "slightly_faster"
+    if ratio > 1.25: return "much_slower"
+    if ratio > 1.10: return "slightly_slower"
+    return "normal"
+
+
+def enrollment_thresholds(svm_scores, cos_sims, euc_dists):
+    """Per-user thresholds derived from the genuine enrollment pair scores."""
+    return {
+        "svm_threshold": float(max(MIN_SECURE_SVM_THRESHOLD, (np.percentile(svm_scores, 5) - 0.08) if len(svm_scores) else MIN_SECURE_SVM_THRESHOLD)),
+        "cosine_threshold": float((np.percentile(cos_sims, 5) - 0.02) if len(cos_sims) else MIN_SECURE_COSINE_THRESHOLD),
+        "distance_threshold": float((np.percentile(euc_dists, 95) + 1.0) if len(euc_dists) else 10.0),
+    }
+
+
+def enrollment_from_vectors(model, esn_vectors):
+    """(anchor, thresholds, baseline_variability) for already embedded enrollment samples."""
+    baseline_variability = float(np.mean(np.std(esn_vectors, axis=0))) if len(esn_vectors) > 1 else DEFAULT_BASELINE_VARIABILITY
+    thresholds = enrollment_thresholds(*pairwise_scores(model, esn_vectors))
+    return np.mean(esn_vectors, axis=0), thresholds, baseline_variability
+
+
+def enroll_vectors(model, samples):
+    """Embeds enrollment samples and returns (esn_vectors, anchor, thresholds, baseline_variability)."""
+    esn_vectors = embed_samples(model, samples)
+    return (esn_vectors, *enrollment_from_vectors(model, esn_vectors))
+
+
+def threshold_mode(consistency_metric, window_size, tight=TIGHT_CONSISTENCY_STD_DEV, loose=LOOSE_CONSISTENCY_STD_DEV):
+    """MODE_* code chosen from the rolling window's consistency metric."""
+    eligible = np.asarray(window_size) >= MIN_SAMPLES_FOR_DYNAMIC_THRESH
+    return np.where(eligible & (consistency_metric < tight), MODE_STRICT,
+                    np.where(eligible & (consistency_metric > loose), MODE_LENIENT, MODE_NORMAL))
+
+
+def dynamic_thresholds(svm_threshold, cos_threshold, dist_threshold, mode,
+                       strict=STRICT_THRESHOLD_MULTIPLIERS, lenient=LENIENT_THRESHOLD_MULTIPLIERS):
+    """Applies the STRICT/LENIENT multipliers to the base thresholds."""
+    def scaled(base, index):
+        return np.where(mode == MODE_STRICT, base * strict[index], np.where(mode == MODE_LENIENT, base * lenient[index], base))
+    return scaled(svm_threshold, 0), scaled(cos_threshold, 1), scaled(dist_threshold, 2)
+
+
+def is_match(svm_score, cos_score, euc_score, svm_threshold, cos_threshold, dist_threshold):
+    return (svm_score >= svm_threshold) & (cos_score >= cos_threshold) & (euc_score <= dist_threshold)
+
+
+def decide(svm_adaptive, svm_anchor, is_adaptive_match, is_anchor_match,
+           confidence_floor=CONFIDENCE_FLOOR, suspicious_threshold=SUSPICIOUS_SCORE_THRESHOLD):
+    """verify_submit's multi-layer rule. Returns (is_authenticated, confidence_override, is_suspicious)."""
+    # np.logical_* rather than ~/&/| so plain Python bools from a single login are not negated bitwise
+    is_confident = np.logical_or(np.greater_equal(svm_adaptive, suspicious_threshold), np.greater_equal(svm_anchor, suspicious_threshold))
+    is_authenticated = np.where(is_confident, np.logical_or(is_adaptive_match, is_anchor_match), np.logical_and(is_adaptive_match, is_anchor_match))
+    confidence_override = is_authenticated & np.less(svm_adaptive, confidence_floor) & np.less(svm_anchor, confidence_floor)
+    return is_authenticated & np.logical_not(confidence_override), confidence_override, np.logical_not(is_confident)
+
+
+def adaptive_template(esn_anchor, window_mean, anchor_weight=ANCHOR_WEIGHT, window_weight=WINDOW_WEIGHT):
+    return esn_anchor if window_mean is None else (anchor_weight * esn_anchor) + (window_weight * window_mean)
+
+
+def vector_scores(probes, templates):
+    """Cosine and euclidean scores of each probe row against its template row."""
+    probes, templates = np.atleast_2d(probes), np.atleast_2d(templates)
+    norm_products = np.linalg.norm(probes, axis=1) * np.linalg.norm(templates, axis=1)
+    dots = np.einsum('ij,ij->i', probes, templates)
+    cos_scores = np.divide(dots, norm_products, out=np.zeros_like(dots), where=norm_products > 0)
+    return cos_scores, np.linalg.norm(probes - templates, axis=1)
+
+
+def score_against_templates(model, probes, templates):
+    """SVM, cosine and euclidean scores of each probe row against its template row, in one SVM call."""
+    probes, templates = np.atleast_2d(probes), np.atleast_2d(templates)
+    svm_scores = model['svm_classifier'].predict_proba(np.abs(probes - templates))[:, 1]
+    return (svm_scores, *vector_scores(probes, templates))
+
+
+def score_probe(model, probe, esn_anchor, rolling_window, metadata, policy=DEFAULT_POLICY, scorer=None, cascade="full"):
+    """Scores one login against the adaptive and anchor templates, as verify_user does.
+
+    `scorer(probes, templates)` replaces score_against_templates, e.g. with a batching.BatchedScoring.
+    With cascade="cascade" the cosine and euclidean gates run first: when neither template passes
+    them, neither can match and decide() rejects whatever the SVM says, so the SVM is skipped and
+    its scores are NaN. "verify" scores the login both ways and raises CascadeMismatchError unless
+    decide() reaches the same decision and confidence override on both; it returns the full scores.
+    `decided_by` records which stage settled the login.
+    """
+    if cascade == "verify":
+        cascaded = score_probe(model, probe, esn_anchor, rolling_window, metadata, policy, scorer, "cascade")
+        full = score_probe(model, probe, esn_anchor, rolling_window, metadata, policy, scorer, "full")
+        decisions = [tuple(bool(v) for v in decide(r['scores']['svm_adaptive'], r['scores']['svm_anchor'], r['is_adaptive_match'],
+                                                   r['is_anchor_match'], policy['confidence_floor'], policy['suspicious_threshold'])[:2])
+                     for r in (cascaded, full)]
+        if decisions[0] != decisions[1]:
+            raise CascadeMismatchError(f"Cascade decided (authenticated, override) = {decisions[0]}, full scores {decisions[1]}: {full['scores']}")
+        return {**full, "decided_by": cascaded['decided_by']}
+
+    base_svm_thresh, base_cos_thresh, base_dist_thresh = metadata['svm_threshold'], metadata['cosine_threshold'], metadata['distance_threshold']
+    mode = int(threshold_mode(rolling_window.consistency() if rolling_window else 0.0, len(rolling_window)))
+    dynamic_svm_thresh, dynamic_cos_thresh, dynamic_dist_thresh = dynamic_thresholds(
+        base_svm_thresh, base_cos_thresh, base_dist_thresh, mode, policy['strict_multipliers'], policy['lenient_multipliers'])
+
+    adaptive = adaptive_template(esn_anchor, rolling_window.mean() if rolling_window else None,
+                                 policy['anchor_weight'], policy['window_weight'])
+    scorer = scorer or (lambda probes, templates: score_against_templates(model, probes, templates))
+    probes, templates = np.vstack([probe, probe]), np.vstack([adaptive, esn_anchor])
+    vector_reject = False
+    if cascade == "cascade":
+        cos, euc = vector_scores(probes, templates)
+        vector_reject = not np.any((cos >= [dynamic_cos_thresh, base_cos_thresh]) & (euc <= [dynamic_dist_thresh, base_dist_thresh]))
+    if vector_reject:
+        svm = np.full(2, np.nan)
+    else:
+        svm, cos, euc = scorer(probes, templates)
+    scores = {
+        'svm_adaptive': float(svm[0]), 'cos_adaptive': float(cos[0]), 'euc_adaptive': float(euc[0]),
+        'svm_anchor': float(svm[1]), 'cos_anchor': float(cos[1]), 'euc_anchor': float(euc[1])
+    }
+    result = {
+        "scores": scores,
+        "dynamic_thresholds": (float(dynamic_svm_thresh), float(dynamic_cos_thresh), float(dynamic_dist_thresh)),
+        "is_adaptive_match": bool(is_match(svm[0], cos[0], euc[0], dynamic_svm_thresh, dynamic_cos_thresh, dynamic_dist_thresh)),
+        "is_anchor_match": bool(is_match(svm[1], cos[1], euc[1], base_svm_thresh, base_cos_thresh, base_dist_thresh)),
+        "threshold_mode": THRESHOLD_MODES[mode],
+        "decided_by": "vector" if vector_reject else "svm",
+    }
+    return result
+
+
+# ADAPTIVE TEMPLATE STATE MACHINE
+# Shared by save_user_profile and drift_sim.py. The dialogs are replaced by callbacks and the audit
+# events are returned rather than logged, so the same transitions run headless and in batch.
+
+def advance_drift_counter(drift_counter, is_authenticated, is_adaptive_match, is_anchor_match):
+    """Consecutive authenticated logins that matched only the adaptive template."""
+    if not is_authenticated:
+        return drift_counter
+    return drift_counter + 1 if is_adaptive_match and not is_anchor_match else 0
+
+
+def template_health(rolling_window, recent_anchor_scores, baseline_variability=None):
+    """(health, consistency, performance) scores in 0-100, as shown on the dashboard."""
+    if len(rolling_window) < MIN_SAMPLES_FOR_DYNAMIC_THRESH:
+        consistency_score = 100.0
+    else:
+        if baseline_variability is not None:
+            personal_tight_bound = baseline_variability * 0.8
+            personal_loose_bound = baseline_variability * 1.5
+        else:
+            personal_tight_bound = TIGHT_CONSISTENCY_STD_DEV
+            personal_loose_bound = LOOSE_CONSISTENCY_STD_DEV
+
+        consistency_metric = rolling_window.consistency()
+
+        if consistency_metric <= personal_tight_bound:
+            consistency_score = 100.0
+        elif consistency_metric >= personal_loose_bound:
+            consistency_score = 0.0
+        else:
+            dev_range = personal_loose_bound - personal_tight_bound
+            if dev_range > 0:
+                normalized_dev = (consistency_metric - personal_tight_bound) / dev_range
+                consistency_score = 100 * (1 - normalized_dev)
+            else:
+                consistency_score = 100.0
+
+    if not recent_anchor_scores:
+        performance_score = 100.0
+    else:
+        performance_score = np.mean(recent_anchor_scores) * 100
+
+    health_score = (CONSISTENCY_WEIGHT * consistency_score) + (PERFORMANCE_WEIGHT * performance_score)
+    return max(0, min(100, health_score)), max(0, min(100, consistency_score)), performance_score
+
+
+def apply_event(profile, event):
+    """Applies one profile event. Replaying a session's events reproduces update_template exactly."""
+    metadata, rolling_window = profile['metadata'], profile['rolling_window']
+    event_type = event['event_type']
+    if event_type == "SAMPLE_FILTER":
+        sample = np.asarray(event['sample'], dtype=float)
+        metadata['drift_counter'] = event['drift_counter']
+        metadata['consecutive_anomaly_count'] = event['anomaly_count']
+        if event['disposition'] == "QUARANTINED":
+            profile['quarantined_samples'].append(sample)
+        else:
+            rolling_window.append(sample)
+            if event['disposition'] == "TRUSTED" and profile['quarantined_samples']:
+                rolling_window.extend(profile['quarantined_samples'])
+                profile['quarantined_samples'] = []
+    elif event_type == "REANCHOR_SUCCESS":
+        if event['reason'] == "PERSISTENT_ANOMALY":
+            profile['esn_anchor'] = np.mean(profile['quarantined_samples'], axis=0)
+        else:
+            profile['esn_anchor'] = rolling_window.mean()
+        rolling_window.clear()
+        profile['quarantined_samples'] = []
+        metadata['drift_counter'] = 0
+        metadata['consecutive_anomaly_count'] = 0
+        metadata['recent_anchor_scores'] = []
+    elif event_type == "LOGIN_RECORDED":
+        metadata["first_login_pending"] = False
+        metadata['login_count'] = metadata.get('login_count', 0) + 1
+        metadata['recent_anchor_scores'] = (metadata.get('recent_anchor_scores', []) + [event['svm_anchor']])[-MAX_WINDOW_SIZE:]
+        profile['quarantined_samples'] = profile['quarantined_samples'][-MAX_QUARANTINE_SIZE:]
+    elif event_type == "PROACTIVE_PROMPT_SNOOZED":
+        metadata['proactive_snooze_until'] = event['snooze_until']
+    elif event_type == "MODEL_MIGRATED":
+        # Window and quarantine vectors live in the old model's space and cannot be carried over
+        profile['esn_anchor'] = np.asarray(event['anchor'], dtype=float)
+        profile['model_fingerprint'] = event['model_fingerprint']
+        profile['baseline_variability'] = metadata['baseline_variability'] = event['baseline_variability']
+        metadata.update(event['thresholds'])
+        profile['rolling_window'] = RollingWindow(rolling_window.capacity)
+        profile['quarantined_samples'] = []
+        metadata['drift_counter'] = 0
+        metadata['consecutive_anomaly_count'] = 0
+        metadata['recent_anchor_scores'] = []
+
+
+def update_template(profile, scores, is_anchor_match, new_sample, drift_counter,
+                    confirm_reanchor, accept_proactive, policy=DEFAULT_POLICY):
+    """Applies one authenticated login to the profile: sample disposition, re-anchoring and health prompts.
+
+    `profile` holds metadata, esn_anchor, rolling_window, quarantined_samples and baseline_variability,
+    and is updated in place. confirm_reanchor(reason) returns True once the password is verified;
+    accept_proactive() returns False to snooze the health prompt. Returns the events that were
+    applied, in order; apply_event replays them.
+    """
+    metadata, rolling_window = profile['metadata'], profile['rolling_window']
+    events = []
+
+    def emit(event):
+        apply_event(profile, event)
+        events.append(event)
+
+    if scores['svm_adaptive'] >= policy['suspicious_threshold']:
+        sample_disposition = "TRUSTED" if is_anchor_match else "DRIFT"
+        anomaly_count = 0
+    else:
+        sample_disposition = "QUARANTINED"
+        anomaly_count = metadata.get('consecutive_anomaly_count', 0) + 1
+    emit({"event_type": "SAMPLE_FILTER", "disposition": sample_disposition, "anomaly_count": anomaly_count,
+          "drift_counter": drift_counter, "sample": new_sample})
+
+    if anomaly_count >= CONSECUTIVE_ANOMALY_LIMIT and profile['quarantined_samples']:
+        if confirm_reanchor("PERSISTENT_ANOMALY"):
+            emit({"event_type": "REANCHOR_SUCCESS", "reason": "PERSISTENT_ANOMALY", "samples_used": len(profile['quarantined_samples'])})
+
+    emit({"event_type": "LOGIN_RECORDED", "svm_anchor": scores['svm_anchor']})
+
+    if metadata['drift_counter'] >= DRIFT_SESSIONS_FOR_REANCHOR and rolling_window:
+        if confirm_reanchor("DRIFT"):
+            emit({"event_type": "REANCHOR_SUCCESS", "reason": "DRIFT"})
+
+    login_count = metadata['login_count']
+    proactive_snooze_until = metadata.get('proactive_snooze_until', 0)
+    if login_count >= PROACTIVE_MIN_SAMPLES and login_count > proactive_snooze_until:
+        health_score, _, _ = template_health(rolling_window, metadata['recent_anchor_scores'], profile.get('baseline_variability'))
+        if health_score < PROACTIVE_HEALTH_THRESHOLD:
+            emit({"event_type": "PROACTIVE_PROMPT_TRIGGERED", "health_score": round(float(health_score), 1)})
+            if accept_proactive():
+                if confirm_reanchor("PROACTIVE") and rolling_window:
+                    emit({"event_type": "REANCHOR_SUCCESS", "reason": "PROACTIVE"})
+            else:
+                emit({"event_type": "PROACTIVE_PROMPT_SNOOZED", "snooze_until": login_count + PROACTIVE_SNOOZE_SESSIONS})
+    return events
+
+
+def audit_record(event):
+    """The audit-log view of a profile event: raw feature vectors stay in the encrypted profile."""
+    return {key: value for key, value in event.items() if key != 'sample'}
@@ -0,0 +1,111 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from esn import embed_samples
+from auth_core import score_against_templates
+
+
+# Micro-batching for concurrent logins. Each login embeds one probe and scores two rows with the
+# SVM; at peak, N logins pay the reservoir's per-step Python overhead and predict_proba's per-call
+# overhead N times. A MicroBatcher holds submissions for at most `max_wait` seconds (or until
+# `max_batch` are queued), runs them through one batched call on its dispatcher thread and fans
+# the results back out through futures, trading a small bounded delay for throughput. The wait
+# only applies once the previous batch had company, so a lone login isn't held back.
+class MicroBatcher:
+    def __init__(self, run_batch, max_batch, max_wait, name="micro-batcher"):
+        self.run_batch = run_batch # list of items -> list of results, in order
+        self.max_batch, self.max_wait = max_batch, max_wait
+        self._queue = queue.Queue()
+        self._closed = False
+        self._batches = self._items = self._largest = self._last_size = 0
+        self._thread = threading.Thread(target=self._dispatch, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """Queues one item; the returned future resolves when its batch has run."""
+        if self._closed:
+            raise RuntimeError("Batcher is closed")
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch, deadline = [first], time.perf_counter() + (self.max_wait if self._last_size > 1 else 0.0)
+        while len(batch) < self.max_batch:
+            try:
+                entry = self._queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+            except queue.Empty:
+                break
+            if entry is None:
+                self._queue.put(None) # Run what was collected, then stop
+                break
+            batch.append(entry)
+        return batch
+
+    def _dispatch(self):
+        while (batch := self._collect()) is not None:
+            items, futures = zip(*batch)
+            try:
+                results = self.run_batch(list(items))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, result in zip(futures, results):
+                future.set_result(result)
+            self._last_size = len(batch)
+            self._batches, self._items, self._largest = self._batches + 1, self._items + len(batch), max(self._largest, len(batch))
+
+    def stats(self):
+        return {"batches": self._batches, "items": self._items, "largest_batch": self._largest,
+                "mean_batch": self._items / self._batches if self._batches else 0.0}
+
+    def close(self):
+        """Runs whatever is queued, then stops the dispatcher."""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+
+class BatchedScoring:
+    """embed(timings) and score(probes, templates) for one model, batched across concurrent callers."""
+    def __init__(self, get_model, max_batch, max_wait):
+        self.get_model = get_model # Called on the dispatcher threads, so the model can still load lazily
+        self.embedder = MicroBatcher(self._embed_batch, max_batch, max_wait, name="embed-batcher")
+        self.scorer = MicroBatcher(self._score_batch, max_batch, max_wait, name="score-batcher")
+
+    def _embed_batch(self, samples):
+        return list(embed_samples(self.get_model(), samples))
+
+    def _score_batch(self, pairs):
+        # One predict_proba over every caller's rows, split back by how many rows each sent
+        probes = np.vstack([np.atleast_2d(p) for p, _ in pairs])
+        templates = np.vstack([np.atleast_2d(t) for _, t in pairs])
+        bounds = np.cumsum([len(np.atleast_2d(p)) for p, _ in pairs])[:-1]
+        svm, cos, euc = score_against_templates(self.get_model(), probes, templates)
+        return list(zip(np.split(svm, bounds), np.split(cos, bounds), np.split(euc, bounds)))
+
+    def embed(self, timings):
+        return self.embedder(timings)
+
+    def score(self, probes, templates):
+        """Same result as score_against_templates(model, probes, templates)."""
+        return self.scorer((probes, templates))
+
+    def stats(self):
+        return {"embed": self.embedder.stats(), "score": self.scorer.stats()}
+
+    def close(self):
+        self.embedder.close()
+        self.scorer.close()
@@ -0,0 +1,162 @@
+import io
+import os
+import sys
+import csv
+import json
+import time
+import zlib
+import pickle
+import argparse
+import tempfile
+
+import numpy as np
+from sklearn.base import clone
+
+from config import MODEL_PATH, NUM_ENROLL_SAMPLES, MAX_WINDOW_SIZE, MAX_QUARANTINE_SIZE
+from esn import embed_samples, embedding_dim
+from reservoir import read_model, portable
+from auth_core import score_against_templates
+from evaluate import read_corpus, chunk_sessions, evaluate, DEFAULT_CHUNK_SIZE
+
+
+# Offline embedding compression. Fits a PCA projection of the feature-scaled ESN embeddings on
+# the samples of part of a corpus's participants, retrains the SVM on |v1 - v2| in each reduced
+# space, and replays the remaining participants through evaluate.py. For every k the report has
+# accuracy, per-login scoring latency and the in-memory and stored size of a full set of
+# templates, next to the current model. --write-model K saves the k-dimensional model: point
+# MODEL_PATH at it and run migrate_profiles.py, since the fingerprint and template length change.
+DEFAULT_DIMENSIONS = (8, 16, 24, 32)
+DEFAULT_MAX_PAIRS = 20000 # SVM training pairs per k, half genuine and half impostor
+LATENCY_PROBES = 200
+
+
+def fit_projection(vectors, k):
+    """PCA of `vectors` by SVD: ({'mean', 'components'}, explained variance ratio of the first k)."""
+    mean = vectors.mean(axis=0)
+    _, singular_values, components = np.linalg.svd(vectors - mean, full_matrices=False)
+    variance = singular_values ** 2
+    return {"mean": mean, "components": components[:k].copy()}, float(variance[:k].sum() / variance.sum())
+
+
+def training_pairs(vectors, owners, max_pairs, rng):
+    """Balanced genuine/impostor |v1 - v2| rows and labels, the SVM's training layout."""
+    first, second = np.triu_indices(len(vectors), k=1)
+    genuine = owners[first] == owners[second]
+    per_class = max_pairs // 2
+    chosen = []
+    for mask in (genuine, ~genuine):
+        candidates = np.flatnonzero(mask)
+        chosen.append(rng.choice(candidates, min(per_class, candidates.size), replace=False))
+    chosen = np.concatenate(chosen)
+    return np.abs(vectors[first[chosen]] - vectors[second[chosen]]), genuine[chosen].astype(int)
+
+
+def compressed_model(model, projection, svm):
+    compressed = {name: value for name, value in model.items() if name != 'compiled'}
+    compressed.update(projection=projection, svm_classifier=svm)
+    return compressed
+
+
+def scoring_cost(model, samples):
+    """Median per-login embed and SVM scoring time (ms), and the raw and deflated size of one profile's vectors."""
+    embed_times, score_times = [], []
+    for sample in samples[:LATENCY_PROBES]:
+        start = time.perf_counter()
+        probe = embed_samples(model, [sample])[0]
+        embedded = time.perf_counter()
+        score_against_templates(model, np.vstack([probe, probe]), np.vstack([probe, probe]))
+        embed_times.append(embedded - start)
+        score_times.append(time.perf_counter() - embedded)
+
+    # Anchor, a full rolling window and a full quarantine, deflated as profile_store stores them
+    vectors = embed_samples(model, samples[:1 + MAX_WINDOW_SIZE + MAX_QUARANTINE_SIZE])
+    buffer = io.BytesIO()
+    np.savez(buffer, esn_anchor=vectors[0], window=vectors[1:1 + MAX_WINDOW_SIZE], quarantined_samples=vectors[1 + MAX_WINDOW_SIZE:])
+    return (float(np.median(embed_times) * 1000), float(np.median(score_times) * 1000),
+            vectors.nbytes, len(zlib.compress(buffer.getvalue())))
+
+
+def compare(corpus, model_path, dimensions, train_fraction=0.5, max_pairs=DEFAULT_MAX_PAIRS, enroll_samples=NUM_ENROLL_SAMPLES,
+            chunk_size=DEFAULT_CHUNK_SIZE, max_impostor_probes=None, workers=None, seed=0):
+    """Returns (report rows, {k: compressed model}); the first row is the current model."""
+    rng = np.random.default_rng(seed)
+    model = read_model(model_path)
+    participants = sorted(p for p, sessions in corpus.items() if chunk_sessions(sessions, chunk_size))
+    train = set(rng.choice(participants, max(1, int(round(len(participants) * train_fraction))), replace=False))
+    held_out = {p: corpus[p] for p in participants if p not in train}
+    train_samples = [(p, s) for p in sorted(train) for s in chunk_sessions(corpus[p], chunk_size)]
+    vectors = embed_samples(model, [s for _, s in train_samples])
+    owners = np.array([p for p, _ in train_samples])
+    probe_samples = [s for sessions in held_out.values() for s in chunk_sessions(sessions, chunk_size)]
+
+    rows, models = [], {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        candidates = [(embedding_dim(model), model, 1.0)]
+        for k in dimensions:
+            projection, explained = fit_projection(vectors, k)
+            reduced = (vectors - projection['mean']) @ projection['components'].T
+            svm = clone(model['svm_classifier']).fit(*training_pairs(reduced, owners, max_pairs, rng))
+            models[k] = compressed_model(model, projection, svm)
+            candidates.append((k, models[k], explained))
+        for k, candidate, explained in candidates:
+            path = os.path.join(tmp_dir, f"model_{k}.pkl")
+            with open(path, 'wb') as f:
+                pickle.dump(portable(candidate), f)
+            summary, _, _ = evaluate(held_out, path, enroll_samples, chunk_size, max_impostor_probes, workers, seed)
+            embed_ms, score_ms, template_bytes, stored_bytes = scoring_cost(candidate, probe_samples)
+            rows.append({"k": k, "projected": candidate is not model, "explained_variance": explained,
+                         "svm_eer": summary['svm_eer'], "svm_auc": summary['svm_auc'],
+                         "policy_far": summary['policy_far'], "policy_frr": summary['policy_frr'],
+                         "policy_accuracy": summary['policy_accuracy'],
+                         "embed_ms": embed_ms, "score_ms": score_ms,
+                         "template_bytes": template_bytes, "stored_bytes": stored_bytes,
+                         "verify_per_second": summary['throughput']['verify']['items_per_worker_second']})
+    return rows, models
+
+
+def write_report(out_dir, rows):
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, 'report.json'), 'w') as f:
+        json.dump(rows, f, indent=2)
+    with open(os.path.join(out_dir, 'report.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit PCA-compressed embedding spaces and report accuracy, latency and profile size across k.")
+    parser.add_argument('corpus', help="CSV of keystroke events or KeyRecs-style digraph timings")
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--k', type=int, nargs='+', default=list(DEFAULT_DIMENSIONS), help="Embedding dimensions to compare")
+    parser.add_argument('--train-fraction', type=float, default=0.5, help="Share of participants used to fit the projection and SVM")
+    parser.add_argument('--max-pairs', type=int, default=DEFAULT_MAX_PAIRS)
+    parser.add_argument('--out', default='./compress_results')
+    parser.add_argument('--write-model', type=int, metavar='K', help="Save the k-dimensional model")
+    parser.add_argument('--output', help="Path for --write-model (default: next to --model)")
+    parser.add_argument('--enroll-samples', type=int, default=NUM_ENROLL_SAMPLES)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--time-scale', type=float, default=1.0, help="Multiplier converting corpus times to seconds (0.001 for ms)")
+    parser.add_argument('--max-impostor-probes', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    dimensions = sorted(set(args.k) | ({args.write_model} if args.write_model else set()))
+    rows, models = compare(read_corpus(args.corpus, args.time_scale), args.model, dimensions, args.train_fraction, args.max_pairs,
+                           args.enroll_samples, args.chunk_size, args.max_impostor_probes, args.workers, args.seed)
+    write_report(args.out, rows)
+
+    print(f"{'k':>5} {'var':>6} {'EER':>7} {'AUC':>7} {'FAR':>7} {'FRR':>7} {'embed ms':>9} {'score ms':>9} {'bytes':>7} {'stored':>7}")
+    for row in rows:
+        label = f"{row['k']}" if row['projected'] else f"{row['k']}*"
+        print(f"{label:>5} {row['explained_variance']:>6.1%} {row['svm_eer']:>7.2%} {row['svm_auc']:>7.4f} {row['policy_far']:>7.2%} "
+              f"{row['policy_frr']:>7.2%} {row['embed_ms']:>9.3f} {row['score_ms']:>9.3f} {row['template_bytes']:>7} {row['stored_bytes']:>7}")
+    print(f"* current model. Report written to {args.out}")
+
+    if args.write_model:
+        output = args.output or os.path.splitext(args.model)[0] + f"_k{args.write_model}.pkl"
+        with open(output, 'wb') as f:
+            pickle.dump(portable(models[args.write_model]), f)
+        print(f"Wrote the {args.write_model}-dimensional model to {output}; set MODEL_PATH to it and run migrate_profiles.py --apply")
+    sys.exit(0)
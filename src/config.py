@@ -0,0 +1,100 @@
+import os
+
+
+# CONSTANTS AND PATHS
+MODEL_PATH = './model/esn_svm.pkl'
+TEMPLATE_DIR = './data/app_data/'
+ENROLL_QUOTES_PATH = './data/raw/enroll_quotes.csv'
+VERIFY_QUOTES_PATH = './data/raw/verify_quotes.csv'
+DICTIONARY_PATH = './data/raw/dictionary.txt'
+STARTUP_CACHE_DIR = os.path.join(TEMPLATE_DIR, 'cache')
+DICTIONARY_INDEX_PATH = os.path.join(STARTUP_CACHE_DIR, 'dictionary.idx')
+RESERVOIR_CACHE_DIR = STARTUP_CACHE_DIR # Memory-mapped matrices of seed-defined reservoirs (see reservoir.py)
+LOG_FILE_PATH = os.path.join(TEMPLATE_DIR, 'secure_audit.log')
+ADMIN_CONFIG_PATH = os.path.join(TEMPLATE_DIR, 'admin.cfg')
+POLICY_PATH = os.path.join(TEMPLATE_DIR, 'policy.json') # Optional per-deployment decision overrides
+RATE_LIMIT_DB_PATH = os.path.join(TEMPLATE_DIR, 'rate_limits.db')
+
+# Application Info
+APP_NAME = "KeystrokeDynamics"
+APP_VERSION = "9.0.4" # Version incremented for gibberish check feature
+WORKER_THREADS = 2 # Pool threads for verification, enrollment and profile writes
+PIPELINE_THREADS = 2 # Stage threads within one verification: profile load/decrypt overlaps probe embedding
+MICROBATCH_MAX_SIZE = 32 # Most concurrent probes embedded, or scored by the SVM, in one batched call
+MICROBATCH_MAX_WAIT_MS = 2 # Longest a probe waits for others to join its batch (only once logins overlap)
+SCORING_CASCADE = "cascade" # "full" always runs the SVM; "cascade" skips it when the cosine/distance gates already reject; "verify" checks that both agree
+
+# Verification Daemon Config
+VERIFY_DAEMON_ADDRESS = None # e.g. 'unix:./data/app_data/verify.sock' or '127.0.0.1:7645'; None verifies in-process
+VERIFY_SOCKET_PATH = os.path.join(TEMPLATE_DIR, 'verify.sock') # verify_daemon.py's default listening socket
+VERIFY_TICKET_TTL_SECONDS = 300 # How long a verified login may await its step-up or profile commit
+
+# Keystroke Config
+NUM_ENROLL_SAMPLES = 3
+
+# Accuracy Config
+MIN_CHAR_ACCURACY = 93.0
+MIN_WORD_ACCURACY = 80.0
+
+# Rate Limiting Config
+MAX_FAILED_ATTEMPTS = 5
+LOCKOUT_PERIOD_SECONDS = 900 # 15 minutes
+GLOBAL_MAX_FAILED_ATTEMPTS = 50 # Across all users, e.g. a username-spraying run
+GLOBAL_LOCKOUT_WINDOW_SECONDS = 60
+
+# Security Thresholds
+MIN_SECURE_SVM_THRESHOLD = 0.70
+MIN_SECURE_COSINE_THRESHOLD = 0.90 # Fallback only
+
+# Multi-layer defense thresholds (Optimized from simulation)
+CONFIDENCE_FLOOR = 0.67
+SUSPICIOUS_SCORE_THRESHOLD = 0.75
+
+# Adaptive Threshold Config
+MAX_WINDOW_SIZE = 10
+ANCHOR_WEIGHT = 0.7
+WINDOW_WEIGHT = 0.3
+DRIFT_SESSIONS_FOR_REANCHOR = 5
+MIN_SAMPLES_FOR_DYNAMIC_THRESH = 4
+TIGHT_CONSISTENCY_STD_DEV = 0.18 # Fallback for old profiles
+LOOSE_CONSISTENCY_STD_DEV = 0.30 # Fallback for old profiles
+# (svm, cosine, distance) threshold multipliers for consistent / erratic typists
+STRICT_THRESHOLD_MULTIPLIERS = (1.05, 1.05, 0.95)
+LENIENT_THRESHOLD_MULTIPLIERS = (0.85, 0.95, 2.0)
+
+# Proactive Health & Security Config
+PROACTIVE_HEALTH_THRESHOLD = 40
+PROACTIVE_MIN_SAMPLES = 5
+CONSISTENCY_WEIGHT = 0.5
+PERFORMANCE_WEIGHT = 0.5
+PROACTIVE_SNOOZE_SESSIONS = 15
+CONSECUTIVE_ANOMALY_LIMIT = 3
+MAX_QUARANTINE_SIZE = 20
+
+# Profile Storage Config
+PROFILE_FORMAT_VERSION = 2 # 1: Fernet .dat with a .hash sidecar, 2: authenticated container
+PROFILE_SNAPSHOT_INTERVAL = 50 # Profile events appended before the snapshot is rewritten
+PROFILE_EVENT_SEGMENTS = 3 # Compacted event segments kept per user for forensics
+RETAIN_ENROLLMENT_TIMINGS = True # Keep raw enrollment timings (encrypted) so migrate_profiles.py can re-embed them
+PROFILE_PREFETCH_TTL_SECONDS = 120 # How long a profile decrypted ahead of Verify may be used
+ANCHOR_INDEX_ENABLED = False # Keep an encrypted nearest-neighbour index of anchors (see anchor_index.py)
+ANCHOR_INDEX_PATH = os.path.join(TEMPLATE_DIR, 'anchors.idx')
+ANCHOR_INDEX_PROBES = 8 # Inverted lists scanned per search; more trades speed for recall
+ANCHOR_INDEX_TRAIN_MIN = 1024 # Anchors needed before the coarse quantizer is trained; smaller indexes are scanned in full
+ANCHOR_INDEX_COMPACT_BYTES = 4 * 1024 * 1024 # Journal size at which updates are folded into the snapshot
+ANCHOR_INDEX_CANDIDATES = 10 # Nearest users re-scored with the SVM when checking a new enrollment for collisions
+
+# Gibberish Check Config
+GIBBERISH_VALIDITY_THRESHOLD = 60.0 # <-- NEW
+GIBBERISH_NGRAM_FALLBACK = False # Count misspelled-but-wordlike tokens as valid
+
+# Security & Logging Config
+KEYRING_SERVICE_NAME = 'KeystrokeDynamicsApp'
+SECRET_DERIVATION_SALT = b'\x8a\x0b\x2d\x1f\x9c\x0e\x4a\xd3\xbf\x7e\x6d\x5c\x89\xab\xcd\xef'
+KDF_ITERATIONS = 100000
+LOG_RETENTION_DAYS = 90
+AUDIT_QUEUE_SIZE = 1024 # Audit records buffered for the background writer before log_event blocks
+AUDIT_BATCH_SIZE = 64 # Most records encrypted and appended in one write
+AUDIT_FSYNC = True # fsync once per batch
+AUDIT_COMPACT_MIN_FRAMES = 256 # Under-filled frames tolerated before the startup purge merges them
+AUDIT_COMPACT_FRAME_RECORDS = 4096 # Records per merged frame
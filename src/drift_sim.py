@@ -0,0 +1,236 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from config import MODEL_PATH, NUM_ENROLL_SAMPLES, MAX_WINDOW_SIZE
+from esn import embed_samples
+from reservoir import read_model
+from rolling_window import RollingWindow
+from auth_core import (DEFAULT_POLICY, load_policy, process_events_to_features, enroll_vectors, score_probe, decide,
+                       advance_drift_counter, template_health, update_template)
+from evaluate import DEFAULT_CHUNK_SIZE, read_corpus, chunk_sessions
+
+
+# Headless drift simulator: fast-forwards long login histories through the same scoring, decision
+# and adaptive-template state machine as the app (auth_core.update_template), with scripted
+# answers in place of the password and re-anchor dialogs. Sessions come from a recorded corpus
+# (see evaluate.py for the layouts) or from synthetic typists whose rhythm drifts over time.
+#
+# Outputs: summary.json, sessions.csv (one row per login with health, threshold mode and events)
+# and sessions.npz, which policy_sim.py can replay under other decision policies.
+HEALTH_CHECKPOINTS = 10 # Points on the reported health-over-time curve
+
+_WORKER_MODEL = None
+
+
+def synthetic_typist(rng, sessions, chunk_size=DEFAULT_CHUNK_SIZE, drift_per_session=0.002, noise=0.15):
+    """Timing samples for one synthetic user whose holds and flights scale by drift_per_session per login."""
+    hold_profile = rng.uniform(0.07, 0.14) * (1 + 0.3 * rng.standard_normal(chunk_size + 1)).clip(0.3)
+    flight_profile = rng.uniform(0.08, 0.25) * (1 + 0.4 * rng.standard_normal(chunk_size)).clip(0.2)
+    samples = []
+    for session in range(sessions):
+        scale = 1.0 + drift_per_session * session
+        holds = hold_profile * scale * (1 + noise * rng.standard_normal(chunk_size + 1)).clip(0.2)
+        flights = flight_profile * scale * (1 + noise * rng.standard_normal(chunk_size)).clip(0.1)
+        presses = np.r_[0.0, np.cumsum(holds[:-1] + flights)]
+        samples.append(np.array(process_events_to_features(list(zip([''] * len(presses), presses, presses + holds)))))
+    return samples
+
+
+def build_histories(user_samples, enroll_samples, impostor_rate, seed):
+    """{user: (enrollment samples, [(timings, is_genuine)])}; impostor attempts use other users' samples in order."""
+    rng = np.random.default_rng(seed)
+    users = list(user_samples)
+    histories = {}
+    for user in users:
+        samples = user_samples[user]
+        others = [u for u in users if u != user and user_samples[u]]
+        logins = []
+        for session, timings in enumerate(samples[enroll_samples:], start=enroll_samples):
+            if others and rng.random() < impostor_rate:
+                other_samples = user_samples[others[rng.integers(len(others))]]
+                logins.append((other_samples[min(session, len(other_samples) - 1)], False))
+            logins.append((timings, True))
+        histories[user] = (samples[:enroll_samples], logins)
+    return histories
+
+
+def simulate_user(model, enroll_samples, logins, policy=DEFAULT_POLICY, accept_reanchor=True, accept_proactive=True):
+    """Replays one user's logins; returns per-session records and the final profile."""
+    _, anchor, thresholds, baseline_variability = enroll_vectors(model, enroll_samples)
+    profile = {
+        'metadata': {**thresholds, "drift_counter": 0, "first_login_pending": True, "login_count": 0, "recent_anchor_scores": [],
+                     "proactive_snooze_until": 0, "baseline_variability": float(baseline_variability), "consecutive_anomaly_count": 0},
+        'esn_anchor': anchor,
+        'rolling_window': RollingWindow(MAX_WINDOW_SIZE),
+        'quarantined_samples': [],
+        'baseline_variability': float(baseline_variability),
+    }
+    metadata = profile['metadata']
+    # Embedding does not depend on profile state, so every probe goes through the reservoir in one pass
+    probes = embed_samples(model, [timings for timings, _ in logins])
+
+    records = []
+    for probe, (_, genuine) in zip(probes, logins):
+        start = time.perf_counter()
+        rolling_window = profile['rolling_window']
+        record = {
+            'genuine': genuine, 'probe': probe, 'anchor': profile['esn_anchor'],
+            'window_mean': rolling_window.mean() if rolling_window else np.zeros_like(probe),
+            'window_size': len(rolling_window), 'consistency': rolling_window.consistency() if rolling_window else 0.0,
+            'svm_threshold': metadata['svm_threshold'], 'cosine_threshold': metadata['cosine_threshold'],
+            'distance_threshold': metadata['distance_threshold'],
+        }
+        result = score_probe(model, probe, profile['esn_anchor'], rolling_window, metadata, policy)
+        scores = result['scores']
+        accepted, _, suspicious = decide(scores['svm_adaptive'], scores['svm_anchor'], result['is_adaptive_match'],
+                                         result['is_anchor_match'], policy['confidence_floor'], policy['suspicious_threshold'])
+        accepted, stepped_up = bool(accepted), bool(accepted and suspicious and not metadata.get("first_login_pending", False))
+        if stepped_up:
+            accepted = genuine # Only the genuine user knows the password
+        drift_counter = advance_drift_counter(metadata.get('drift_counter', 0), accepted, result['is_adaptive_match'], result['is_anchor_match'])
+        events = []
+        if accepted:
+            events = update_template(profile, scores, result['is_anchor_match'], probe, drift_counter,
+                                     lambda reason: genuine and accept_reanchor, lambda: accept_proactive, policy)
+        health, consistency, performance = template_health(profile['rolling_window'], metadata['recent_anchor_scores'], profile['baseline_variability'])
+        record.update(scores)
+        record.update({
+            'accepted': accepted, 'stepped_up': stepped_up, 'threshold_mode': result['threshold_mode'],
+            'dynamic_svm_threshold': result['dynamic_thresholds'][0],
+            'disposition': next((e['disposition'] for e in events if e['event_type'] == "SAMPLE_FILTER"), ""),
+            'events': ";".join(e.get('reason', e['event_type']) for e in events if e['event_type'] not in ("SAMPLE_FILTER", "LOGIN_RECORDED")),
+            'health': health, 'health_consistency': consistency, 'health_performance': performance,
+            'drift_counter': metadata.get('drift_counter', 0), 'anomaly_count': metadata.get('consecutive_anomaly_count', 0),
+            'cost_ms': (time.perf_counter() - start) * 1000,
+        })
+        records.append(record)
+    return records, profile
+
+
+def _init_worker(model_path):
+    global _WORKER_MODEL
+    _WORKER_MODEL = read_model(model_path)
+
+
+def _simulate_task(args):
+    enroll_samples, logins, policy, accept_reanchor, accept_proactive = args
+    records, _ = simulate_user(_WORKER_MODEL, enroll_samples, logins, policy, accept_reanchor, accept_proactive)
+    return records
+
+
+def run(histories, model_path, policy=DEFAULT_POLICY, accept_reanchor=True, accept_proactive=True, workers=None):
+    """Simulates every user in parallel; returns {user: records}."""
+    tasks = [(enroll, logins, policy, accept_reanchor, accept_proactive) for enroll, logins in histories.values()]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_path,)) as executor:
+        return dict(zip(histories, executor.map(_simulate_task, tasks)))
+
+
+def summarize(results, elapsed):
+    records = [r for user_records in results.values() for r in user_records]
+    genuine = np.array([r['genuine'] for r in records], dtype=bool)
+    accepted = np.array([r['accepted'] for r in records], dtype=bool)
+    costs = np.array([r['cost_ms'] for r in records])
+    events = [e for r in records for e in r['events'].split(';') if e]
+    dispositions = [r['disposition'] for r in records if r['disposition']]
+
+    # Mean health across users at evenly spaced points of each user's own history
+    checkpoints = np.linspace(0, 1, HEALTH_CHECKPOINTS)
+    health_curve = np.mean([np.interp(checkpoints, np.linspace(0, 1, len(user_records)), [r['health'] for r in user_records])
+                            for user_records in results.values() if user_records], axis=0)
+    return {
+        "users": len(results),
+        "sessions": len(records),
+        "genuine_sessions": int(genuine.sum()),
+        "impostor_sessions": int((~genuine).sum()),
+        "frr": float((~accepted[genuine]).mean()) if genuine.any() else 0.0,
+        "far": float(accepted[~genuine].mean()) if (~genuine).any() else 0.0,
+        "step_up_rate": float(np.mean([r['stepped_up'] for r in records])) if records else 0.0,
+        "dispositions": {d: dispositions.count(d) for d in sorted(set(dispositions))},
+        "events": {e: events.count(e) for e in sorted(set(events))},
+        "threshold_modes": {m: sum(r['threshold_mode'] == m for r in records) for m in ("NORMAL", "STRICT", "LENIENT")},
+        "health_curve": [round(float(h), 2) for h in health_curve],
+        "final_health": {user: round(float(user_records[-1]['health']), 2) for user, user_records in results.items() if user_records},
+        "cost_ms": {"mean": float(costs.mean()), "p50": float(np.percentile(costs, 50)), "p95": float(np.percentile(costs, 95))} if len(costs) else {},
+        "seconds": elapsed,
+        "sessions_per_second": len(records) / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def write_outputs(out_dir, summary, results):
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    columns = ['user', 'session', 'genuine', 'accepted', 'stepped_up', 'svm_adaptive', 'svm_anchor', 'threshold_mode',
+               'dynamic_svm_threshold', 'disposition', 'events', 'health', 'health_consistency', 'health_performance',
+               'drift_counter', 'anomaly_count', 'cost_ms']
+    with open(os.path.join(out_dir, 'sessions.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for user, user_records in results.items():
+            for session, r in enumerate(user_records):
+                writer.writerow([user, session] + [r[c] for c in columns[2:]])
+    # Per-login score matrix in the policy_sim.py session format
+    records = [r for user_records in results.values() for r in user_records]
+    keys = ['genuine', 'accepted', 'svm_adaptive', 'cos_adaptive', 'euc_adaptive', 'svm_anchor', 'cos_anchor', 'euc_anchor',
+            'svm_threshold', 'cosine_threshold', 'distance_threshold', 'consistency', 'window_size', 'probe', 'anchor', 'window_mean']
+    np.savez(os.path.join(out_dir, 'sessions.npz'), **{k: np.array([r[k] for r in records]) for k in keys})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fast-forward login histories through the adaptive template state machine.")
+    parser.add_argument('corpus', nargs='?', default=None, help="Recorded corpus CSV (see evaluate.py); omit for synthetic typists")
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--out', default='./drift_results')
+    parser.add_argument('--policy', default=None, help="Decision policy JSON (default: built-in constants)")
+    parser.add_argument('--users', type=int, default=20, help="Synthetic users")
+    parser.add_argument('--sessions', type=int, default=500, help="Synthetic logins per user")
+    parser.add_argument('--drift', type=float, default=0.002, help="Synthetic per-session timing drift")
+    parser.add_argument('--noise', type=float, default=0.15, help="Synthetic per-keystroke timing noise")
+    parser.add_argument('--enroll-samples', type=int, default=NUM_ENROLL_SAMPLES)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--time-scale', type=float, default=1.0)
+    parser.add_argument('--impostor-rate', type=float, default=0.0, help="Chance of an impostor attempt before each login")
+    parser.add_argument('--decline-reanchor', action='store_true', help="Genuine users refuse re-anchor prompts")
+    parser.add_argument('--snooze-proactive', action='store_true', help="Genuine users snooze proactive health prompts")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    policy = load_policy(args.policy) if args.policy else dict(DEFAULT_POLICY)
+    if args.corpus:
+        user_samples = {p: chunk_sessions(sessions, args.chunk_size) for p, sessions in read_corpus(args.corpus, args.time_scale).items()}
+        # As in evaluate.py, only participants with enough chunks to enroll and log in at least once take part
+        dropped = sorted(p for p, samples in user_samples.items() if len(samples) <= args.enroll_samples)
+        user_samples = {p: samples for p, samples in user_samples.items() if len(samples) > args.enroll_samples}
+        if dropped:
+            print(f"Skipping {len(dropped)} participants with {args.enroll_samples} or fewer samples: {', '.join(map(str, dropped))}")
+        if not user_samples:
+            sys.exit("No participant has enough samples to enroll")
+    else:
+        rng = np.random.default_rng(args.seed)
+        user_samples = {f"synthetic_{i:03d}": synthetic_typist(rng, args.enroll_samples + args.sessions, args.chunk_size, args.drift, args.noise)
+                        for i in range(args.users)}
+    histories = build_histories(user_samples, args.enroll_samples, args.impostor_rate, args.seed)
+
+    start = time.perf_counter()
+    results = run(histories, args.model, policy, not args.decline_reanchor, not args.snooze_proactive, args.workers)
+    summary = summarize(results, time.perf_counter() - start)
+    write_outputs(args.out, summary, results)
+
+    print(f"Users: {summary['users']}  sessions: {summary['sessions']} ({summary['impostor_sessions']} impostor)  "
+          f"in {summary['seconds']:.2f} s ({summary['sessions_per_second']:.0f}/s)")
+    print(f"FRR {summary['frr']:.2%}  FAR {summary['far']:.2%}  step-up {summary['step_up_rate']:.2%}")
+    print(f"Dispositions: {summary['dispositions']}  events: {summary['events']}")
+    print(f"Threshold modes: {summary['threshold_modes']}")
+    print(f"Health over time: {summary['health_curve']}")
+    if summary['cost_ms']:
+        print(f"Per-session cost: mean {summary['cost_ms']['mean']:.2f} ms  p95 {summary['cost_ms']['p95']:.2f} ms")
+    print(f"Results written to {args.out}")
+    sys.exit(0)
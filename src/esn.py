@@ -0,0 +1,207 @@
+import hashlib
+
+import numpy as np
+
+
+def extract_esn_features(model, sequence, mask):
+    """Runs one scaled timing sequence through the reservoir and returns the mean post-washout state."""
+    W_in, W_res, washout, leak_rate = model['W_input'], model['W_reservoir'], model['washout_period'], model['leak_rate']
+    sequence_length = len(sequence)
+    reservoir_size = W_res.shape[0]
+
+    states = np.zeros((sequence_length, reservoir_size))
+
+    for t in range(1, sequence_length):
+        if mask[t]:
+            u_t = np.array(sequence[t])
+            input_contribution = W_in @ u_t
+            reservoir_contribution = W_res @ states[t-1]
+            new_activation = np.tanh(input_contribution + reservoir_contribution)
+            states[t] = (1 - leak_rate) * states[t-1] + leak_rate * new_activation
+        else:
+            states[t] = states[t-1]
+
+    post_washout_mask = mask[washout:]
+    valid_states = states[washout:][post_washout_mask]
+
+    return np.mean(valid_states, axis=0) if len(valid_states) > 0 else states[-1]
+
+
+def extract_esn_features_batch(model, sequences, masks=None, W_in=None, input_bias=0.0):
+    """Batched extract_esn_features: all sequences advance through the reservoir together.
+
+    Sequences are right-padded to a common length; padded steps are masked out,
+    which holds the state exactly as a masked step does in the single-sequence path.
+    `W_in` and `input_bias` replace the model's input weights, e.g. with the folded ones.
+    """
+    W_in = model['W_input'] if W_in is None else W_in
+    W_res, washout, leak_rate = model['W_reservoir'], model['washout_period'], model['leak_rate']
+    batch_size = len(sequences)
+    reservoir_size = W_res.shape[0]
+    lengths = np.array([len(s) for s in sequences])
+    max_length = int(lengths.max()) if batch_size else 0
+
+    inputs = np.zeros((batch_size, max_length, W_in.shape[1]))
+    full_mask = np.zeros((batch_size, max_length), dtype=bool)
+    for b, sequence in enumerate(sequences):
+        inputs[b, :lengths[b]] = sequence
+        full_mask[b, :lengths[b]] = True if masks is None else masks[b]
+
+    # Input projections for every step at once; only the recurrence stays sequential
+    input_contributions = inputs @ W_in.T + input_bias
+    state = np.zeros((batch_size, reservoir_size))
+    state_sums = np.zeros((batch_size, reservoir_size))
+    state_counts = np.zeros(batch_size)
+    for t in range(max_length):
+        if t > 0:
+            new_activation = np.tanh(input_contributions[:, t] + state @ W_res.T)
+            updated = (1 - leak_rate) * state + leak_rate * new_activation
+            state = np.where(full_mask[:, t, None], updated, state)
+        if t >= washout:
+            state_sums += state * full_mask[:, t, None]
+            state_counts += full_mask[:, t]
+
+    # With no post-washout states the single-sequence path falls back to its last state
+    features = state.copy()
+    has_states = state_counts > 0
+    features[has_states] = state_sums[has_states] / state_counts[has_states, None]
+    return features
+
+
+def embedding_dim(model):
+    """Length of the model's embeddings: the reservoir size, or k for a projected model."""
+    projection = model.get('projection')
+    return model['W_reservoir'].shape[0] if projection is None else projection['components'].shape[0]
+
+
+def _embed_with_scalers(model, samples):
+    """The sklearn path: scale the timings, run the reservoir, scale (and project) the pooled state."""
+    arrays = [np.array(s) for s in samples]
+    scaled = np.split(model['input_scaler'].transform(np.vstack(arrays)), np.cumsum([len(a) for a in arrays])[:-1])
+    features = model['feature_scaler'].transform(extract_esn_features_batch(model, scaled))
+    projection = model.get('projection')
+    return features if projection is None else (features - projection['mean']) @ projection['components'].T
+
+
+# Both scalers are per-feature affine maps, so they fold into the model's linear algebra:
+# W_in @ (u * g + c) == (W_in * g) @ u + W_in @ c puts the input scaler into W_input plus a
+# bias added on every reservoir step, and the feature scaler becomes a gain and offset on the
+# pooled state, i.e. directly in template space. An optional PCA projection (compress_model.py)
+# is affine too and merges with the feature scaler into one matrix. Inference makes no sklearn calls.
+# The folded maps live under model['compiled'], so the fingerprint still sees the original model.
+FOLD_CHECK_SAMPLES = 8
+FOLD_CHECK_TOLERANCE = 1e-8
+
+
+def _affine_parameters(scaler, dim):
+    """(gain, offset) with scaler.transform(x) == x * gain + offset, read off the transform itself."""
+    offset = scaler.transform(np.zeros((1, dim)))[0]
+    gain = scaler.transform(np.eye(dim)) - offset
+    if not np.allclose(gain, np.diag(np.diag(gain))):
+        raise ValueError(f"{type(scaler).__name__} is not a per-feature affine map and cannot be folded")
+    return np.diag(gain).copy(), offset
+
+
+def compile_model(model):
+    """Folds the scalers into the model (see above) and checks the result against the sklearn path.
+
+    Raises ValueError if the folded embedding differs by more than FOLD_CHECK_TOLERANCE.
+    """
+    W_in = model['W_input']
+    input_gain, input_offset = _affine_parameters(model['input_scaler'], W_in.shape[1])
+    feature_gain, feature_offset = _affine_parameters(model['feature_scaler'], model['W_reservoir'].shape[0])
+    compiled = {"W_input": W_in * input_gain, "input_bias": W_in @ input_offset,
+                "feature_gain": feature_gain, "feature_bias": feature_offset, "feature_map": None}
+    projection = model.get('projection')
+    if projection is not None:
+        # ((x * g + c) - mean) @ P.T == x @ (g * P).T + (c - mean) @ P.T
+        compiled.update(feature_map=(feature_gain * projection['components']).T,
+                        feature_bias=(feature_offset - projection['mean']) @ projection['components'].T)
+
+    # Probe timings that the input scaler maps to standard normal values
+    rng = np.random.default_rng(0)
+    length = model['washout_period'] + 20
+    samples = [(rng.standard_normal((length, W_in.shape[1])) - input_offset) / input_gain for _ in range(FOLD_CHECK_SAMPLES)]
+    expected = _embed_with_scalers(model, samples)
+    error = np.max(np.abs(_embed_compiled(model, compiled, samples) - expected))
+    if error > FOLD_CHECK_TOLERANCE:
+        raise ValueError(f"Folded scalers diverge from the sklearn path by {error:.3g}")
+    model['compiled'] = compiled
+    return model
+
+
+def _embed_compiled(model, compiled, samples):
+    states = extract_esn_features_batch(model, [np.asarray(s, dtype=float) for s in samples],
+                                        W_in=compiled['W_input'], input_bias=compiled['input_bias'])
+    if compiled['feature_map'] is not None:
+        return states @ compiled['feature_map'] + compiled['feature_bias']
+    return states * compiled['feature_gain'] + compiled['feature_bias']
+
+
+def embed_samples(model, samples):
+    """Embeds many timing samples with one reservoir pass, through the folded scalers."""
+    compiled = model.get('compiled') or compile_model(model)['compiled']
+    return _embed_compiled(model, compiled, samples)
+
+
+def embed_sample(model, timings):
+    return embed_samples(model, [timings])[0]
+
+
+def cosine_similarity(v1, v2):
+    norm = np.linalg.norm(v1) * np.linalg.norm(v2)
+    return float(np.dot(v1, v2) / norm) if norm > 0 else 0.0
+
+
+def euclidean_distance(v1, v2):
+    return float(np.linalg.norm(v1 - v2))
+
+
+def pairwise_scores(model, vectors):
+    """SVM, cosine and euclidean scores for every unordered pair, in itertools.combinations order."""
+    vectors = np.asarray(vectors, dtype=float)
+    first, second = np.triu_indices(len(vectors), k=1)
+    if first.size == 0:
+        return np.array([]), np.array([]), np.array([])
+    differences = vectors[first] - vectors[second]
+    svm_scores = model['svm_classifier'].predict_proba(np.abs(differences))[:, 1]
+    norms = np.linalg.norm(vectors, axis=1)
+    norm_products = norms[first] * norms[second]
+    dots = np.einsum('ij,ij->i', vectors[first], vectors[second])
+    cos_sims = np.divide(dots, norm_products, out=np.zeros_like(dots), where=norm_products > 0)
+    euc_dists = np.linalg.norm(differences, axis=1)
+    return svm_scores, cos_sims, euc_dists
+
+
+def model_fingerprint(model):
+    """Short digest of everything that shapes stored embeddings and their scores: reservoir, scalers, projection and SVM.
+
+    The scalers are hashed through the gain and offset they apply, so any per-feature affine scaler
+    that compile_model can fold is covered. The SVM contributes its hyperparameters and the Platt
+    calibration, on which predict_proba depends, as well as its fitted coefficients.
+    """
+    digest = hashlib.sha256()
+
+    def update(array):
+        digest.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+
+    for array in (model['W_input'], model['W_reservoir'], [model['washout_period'], model['leak_rate']]):
+        update(array)
+    for scaler, dim in ((model['input_scaler'], model['W_input'].shape[1]), (model['feature_scaler'], model['W_reservoir'].shape[0])):
+        for array in _affine_parameters(scaler, dim):
+            update(array)
+    projection = model.get('projection')
+    if projection is not None:
+        for array in (projection['mean'], projection['components']):
+            update(array)
+    svm = model['svm_classifier']
+    digest.update(f"{type(svm).__name__}{sorted(svm.get_params().items())!r}".encode('utf-8'))
+    for name in ('support_vectors_', 'dual_coef_', 'intercept_', '_gamma'):
+        if hasattr(svm, name):
+            update(getattr(svm, name))
+    # The Platt calibration, read from the fields behind probA_/probB_, which newer scikit-learn deprecates
+    for stored, public in (('_probA', 'probA_'), ('_probB', 'probB_')):
+        value = vars(svm)[stored] if stored in vars(svm) else getattr(svm, public, None)
+        if value is not None:
+            update(value)
+    return digest.hexdigest()[:16]
@@ -0,0 +1,280 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import tempfile
+from statistics import NormalDist
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from config import MODEL_PATH, NUM_ENROLL_SAMPLES
+from esn import embed_samples
+from reservoir import read_model
+from auth_core import process_events_to_features, enroll_vectors, score_against_templates, is_match, decide
+
+
+# Offline evaluation: replays a keystroke corpus through enrollment and verification for every
+# genuine and impostor pair, then reports ROC/DET curves, EER and per-stage throughput.
+#
+# Two CSV layouts are accepted:
+#   events  : participant, session, key, press_time, release_time (one row per keystroke)
+#   digraphs: participant, session, DU.key1.key1, DD.key1.key2, DU.key1.key2, UD.key1.key2, UU.key1.key2
+#             (the KeyRecs free-text layout; one row per consecutive key pair)
+EVENT_COLUMNS = ('key', 'press_time', 'release_time')
+DIGRAPH_COLUMNS = ('DU.key1.key1', 'DD.key1.key2', 'DU.key1.key2', 'UD.key1.key2', 'UU.key1.key2')
+DEFAULT_CHUNK_SIZE = 130 # Digraphs per sample, close to one typed quote in the app
+
+_WORKER_MODEL = None
+_WORKER_VECTORS = None
+
+
+def read_corpus(path, time_scale=1.0):
+    """Returns {participant: [timing array per session]} in file order."""
+    sessions = {}
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(f)
+        columns = set(reader.fieldnames or [])
+        if set(DIGRAPH_COLUMNS) <= columns:
+            for row in reader:
+                timings = [max(0.0, float(row[c]) * time_scale) for c in DIGRAPH_COLUMNS]
+                sessions.setdefault(row['participant'], {}).setdefault(row.get('session', ''), []).append(timings)
+            return {p: [np.array(rows) for rows in by_session.values()] for p, by_session in sessions.items()}
+        if not set(EVENT_COLUMNS) <= columns:
+            raise ValueError(f"{path} has neither keystroke event columns {EVENT_COLUMNS} nor digraph columns {DIGRAPH_COLUMNS}")
+        for row in reader:
+            event = (row['key'], float(row['press_time']) * time_scale, float(row['release_time']) * time_scale)
+            sessions.setdefault(row['participant'], {}).setdefault(row.get('session', ''), []).append(event)
+    corpus = {}
+    for participant, by_session in sessions.items():
+        for events in by_session.values():
+            timings = process_events_to_features(sorted(events, key=lambda e: e[1]))
+            if timings:
+                corpus.setdefault(participant, []).append(np.array(timings))
+    return corpus
+
+
+def chunk_sessions(sessions, chunk_size):
+    """Splits each session into fixed-size samples; tails shorter than half a chunk are dropped."""
+    chunks = []
+    for timings in sessions:
+        for start in range(0, len(timings), chunk_size):
+            chunk = timings[start:start + chunk_size]
+            if len(chunk) >= max(2, chunk_size // 2):
+                chunks.append(chunk)
+    return chunks
+
+
+def _init_worker(model_path):
+    global _WORKER_MODEL
+    _WORKER_MODEL = read_model(model_path)
+
+
+def _worker_vectors(vectors_path):
+    global _WORKER_VECTORS
+    if _WORKER_VECTORS is None or _WORKER_VECTORS[0] != vectors_path:
+        _WORKER_VECTORS = (vectors_path, np.load(vectors_path, mmap_mode='r'))
+    return _WORKER_VECTORS[1]
+
+
+def _timed_task(fn):
+    def task(args):
+        start = time.perf_counter()
+        result = fn(args)
+        return result, time.perf_counter() - start
+    return task
+
+
+def _embed_task(samples):
+    return _timed_task(lambda s: embed_samples(_WORKER_MODEL, s))(samples)
+
+
+def _enroll_task(samples):
+    def enroll(s):
+        _, anchor, thresholds, baseline_variability = enroll_vectors(_WORKER_MODEL, s)
+        return anchor, thresholds, baseline_variability
+    return _timed_task(enroll)(samples)
+
+
+def _verify_task(args):
+    return _timed_task(_verify)(args)
+
+
+def _verify(args):
+    anchor, thresholds, probe_indices, vectors_path = args
+    probes = np.asarray(_worker_vectors(vectors_path)[probe_indices])
+    svm, cos, euc = score_against_templates(_WORKER_MODEL, probes, np.broadcast_to(anchor, probes.shape))
+    # Fresh profiles have an empty rolling window, so the adaptive template equals the anchor
+    matched = is_match(svm, cos, euc, thresholds['svm_threshold'], thresholds['cosine_threshold'], thresholds['distance_threshold'])
+    accepted, _, _ = decide(svm, svm, matched, matched)
+    return svm, cos, euc, accepted
+
+
+def roc_curve(labels, scores):
+    """(fpr, tpr, thresholds) with one point per distinct score, highest threshold first."""
+    order = np.argsort(-scores, kind='mergesort')
+    labels, scores = labels[order], scores[order]
+    distinct = np.r_[np.flatnonzero(np.diff(scores)), len(scores) - 1]
+    tps = np.cumsum(labels)[distinct]
+    fps = (distinct + 1) - tps
+    positives, negatives = max(labels.sum(), 1), max(len(labels) - labels.sum(), 1)
+    return np.r_[0.0, fps / negatives], np.r_[0.0, tps / positives], np.r_[np.inf, scores[distinct]]
+
+
+def equal_error_rate(fpr, tpr):
+    """Linearly interpolated point where FAR (fpr) equals FRR (1 - tpr)."""
+    fnr = 1 - tpr
+    crossing = np.flatnonzero(fnr - fpr <= 0)
+    if crossing.size == 0:
+        return 1.0
+    i = crossing[0]
+    if i == 0:
+        return float(fpr[0])
+    d0, d1 = fnr[i - 1] - fpr[i - 1], fnr[i] - fpr[i]
+    w = d0 / (d0 - d1) if d0 != d1 else 0.0
+    return float(fpr[i - 1] + w * (fpr[i] - fpr[i - 1]))
+
+
+def _timed_map(executor, fn, tasks, stage, throughput, items=None):
+    """Maps `fn` over the pool, recording wall time and the summed in-worker compute time."""
+    start = time.perf_counter()
+    outputs = list(executor.map(fn, tasks))
+    elapsed = time.perf_counter() - start
+    items = len(tasks) if items is None else items
+    compute = sum(seconds for _, seconds in outputs)
+    throughput[stage] = {"items": items, "seconds": elapsed, "worker_seconds": compute,
+                         "items_per_second": items / elapsed if elapsed else 0.0,
+                         "items_per_worker_second": items / compute if compute else 0.0}
+    return [result for result, _ in outputs]
+
+
+def evaluate(corpus, model_path, enroll_samples=NUM_ENROLL_SAMPLES, chunk_size=DEFAULT_CHUNK_SIZE,
+             max_impostor_probes=None, workers=None, seed=0):
+    """Runs the full genuine/impostor replay and returns (summary, per-probe score arrays)."""
+    rng = np.random.default_rng(seed)
+    participants = sorted(p for p, sessions in corpus.items() if len(chunk_sessions(sessions, chunk_size)) > enroll_samples)
+    if len(participants) < 2:
+        raise ValueError("Need at least two participants with more than the enrollment samples to evaluate.")
+    samples = {p: chunk_sessions(corpus[p], chunk_size) for p in participants}
+    throughput = {}
+
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_path,)) as executor:
+        enroll_results = _timed_map(executor, _enroll_task, [samples[p][:enroll_samples] for p in participants], 'enroll', throughput)
+        probe_samples = [samples[p][enroll_samples:] for p in participants]
+        probe_vectors = _timed_map(executor, _embed_task, probe_samples, 'embed_probes', throughput,
+                                   items=sum(len(s) for s in probe_samples))
+
+        # Probe vectors go to a memory-mapped file so verify workers don't each receive a copy
+        owners = np.concatenate([np.full(len(v), i) for i, v in enumerate(probe_vectors)])
+        vectors_path = os.path.join(tmp_dir, 'probe_vectors.npy')
+        np.save(vectors_path, np.vstack(probe_vectors))
+
+        tasks = []
+        for user_index, (anchor, thresholds, _) in enumerate(enroll_results):
+            genuine = np.flatnonzero(owners == user_index)
+            impostor = np.flatnonzero(owners != user_index)
+            if max_impostor_probes is not None and impostor.size > max_impostor_probes:
+                impostor = np.sort(rng.choice(impostor, max_impostor_probes, replace=False))
+            tasks.append((anchor, thresholds, np.r_[genuine, impostor], vectors_path))
+        verify_results = _timed_map(executor, _verify_task, tasks, 'verify', throughput, items=sum(len(t[2]) for t in tasks))
+
+    claimed = np.concatenate([np.full(len(t[2]), i) for i, t in enumerate(tasks)])
+    actual = owners[np.concatenate([t[2] for t in tasks])]
+    scores = {
+        "claimed_user": claimed,
+        "actual_user": actual,
+        "genuine": claimed == actual,
+        "svm": np.concatenate([r[0] for r in verify_results]),
+        "cos": np.concatenate([r[1] for r in verify_results]),
+        "euc": np.concatenate([r[2] for r in verify_results]),
+        "accepted": np.concatenate([r[3] for r in verify_results]),
+        "svm_threshold": np.array([enroll_results[i][1]['svm_threshold'] for i in claimed]),
+        "cosine_threshold": np.array([enroll_results[i][1]['cosine_threshold'] for i in claimed]),
+        "distance_threshold": np.array([enroll_results[i][1]['distance_threshold'] for i in claimed]),
+    }
+
+    genuine, accepted = scores['genuine'], scores['accepted']
+    fpr, tpr, _ = roc_curve(genuine.astype(int), scores['svm'])
+    far = float(accepted[~genuine].mean()) if (~genuine).any() else 0.0
+    frr = float((~accepted[genuine]).mean()) if genuine.any() else 0.0
+    summary = {
+        "participants": len(participants),
+        "genuine_probes": int(genuine.sum()),
+        "impostor_probes": int((~genuine).sum()),
+        "svm_auc": float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2)),
+        "svm_eer": equal_error_rate(fpr, tpr),
+        "policy_far": far,
+        "policy_frr": frr,
+        "policy_accuracy": float((accepted == genuine).mean()),
+        "throughput": throughput,
+    }
+    return summary, scores, (fpr, tpr)
+
+
+def write_outputs(out_dir, summary, scores, roc, plots=False):
+    os.makedirs(out_dir, exist_ok=True)
+    fpr, tpr = roc
+    with open(os.path.join(out_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    np.savez(os.path.join(out_dir, 'scores.npz'), **scores)
+    with open(os.path.join(out_dir, 'roc.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['fpr', 'tpr'])
+        writer.writerows(zip(fpr, tpr))
+    with open(os.path.join(out_dir, 'det.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['far', 'frr'])
+        writer.writerows(zip(fpr, 1 - tpr))
+    if plots:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        fig, (roc_ax, det_ax) = plt.subplots(1, 2, figsize=(10, 5))
+        roc_ax.plot(fpr, tpr, color='#5865F2')
+        roc_ax.plot([0, 1], [0, 1], linestyle='--', color='#A0A0A0')
+        roc_ax.set(xlabel='False Accept Rate', ylabel='True Accept Rate', title=f"ROC (AUC {summary['svm_auc']:.4f})")
+        # DET on normal-deviate axes, clipped away from 0/1 where the probit is infinite
+        probit = np.vectorize(NormalDist().inv_cdf)
+        frr = np.clip(1 - tpr, 1e-4, 1 - 1e-4)
+        det_ax.plot(probit(np.clip(fpr, 1e-4, 1 - 1e-4)), probit(frr), color='#5865F2')
+        ticks = [0.001, 0.01, 0.05, 0.2, 0.5]
+        det_ax.set_xticks(probit(ticks), [f"{t:.1%}" for t in ticks])
+        det_ax.set_yticks(probit(ticks), [f"{t:.1%}" for t in ticks])
+        det_ax.set(xlabel='False Accept Rate', ylabel='False Reject Rate', title=f"DET (EER {summary['svm_eer']:.2%})")
+        fig.tight_layout()
+        fig.savefig(os.path.join(out_dir, 'roc_det.png'), dpi=120)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a keystroke corpus and report ROC/DET, EER and throughput.")
+    parser.add_argument('corpus', help="CSV of keystroke events or KeyRecs-style digraph timings")
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--out', default='./eval_results')
+    parser.add_argument('--enroll-samples', type=int, default=NUM_ENROLL_SAMPLES)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--time-scale', type=float, default=1.0, help="Multiplier converting corpus times to seconds (0.001 for ms)")
+    parser.add_argument('--max-impostor-probes', type=int, default=None, help="Per-user cap on impostor probes (default: all)")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--plots', action='store_true', help="Also write roc_det.png (requires matplotlib)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    corpus = read_corpus(args.corpus, args.time_scale)
+    load_seconds = time.perf_counter() - start
+    summary, scores, roc = evaluate(corpus, args.model, args.enroll_samples, args.chunk_size,
+                                    args.max_impostor_probes, args.workers, args.seed)
+    summary['throughput']['load_corpus'] = {"items": sum(len(s) for s in corpus.values()), "seconds": load_seconds}
+    write_outputs(args.out, summary, scores, roc, args.plots)
+
+    print(f"Participants: {summary['participants']}  genuine probes: {summary['genuine_probes']}  impostor probes: {summary['impostor_probes']}")
+    print(f"SVM AUC: {summary['svm_auc']:.4f}  SVM EER: {summary['svm_eer']:.2%}")
+    print(f"Decision policy: FAR {summary['policy_far']:.2%}  FRR {summary['policy_frr']:.2%}  accuracy {summary['policy_accuracy']:.2%}")
+    for stage, stats in summary['throughput'].items():
+        worker_rate = f"  ({stats['items_per_worker_second']:.1f}/worker-s)" if 'items_per_worker_second' in stats else ""
+        print(f"  {stage:<14} {stats['items']:>8} items in {stats['seconds']:.2f} s{worker_rate}")
+    print(f"Results written to {args.out}")
+    sys.exit(0)
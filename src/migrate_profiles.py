@@ -0,0 +1,136 @@
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, UTC
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from config import MODEL_PATH, TEMPLATE_DIR, ANCHOR_INDEX_ENABLED
+from esn import embed_samples, model_fingerprint, embedding_dim
+from reservoir import read_model
+from auth_core import enrollment_from_vectors, apply_event
+from profile_store import ProfileStore, profile_key
+
+
+# Offline profile migration for model rollouts. Every profile header records the fingerprint of
+# the model that embedded it; this tool scans the headers, reports stale profiles and, with
+# --apply, re-embeds the raw enrollment timings retained in each stale profile with the new model.
+# Users are migrated in chunks, one process per chunk, and each chunk's samples share a single
+# batched reservoir pass. The rolling window and quarantine cannot be carried across models and
+# restart empty, as after a re-anchor.
+DEFAULT_USERS_PER_TASK = 16
+
+_WORKER_MODEL = None
+_WORKER_FINGERPRINT = None
+
+
+def list_profiles(template_dir):
+    return sorted(name[:-len('.dat')] for name in os.listdir(template_dir) if name.endswith('.dat'))
+
+
+def scan_profile(args):
+    """Classifies one profile as current, stale, stale-no-timings, unstamped, unstamped-no-timings or error.
+
+    Read-only: a profile without a keyring secret is reported as an error rather than given one.
+    """
+    username, template_dir, fingerprint, embedding_size = args
+    try:
+        store = ProfileStore(username, profile_key(username, create=False), template_dir)
+        header = store.read_header()
+        stored = header.get('model_fingerprint')
+        if stored == fingerprint:
+            return {"username": username, "version": header['version'], "model_fingerprint": stored, "status": "current"}
+        profile = store.load()
+        status = "stale" if stored is not None or profile['esn_anchor'].shape[0] != embedding_size else "unstamped"
+        if not profile.get('enrollment_samples'):
+            status += "-no-timings"
+        return {"username": username, "version": header['version'], "model_fingerprint": stored, "status": status}
+    except Exception as e:
+        return {"username": username, "version": None, "model_fingerprint": None, "status": "error", "error": str(e)}
+
+
+def _init_worker(model_path):
+    global _WORKER_MODEL, _WORKER_FINGERPRINT
+    _WORKER_MODEL = read_model(model_path)
+    _WORKER_FINGERPRINT = model_fingerprint(_WORKER_MODEL)
+
+
+def migrate_chunk(args):
+    """Re-embeds the retained enrollment timings of a chunk of users in one reservoir pass.
+
+    An unstamped profile whose anchor the current model reproduces from those timings is only
+    stamped, keeping its adaptive state; any other profile is migrated. Returns (migrated, stamped, seconds).
+    """
+    usernames, template_dir = args
+    start = time.perf_counter()
+    stores = [ProfileStore(u, profile_key(u, create=False), template_dir) for u in usernames]
+    profiles = [store.load() for store in stores]
+    samples = [profile['enrollment_samples'] for profile in profiles]
+    vectors = embed_samples(_WORKER_MODEL, [s for user_samples in samples for s in user_samples])
+    offsets = np.cumsum([len(user_samples) for user_samples in samples])[:-1]
+
+    timestamp = datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
+    migrated, stamped = [], []
+    for store, profile, user_vectors in zip(stores, profiles, np.split(vectors, offsets)):
+        anchor, thresholds, baseline_variability = enrollment_from_vectors(_WORKER_MODEL, user_vectors)
+        if profile.get('model_fingerprint') is None and np.allclose(anchor, profile['esn_anchor'], rtol=1e-9, atol=1e-12):
+            profile['model_fingerprint'] = _WORKER_FINGERPRINT
+            store.write_snapshot(profile)
+            stamped.append(store.username)
+            continue
+        event = {"event_type": "MODEL_MIGRATED", "from_fingerprint": profile.get('model_fingerprint'),
+                 "model_fingerprint": _WORKER_FINGERPRINT, "anchor": anchor, "thresholds": thresholds,
+                 "baseline_variability": baseline_variability}
+        apply_event(profile, event)
+        store.append_events(profile, [event], timestamp=timestamp)
+        store.write_snapshot(profile)
+        migrated.append(store.username)
+    return migrated, stamped, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report profiles embedded by another model and re-embed them from retained enrollment timings.")
+    parser.add_argument('--model', default=MODEL_PATH, help="The model being rolled out")
+    parser.add_argument('--template-dir', default=TEMPLATE_DIR)
+    parser.add_argument('--apply', action='store_true', help="Migrate stale profiles and verify unstamped ones (default: report only)")
+    parser.add_argument('--users-per-task', type=int, default=DEFAULT_USERS_PER_TASK)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    model = read_model(args.model)
+    fingerprint = model_fingerprint(model)
+    usernames = list_profiles(args.template_dir)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(args.model,)) as executor:
+        reports = list(executor.map(scan_profile, [(u, args.template_dir, fingerprint, embedding_dim(model)) for u in usernames]))
+        scan_seconds = time.perf_counter() - start
+
+        print(f"Model {fingerprint}: {len(reports)} profiles scanned in {scan_seconds:.2f} s")
+        for report in reports:
+            detail = f"  ({report['error']})" if report['status'] == "error" else ""
+            print(f"  {report['username']:<24} v{report['version']}  {str(report['model_fingerprint']):<16}  {report['status']}{detail}")
+        statuses = ("current", "unstamped", "unstamped-no-timings", "stale", "stale-no-timings", "error")
+        counts = {status: sum(r['status'] == status for r in reports) for status in statuses}
+        print("  " + "  ".join(f"{status}: {count}" for status, count in counts.items()))
+
+        # Unstamped profiles are checked against the model and only stamped if it reproduces their anchor
+        pending = [r['username'] for r in reports if r['status'] in ("stale", "unstamped")]
+        if args.apply and pending:
+            start = time.perf_counter()
+            chunks = [pending[i:i + args.users_per_task] for i in range(0, len(pending), args.users_per_task)]
+            migrated = stamped = 0
+            for migrated_users, stamped_users, _ in executor.map(migrate_chunk, [(chunk, args.template_dir) for chunk in chunks]):
+                migrated, stamped = migrated + len(migrated_users), stamped + len(stamped_users)
+            print(f"Migrated {migrated} and verified {stamped} unstamped profiles in {time.perf_counter() - start:.2f} s")
+            if ANCHOR_INDEX_ENABLED and migrated:
+                print("Run anchor_index.py --rebuild to re-index the migrated anchors.")
+        elif pending:
+            print("Run with --apply to migrate the stale profiles and verify the unstamped ones.")
+    if counts["stale-no-timings"]:
+        print(f"{counts['stale-no-timings']} profiles have no retained enrollment timings and must be re-enrolled.")
+    if counts["unstamped-no-timings"]:
+        print(f"{counts['unstamped-no-timings']} unstamped profiles have no retained enrollment timings and cannot be verified.")
+    sys.exit(1 if counts["error"] else 0)
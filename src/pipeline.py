@@ -0,0 +1,50 @@
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+
+
+# Small dependency-graph executor for per-request pipelines. Each stage names the stages whose
+# results it takes as arguments; every stage whose inputs are ready is submitted to the shared
+# thread pool, so independent stages (e.g. profile key derivation and probe embedding) overlap.
+# The calling thread only schedules. Each run returns its stage timings and the critical path:
+# the chain of stages, ending with the last to finish, that set the request's wall time.
+class Pipeline:
+    def __init__(self, executor):
+        self.executor = executor
+        self._stages = {}
+
+    def stage(self, name, fn, *deps):
+        """Adds a stage; fn is called with the results of `deps`, in order."""
+        unknown = [d for d in deps if d not in self._stages]
+        if unknown:
+            raise ValueError(f"Stage {name} depends on undefined stages: {', '.join(unknown)}")
+        self._stages[name] = (fn, deps)
+        return self
+
+    @staticmethod
+    def _timed(fn, args, origin):
+        start = time.perf_counter() - origin
+        result = fn(*args)
+        return result, (start, time.perf_counter() - origin)
+
+    def run(self):
+        """Runs every stage. Returns (results by stage, report); a stage's exception is re-raised."""
+        origin = time.perf_counter()
+        pending, running, results, spans = dict(self._stages), {}, {}, {}
+        while pending or running:
+            for name in [n for n, (_, deps) in pending.items() if all(d in results for d in deps)]:
+                fn, deps = pending.pop(name)
+                running[self.executor.submit(self._timed, fn, [results[d] for d in deps], origin)] = name
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                results[name], spans[name] = future.result()
+        return results, self.report(spans, time.perf_counter() - origin)
+
+    def report(self, spans, wall_seconds):
+        """Stage durations, the critical path and how much of the summed stage time overlapping saved."""
+        path = [max(spans, key=lambda n: spans[n][1])]
+        while self._stages[path[-1]][1]:
+            path.append(max(self._stages[path[-1]][1], key=lambda d: spans[d][1]))
+        durations = {name: (end - start) * 1000 for name, (start, end) in spans.items()}
+        return {"wall_ms": wall_seconds * 1000, "stage_ms": durations, "critical_path": path[::-1],
+                "overlap_ms": max(0.0, sum(durations.values()) - wall_seconds * 1000)}
@@ -0,0 +1,184 @@
+import sys
+import json
+import time
+import argparse
+import itertools
+
+import numpy as np
+
+from config import MODEL_PATH
+from reservoir import read_model
+from auth_core import (DEFAULT_POLICY, load_policy, threshold_mode, dynamic_thresholds, is_match, decide,
+                       score_against_templates)
+
+
+# Threshold-policy simulator: replays recorded login scores under thousands of candidate
+# decision policies at once. Sessions are the columns and policies the rows of every
+# array, so a whole grid is a handful of numpy operations per chunk of policies.
+#
+# Session files are .npz archives with one entry per login:
+#   genuine, svm_threshold, cosine_threshold, distance_threshold            (required)
+#   svm_adaptive/cos_adaptive/euc_adaptive, svm_anchor/cos_anchor/euc_anchor (or svm/cos/euc
+#       as written by evaluate.py, where the adaptive template is the anchor)
+#   consistency, window_size                                                 (rolling window state)
+#   probe, anchor, window_mean                                               (needed to sweep anchor_weight)
+MULTIPLIER_NAMES = ('svm', 'cos', 'dist')
+GRID_PARAMETERS = ('confidence_floor', 'suspicious_threshold', 'anchor_weight') + tuple(
+    f"{kind}_{name}" for kind in ('strict', 'lenient') for name in MULTIPLIER_NAMES)
+CHUNK_ELEMENTS = 4_000_000 # policies x sessions evaluated per step
+
+
+def flatten_policy(policy):
+    """Policy dict -> {grid parameter: value}."""
+    flat = {'confidence_floor': policy['confidence_floor'], 'suspicious_threshold': policy['suspicious_threshold'],
+            'anchor_weight': policy['anchor_weight']}
+    for kind in ('strict', 'lenient'):
+        for name, value in zip(MULTIPLIER_NAMES, policy[f"{kind}_multipliers"]):
+            flat[f"{kind}_{name}"] = value
+    return flat
+
+
+def policy_from_parameters(parameters, base=DEFAULT_POLICY):
+    """{grid parameter: value} -> policy dict in the load_policy format."""
+    policy = dict(base)
+    policy['confidence_floor'] = float(parameters['confidence_floor'])
+    policy['suspicious_threshold'] = float(parameters['suspicious_threshold'])
+    if parameters['anchor_weight'] != base['anchor_weight']:
+        policy['anchor_weight'] = float(parameters['anchor_weight'])
+        policy['window_weight'] = 1.0 - policy['anchor_weight']
+    for kind in ('strict', 'lenient'):
+        policy[f"{kind}_multipliers"] = tuple(float(parameters[f"{kind}_{name}"]) for name in MULTIPLIER_NAMES)
+    return policy
+
+
+def parse_grid_values(spec):
+    """'0.5,0.6,0.7' or 'start:stop:step' (stop inclusive) -> array."""
+    if ':' in spec:
+        start, stop, step = (float(v) for v in spec.split(':'))
+        return np.round(np.arange(start, stop + step / 2, step), 10)
+    return np.array([float(v) for v in spec.split(',')])
+
+
+def load_sessions(path):
+    with np.load(path) as data:
+        sessions = {key: data[key] for key in data.files}
+    if 'svm_anchor' not in sessions:
+        for metric in ('svm', 'cos', 'euc'):
+            sessions[f"{metric}_adaptive"] = sessions[f"{metric}_anchor"] = sessions[metric]
+    count = len(sessions['genuine'])
+    sessions['genuine'] = sessions['genuine'].astype(bool)
+    sessions.setdefault('consistency', np.zeros(count))
+    sessions.setdefault('window_size', np.zeros(count, dtype=int))
+    return sessions
+
+
+def _adaptive_scores(model, sessions, anchor_weight):
+    """Re-scores every probe against the adaptive template for one anchor weight."""
+    anchors, window_means = sessions['anchor'], sessions['window_mean']
+    has_window = (sessions['window_size'] > 0)[:, None]
+    templates = np.where(has_window, anchor_weight * anchors + (1.0 - anchor_weight) * window_means, anchors)
+    return score_against_templates(model, sessions['probe'], templates)
+
+
+def simulate(sessions, grid, base_policy=DEFAULT_POLICY, model=None):
+    """Evaluates every combination in `grid` ({parameter: values}); unlisted parameters keep base_policy.
+
+    Returns (parameters, metrics): dicts of arrays with one entry per combination.
+    """
+    unknown = set(grid) - set(GRID_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown grid parameters: {', '.join(sorted(unknown))}")
+    base = flatten_policy(base_policy)
+    axes = [np.atleast_1d(np.asarray(grid.get(name, [base[name]]), dtype=float)) for name in GRID_PARAMETERS]
+    combos = np.array(list(itertools.product(*axes))) if axes else np.empty((0, len(GRID_PARAMETERS)))
+    parameters = {name: combos[:, i] for i, name in enumerate(GRID_PARAMETERS)}
+
+    genuine = sessions['genuine']
+    svm_t, cos_t, dist_t = sessions['svm_threshold'], sessions['cosine_threshold'], sessions['distance_threshold']
+    mode = threshold_mode(sessions['consistency'], sessions['window_size'])
+    svm_anchor = sessions['svm_anchor']
+    anchor_match = is_match(svm_anchor, sessions['cos_anchor'], sessions['euc_anchor'], svm_t, cos_t, dist_t)
+
+    weights = np.unique(parameters['anchor_weight'])
+    recorded_weight = weights.size == 1 and weights[0] == base['anchor_weight']
+    if not recorded_weight and (model is None or 'window_mean' not in sessions):
+        raise ValueError("Sweeping anchor_weight needs a model and sessions with probe/anchor/window_mean vectors")
+
+    metrics = {name: np.zeros(len(combos)) for name in ('far', 'frr', 'step_up_rate', 'override_rate')}
+    chunk = max(1, CHUNK_ELEMENTS // max(1, len(genuine)))
+    for weight in weights:
+        if recorded_weight:
+            svm_a, cos_a, euc_a = sessions['svm_adaptive'], sessions['cos_adaptive'], sessions['euc_adaptive']
+        else:
+            svm_a, cos_a, euc_a = _adaptive_scores(model, sessions, weight)
+        rows = np.flatnonzero(parameters['anchor_weight'] == weight)
+        for start in range(0, len(rows), chunk):
+            idx = rows[start:start + chunk]
+            column = {name: values[idx, None] for name, values in parameters.items()}
+            strict = tuple(column[f"strict_{name}"] for name in MULTIPLIER_NAMES)
+            lenient = tuple(column[f"lenient_{name}"] for name in MULTIPLIER_NAMES)
+            adaptive_match = is_match(svm_a, cos_a, euc_a, *dynamic_thresholds(svm_t, cos_t, dist_t, mode, strict, lenient))
+            accepted, override, suspicious = decide(svm_a, svm_anchor, adaptive_match, anchor_match,
+                                                    column['confidence_floor'], column['suspicious_threshold'])
+            metrics['far'][idx] = accepted[:, ~genuine].mean(axis=1) if (~genuine).any() else 0.0
+            metrics['frr'][idx] = (~accepted[:, genuine]).mean(axis=1) if genuine.any() else 0.0
+            # Accepted-but-suspicious logins are the ones the app sends to a password step-up
+            metrics['step_up_rate'][idx] = (accepted & suspicious)[:, genuine].mean(axis=1) if genuine.any() else 0.0
+            metrics['override_rate'][idx] = override.mean(axis=1)
+    return parameters, metrics
+
+
+def rank(metrics, max_far):
+    """Combination indices meeting the FAR budget, best first (lowest FRR, then fewest step-ups, then FAR)."""
+    feasible = np.flatnonzero(metrics['far'] <= max_far)
+    order = np.lexsort((metrics['far'][feasible], metrics['step_up_rate'][feasible], metrics['frr'][feasible]))
+    return feasible[order]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search decision-policy parameters over recorded login scores.")
+    parser.add_argument('sessions', help=".npz of per-login scores (e.g. scores.npz from evaluate.py)")
+    parser.add_argument('--grid', nargs='*', default=[], metavar='NAME=VALUES',
+                        help=f"Values as a,b,c or start:stop:step. Names: {', '.join(GRID_PARAMETERS)}")
+    parser.add_argument('--policy', default=None, help="Baseline policy JSON (default: built-in constants)")
+    parser.add_argument('--model', default=MODEL_PATH, help="Only needed to sweep anchor_weight")
+    parser.add_argument('--max-far', type=float, default=0.01)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--write-policy', default=None, help="Write the best policy as JSON (e.g. data/app_data/policy.json)")
+    args = parser.parse_args()
+
+    base_policy = load_policy(args.policy) if args.policy else dict(DEFAULT_POLICY)
+    grid = {}
+    for item in args.grid:
+        name, _, spec = item.partition('=')
+        grid[name] = parse_grid_values(spec)
+    sessions = load_sessions(args.sessions)
+    model = None
+    if 'anchor_weight' in grid:
+        model = read_model(args.model)
+
+    _, baseline = simulate(sessions, {}, base_policy)
+    start = time.perf_counter()
+    parameters, metrics = simulate(sessions, grid, base_policy, model)
+    elapsed = time.perf_counter() - start
+    combos = len(metrics['far'])
+
+    print(f"Sessions: {len(sessions['genuine'])} ({int(sessions['genuine'].sum())} genuine)  "
+          f"policies: {combos} in {elapsed:.2f} s ({combos / max(elapsed, 1e-9):,.0f}/s)")
+    print(f"Baseline: FAR {baseline['far'][0]:.2%}  FRR {baseline['frr'][0]:.2%}  step-up {baseline['step_up_rate'][0]:.2%}")
+    ranked = rank(metrics, args.max_far)
+    if not len(ranked):
+        print(f"No policy meets FAR <= {args.max_far:.2%}")
+        sys.exit(1)
+    swept = [name for name in GRID_PARAMETERS if name in grid]
+    print(f"{'FAR':>7} {'FRR':>7} {'step-up':>8}  " + "  ".join(swept))
+    for i in ranked[:args.top]:
+        values = "  ".join(f"{parameters[name][i]:.4g}" for name in swept)
+        print(f"{metrics['far'][i]:>7.2%} {metrics['frr'][i]:>7.2%} {metrics['step_up_rate'][i]:>8.2%}  {values}")
+
+    if args.write_policy:
+        best = policy_from_parameters({name: parameters[name][ranked[0]] for name in GRID_PARAMETERS}, base_policy)
+        with open(args.write_policy, 'w') as f:
+            json.dump(best, f, indent=2)
+        print(f"Best policy written to {args.write_policy}")
+    sys.exit(0)
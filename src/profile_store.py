@@ -0,0 +1,318 @@
+import io
+import os
+import sys
+import hmac
+import json
+import base64
+import struct
+import zipfile
+import hashlib
+import argparse
+
+import numpy as np
+import keyring
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.backends import default_backend
+
+from config import (TEMPLATE_DIR, MAX_WINDOW_SIZE, KEYRING_SERVICE_NAME, SECRET_DERIVATION_SALT, KDF_ITERATIONS,
+                    PROFILE_SNAPSHOT_INTERVAL, PROFILE_EVENT_SEGMENTS, PROFILE_FORMAT_VERSION)
+from rolling_window import RollingWindow
+from auth_core import apply_event
+
+
+# Encrypted, event-sourced user profiles.
+#
+# <user>.dat is a snapshot: metadata.json and template.npz zipped and sealed in a single container,
+# with metadata['event_seq'] naming the last event folded into it. <user>.events is an append-only
+# stream of Fernet-encrypted JSON events (auth_core.update_template's output), one per line with a
+# contiguous 'seq'. A login appends a few lines; every PROFILE_SNAPSHOT_INTERVAL events the state
+# is rewritten as a new snapshot and the stream rotates to <user>.events.1, .2, ... for forensics.
+#
+# Container layout (format 2):
+#   b'KSP2' | header length (u32 BE) | header JSON | HMAC-SHA256(header key, everything before it)
+#   | 12-byte nonce | AES-GCM ciphertext of the zip, with the header prefix as associated data
+# The header (version, model fingerprint, payload length, event seq) can be verified without
+# touching the payload, and decrypting the payload authenticates it and its header in one pass.
+# Format 1 profiles (a Fernet token with a SHA3 .hash sidecar) are still read, and are rewritten
+# as containers on their next snapshot.
+CONTAINER_MAGIC = b'KSP2'
+HEADER_MAC_SIZE = 32
+NONCE_SIZE = 12
+
+
+class ProfileIntegrityError(Exception):
+    """The snapshot failed authentication or the event stream is not contiguous."""
+
+
+def profile_key(username, create=True):
+    """Fernet key for a user's profile, derived from the per-user keyring secret.
+
+    With create=False a missing secret raises LookupError instead of being created and stored.
+    """
+    secret = keyring.get_password(KEYRING_SERVICE_NAME, username)
+    if not secret:
+        if not create:
+            raise LookupError(f"No keyring secret for {username}")
+        secret = base64.urlsafe_b64encode(os.urandom(32)).decode('utf-8')
+        keyring.set_password(KEYRING_SERVICE_NAME, username, secret)
+    kdf = PBKDF2HMAC(hashes.SHA256(), 32, SECRET_DERIVATION_SALT, KDF_ITERATIONS, default_backend())
+    return base64.urlsafe_b64encode(kdf.derive(secret.encode()))
+
+
+def _container_keys(key):
+    """(payload key, header MAC key) derived from the user's Fernet key."""
+    material = HKDF(hashes.SHA256(), 64, None, b'keystroke-profile-container', default_backend()).derive(base64.urlsafe_b64decode(key))
+    return material[:32], material[32:]
+
+
+def _enrollment_arrays(samples):
+    """Raw enrollment timings as one (rows, 5) array plus per-sample lengths, kept so profiles can be re-embedded."""
+    if not samples:
+        return {}
+    arrays = [np.asarray(sample, dtype=float) for sample in samples]
+    return {'enrollment_timings': np.vstack(arrays), 'enrollment_lengths': np.array([len(a) for a in arrays])}
+
+
+def _encode_event(event):
+    return {key: value.tolist() if isinstance(value, np.ndarray) else value for key, value in event.items()}
+
+
+class ProfileStore:
+    def __init__(self, username, key, template_dir=TEMPLATE_DIR, snapshot_interval=PROFILE_SNAPSHOT_INTERVAL):
+        self.username = username
+        self.fernet = Fernet(key)
+        self._payload_key, self._header_key = _container_keys(key)
+        self.snapshot_interval = snapshot_interval
+        self.dat_path = os.path.join(template_dir, f"{username}.dat")
+        self.hash_path = os.path.join(template_dir, f"{username}.hash")
+        self.events_path = os.path.join(template_dir, f"{username}.events")
+
+    def exists(self):
+        return os.path.exists(self.dat_path)
+
+    def stamp(self):
+        """(inode, mtime, size) of the snapshot and live event stream; changes whenever either is written."""
+        stamps = []
+        for path in (self.dat_path, self.events_path):
+            try:
+                st = os.stat(path)
+                stamps.append((st.st_ino, st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                stamps.append(None)
+        return tuple(stamps)
+
+    def segment_paths(self):
+        """Rotated event segments, oldest first."""
+        paths = [f"{self.events_path}.{i}" for i in range(PROFILE_EVENT_SEGMENTS, 0, -1)]
+        return [p for p in paths if os.path.exists(p)]
+
+    def delete(self):
+        for path in [self.dat_path, self.hash_path, self.events_path] + self.segment_paths():
+            if os.path.exists(path): os.remove(path)
+
+    def _parse_header(self, prefix):
+        """(header, header_end) from the start of a container; raises ProfileIntegrityError if its MAC fails."""
+        if len(prefix) < 8:
+            raise ProfileIntegrityError(f"{self.username}.dat is truncated")
+        header_length, = struct.unpack('>I', prefix[4:8])
+        header_end = 8 + header_length
+        mac_end = header_end + HEADER_MAC_SIZE
+        if len(prefix) < mac_end:
+            raise ProfileIntegrityError(f"{self.username}.dat is truncated")
+        expected_mac = hmac.new(self._header_key, prefix[:header_end], hashlib.sha256).digest()
+        if not hmac.compare_digest(expected_mac, prefix[header_end:mac_end]):
+            raise ProfileIntegrityError(f"{self.username}.dat header failed authentication")
+        return json.loads(prefix[8:header_end]), header_end
+
+    def read_header(self):
+        """Authenticated container header (version, model_fingerprint, payload_length, event_seq), read without the payload."""
+        with open(self.dat_path, 'rb') as f:
+            prefix = f.read(8)
+            if prefix[:4] != CONTAINER_MAGIC:
+                return {"version": 1}
+            if len(prefix) == 8:
+                prefix += f.read(struct.unpack('>I', prefix[4:8])[0] + HEADER_MAC_SIZE)
+        return self._parse_header(prefix)[0]
+
+    def _read_payload(self):
+        """(header, decrypted zip bytes), authenticated in a single pass over the file."""
+        with open(self.dat_path, 'rb') as f: data = f.read()
+        if data[:4] != CONTAINER_MAGIC:
+            if not os.path.exists(self.hash_path):
+                raise ProfileIntegrityError(f"{self.username}.hash is missing")
+            with open(self.hash_path, 'r') as f:
+                if hashlib.sha3_256(data).hexdigest() != f.read():
+                    raise ProfileIntegrityError(f"{self.username}.dat does not match its hash")
+            return {"version": 1}, self.fernet.decrypt(data)
+
+        header, header_end = self._parse_header(data)
+        payload_start = header_end + HEADER_MAC_SIZE
+        if len(data) - payload_start != header.get('payload_length'):
+            raise ProfileIntegrityError(f"{self.username}.dat payload length does not match its header")
+        nonce, ciphertext = data[payload_start:payload_start + NONCE_SIZE], data[payload_start + NONCE_SIZE:]
+        try:
+            return header, AESGCM(self._payload_key).decrypt(nonce, ciphertext, data[:header_end])
+        except InvalidTag:
+            raise ProfileIntegrityError(f"{self.username}.dat payload failed authentication")
+
+    def read_metadata(self):
+        """Snapshot metadata only (credentials and thresholds), without replaying events."""
+        with zipfile.ZipFile(io.BytesIO(self._read_payload()[1]), 'r') as zf:
+            return json.loads(zf.read('metadata.json'))
+
+    def read_snapshot(self):
+        header, payload = self._read_payload()
+        with zipfile.ZipFile(io.BytesIO(payload), 'r') as zf:
+            metadata = json.loads(zf.read('metadata.json'))
+            with io.BytesIO(zf.read('template.npz')) as npz_buffer:
+                npz_files = np.load(npz_buffer, allow_pickle=True)
+                rolling_window = RollingWindow.from_state(
+                    MAX_WINDOW_SIZE,
+                    npz_files['rolling_window'] if 'rolling_window' in npz_files else [],
+                    npz_files['rolling_window_mean'] if 'rolling_window_mean' in npz_files else None,
+                    npz_files['rolling_window_m2'] if 'rolling_window_m2' in npz_files else None,
+                    npz_files['rolling_window_updates'] if 'rolling_window_updates' in npz_files else 0)
+                return {
+                    'metadata': metadata,
+                    'esn_anchor': npz_files['esn_anchor'],
+                    'statistical_template': npz_files['statistical_template'],
+                    'rolling_window': rolling_window,
+                    'quarantined_samples': list(npz_files['quarantined_samples']) if 'quarantined_samples' in npz_files and npz_files['quarantined_samples'].size > 0 else [],
+                    'enrollment_samples': np.split(npz_files['enrollment_timings'], np.cumsum(npz_files['enrollment_lengths'])[:-1]) if 'enrollment_timings' in npz_files else None,
+                    'baseline_variability': metadata.get("baseline_variability", None),
+                    'model_fingerprint': header.get('model_fingerprint'),
+                    'event_seq': metadata.get('event_seq', 0),
+                    'events_since_snapshot': 0,
+                }
+
+    def read_events(self, path=None, after_seq=None):
+        """Decrypted events, only those with seq > after_seq if given; raises ProfileIntegrityError on a gap."""
+        path = path or self.events_path
+        if not os.path.exists(path): return []
+        events, expected_seq = [], None
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.strip(): continue
+                try:
+                    event = json.loads(self.fernet.decrypt(line.strip()))
+                except InvalidToken:
+                    raise ProfileIntegrityError(f"Unreadable event in {os.path.basename(path)}")
+                if expected_seq is not None and event['seq'] != expected_seq:
+                    raise ProfileIntegrityError(f"Event {expected_seq} missing from {os.path.basename(path)}")
+                expected_seq = event['seq'] + 1
+                if after_seq is None or event['seq'] > after_seq:
+                    events.append(event)
+        if after_seq is not None and events and events[0]['seq'] != after_seq + 1:
+            raise ProfileIntegrityError(f"Events {after_seq + 1}-{events[0]['seq'] - 1} missing for {self.username}")
+        return events
+
+    def load(self):
+        """The current profile: the snapshot with every later event replayed onto it."""
+        profile = self.read_snapshot()
+        for event in self.read_events(after_seq=profile['event_seq']):
+            apply_event(profile, event)
+            profile['event_seq'] = event['seq']
+            profile['events_since_snapshot'] += 1
+        return profile
+
+    def write_snapshot(self, profile):
+        """Rewrites the snapshot from `profile` and rotates the event stream it now contains."""
+        metadata = profile['metadata']
+        metadata['event_seq'] = profile.get('event_seq', 0)
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('metadata.json', json.dumps(metadata))
+            npz_buffer = io.BytesIO()
+            np.savez(npz_buffer,
+                     esn_anchor=profile['esn_anchor'],
+                     statistical_template=profile['statistical_template'],
+                     quarantined_samples=np.array(profile['quarantined_samples']),
+                     **profile['rolling_window'].state(),
+                     **_enrollment_arrays(profile.get('enrollment_samples')))
+            zf.writestr('template.npz', npz_buffer.getvalue())
+
+        payload = zip_buffer.getvalue()
+        header = json.dumps({
+            "version": PROFILE_FORMAT_VERSION,
+            "model_fingerprint": profile.get('model_fingerprint'),
+            "payload_length": NONCE_SIZE + len(payload) + 16, # AES-GCM appends a 16-byte tag
+            "event_seq": metadata['event_seq'],
+        }).encode('utf-8')
+        prefix = CONTAINER_MAGIC + struct.pack('>I', len(header)) + header
+        nonce = os.urandom(NONCE_SIZE)
+        container = (prefix + hmac.new(self._header_key, prefix, hashlib.sha256).digest()
+                     + nonce + AESGCM(self._payload_key).encrypt(nonce, payload, prefix))
+        # A single file replaced atomically: a crash leaves either the old or the new snapshot
+        tmp_path = self.dat_path + '.tmp'
+        with open(tmp_path, 'wb') as f: f.write(container)
+        os.replace(tmp_path, self.dat_path)
+        if os.path.exists(self.hash_path): os.remove(self.hash_path)
+        profile['events_since_snapshot'] = 0
+
+        # Events up to event_seq are now in the snapshot; load() skips them if rotation is interrupted
+        if os.path.exists(self.events_path):
+            for i in range(PROFILE_EVENT_SEGMENTS, 1, -1):
+                if os.path.exists(f"{self.events_path}.{i - 1}"):
+                    os.replace(f"{self.events_path}.{i - 1}", f"{self.events_path}.{i}")
+            os.replace(self.events_path, f"{self.events_path}.1")
+
+    def append_events(self, profile, events, **context):
+        """Appends one login's events (plus `context`, e.g. timestamp) and snapshots when due."""
+        lines = []
+        for event in events:
+            profile['event_seq'] = profile.get('event_seq', 0) + 1
+            record = {"seq": profile['event_seq'], **context, **_encode_event(event)}
+            lines.append(self.fernet.encrypt(json.dumps(record).encode('utf-8')) + b'\n')
+        with open(self.events_path, 'ab') as f:
+            f.write(b''.join(lines))
+        profile['events_since_snapshot'] = profile.get('events_since_snapshot', 0) + len(events)
+        if profile['events_since_snapshot'] >= self.snapshot_interval:
+            self.write_snapshot(profile)
+
+    def history(self):
+        """Every retained event, oldest first: rotated segments, then the live stream."""
+        events = []
+        for path in self.segment_paths() + [self.events_path]:
+            events.extend(self.read_events(path))
+        return events
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild a user's profile from its snapshot and event stream, and list its history.")
+    parser.add_argument('username')
+    parser.add_argument('--template-dir', default=TEMPLATE_DIR)
+    parser.add_argument('--header', action='store_true', help="Only print the authenticated container header")
+    parser.add_argument('--snapshot', action='store_true', help="Write a fresh snapshot from the rebuilt state")
+    args = parser.parse_args()
+
+    store = ProfileStore(args.username, profile_key(args.username), args.template_dir)
+    if not store.exists():
+        print(f"No profile for {args.username} in {args.template_dir}")
+        sys.exit(1)
+    try:
+        if args.header:
+            print(json.dumps(store.read_header(), indent=2))
+            sys.exit(0)
+        history = store.history()
+        profile = store.load()
+    except (ProfileIntegrityError, InvalidToken) as e:
+        print(f"Integrity check failed: {e}")
+        sys.exit(1)
+
+    for event in history:
+        details = ", ".join(f"{k}={v}" for k, v in event.items() if k not in ('seq', 'event_type', 'sample', 'timestamp'))
+        print(f"{event['seq']:>6}  {event.get('timestamp', ''):<20}  {event['event_type']:<26} {details}")
+    metadata = profile['metadata']
+    print(f"State at event {profile['event_seq']} ({profile['events_since_snapshot']} since snapshot): "
+          f"logins {metadata.get('login_count', 0)}, window {len(profile['rolling_window'])}, "
+          f"quarantined {len(profile['quarantined_samples'])}, drift {metadata.get('drift_counter', 0)}, "
+          f"anomalies {metadata.get('consecutive_anomaly_count', 0)}")
+    if args.snapshot:
+        store.write_snapshot(profile)
+        print("Snapshot written.")
+    sys.exit(0)
@@ -0,0 +1,108 @@
+import math
+import time
+import sqlite3
+import contextlib
+
+from config import (RATE_LIMIT_DB_PATH, MAX_FAILED_ATTEMPTS, LOCKOUT_PERIOD_SECONDS, GLOBAL_MAX_FAILED_ATTEMPTS,
+                    GLOBAL_LOCKOUT_WINDOW_SECONDS)
+
+
+# Failed-login rate limiting with sliding-window counters in SQLite.
+#
+# Each key (one per user, plus one global key) stores a single row: the start of the current fixed
+# window, the failure counts of the current and previous windows, and the time an active lockout ends.
+# The sliding count is
+#     previous * (1 - elapsed fraction of the current window) + current
+# so a check or update touches one row, whatever the attempt volume. The failure that brings the
+# sliding count to the limit locks the key for a full period from that moment, as the in-memory
+# limiter did; window boundaries never shorten a lockout. Checks and updates run in BEGIN IMMEDIATE
+# transactions on a WAL database, which keeps counts and lockouts exact across threads and worker
+# processes and lets lockouts survive restarts.
+GLOBAL_KEY = "global"
+
+
+def _user_key(username):
+    return f"user:{username}"
+
+
+class RateLimiter:
+    def __init__(self, db_path=RATE_LIMIT_DB_PATH, user_limit=MAX_FAILED_ATTEMPTS, user_period=LOCKOUT_PERIOD_SECONDS,
+                 global_limit=GLOBAL_MAX_FAILED_ATTEMPTS, global_period=GLOBAL_LOCKOUT_WINDOW_SECONDS):
+        self.db_path = db_path
+        self.limits = {"user": (user_limit, user_period), "global": (global_limit, global_period)}
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, window_start REAL NOT NULL, "
+                         "current INTEGER NOT NULL, previous INTEGER NOT NULL, locked_until REAL NOT NULL DEFAULT 0)")
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(rate_limits)")}
+            if "locked_until" not in columns: # Databases written before lockouts were stored
+                conn.execute("ALTER TABLE rate_limits ADD COLUMN locked_until REAL NOT NULL DEFAULT 0")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # A short-lived connection per operation keeps the limiter safe to share between threads
+        conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _rolled(row, period, now):
+        """(window_start, current, previous, locked_until) for the window containing `now`."""
+        window_start = math.floor(now / period) * period
+        if row is None:
+            return window_start, 0, 0, 0.0
+        stored_start, current, previous, locked_until = row
+        if window_start == stored_start:
+            return stored_start, current, previous, locked_until
+        return window_start, 0, current if window_start - stored_start == period else 0, locked_until
+
+    def _read(self, conn, key, kind, now):
+        row = conn.execute("SELECT window_start, current, previous, locked_until FROM rate_limits WHERE key = ?", (key,)).fetchone()
+        return self._rolled(row, self.limits[kind][1], now)
+
+    def _lockout(self, conn, username, now):
+        """(scope, seconds) for the active lockout, global first; (None, 0) when attempts are allowed."""
+        for key, kind in ((GLOBAL_KEY, "global"), (_user_key(username), "user")):
+            locked_until = self._read(conn, key, kind, now)[3]
+            if locked_until > now:
+                return kind, locked_until - now
+        return None, 0.0
+
+    def check(self, username, now=None):
+        """(scope, seconds) for the active lockout, 'user' or 'global'; (None, 0) when attempts are allowed."""
+        now = time.time() if now is None else now
+        with self._transaction() as conn:
+            return self._lockout(conn, username, now)
+
+    def record_failure(self, username, now=None):
+        """Counts a failed attempt and returns the lockout in force afterwards, as check() would."""
+        now = time.time() if now is None else now
+        with self._transaction() as conn:
+            for key, kind in ((GLOBAL_KEY, "global"), (_user_key(username), "user")):
+                limit, period = self.limits[kind]
+                window_start, current, previous, locked_until = self._read(conn, key, kind, now)
+                current += 1
+                elapsed = (now - window_start) / period
+                if locked_until <= now and previous * (1 - elapsed) + current >= limit:
+                    locked_until = now + period
+                conn.execute("INSERT OR REPLACE INTO rate_limits (key, window_start, current, previous, locked_until) "
+                             "VALUES (?, ?, ?, ?, ?)", (key, window_start, current, previous, locked_until))
+            return self._lockout(conn, username, now)
+
+    def reset(self, username):
+        """Clears a user's failures after a successful login; the global count is left alone."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM rate_limits WHERE key = ?", (_user_key(username),))
@@ -0,0 +1,141 @@
+import os
+import sys
+import json
+import time
+import pickle
+import hashlib
+import argparse
+
+import numpy as np
+
+from config import MODEL_PATH, RESERVOIR_CACHE_DIR
+
+
+# Seed-defined reservoirs. Instead of shipping W_input and W_reservoir, a model can carry a
+# 'reservoir_spec': PCG64 seed, sizes, density, spectral radius and input scaling, plus the scale
+# factor that met the radius when the reservoir was drawn and a SHA-256 digest of both matrices.
+# Regeneration only draws from the seeded generator and multiplies by the stored factor (no
+# eigenvalue solve, whose last bits vary between LAPACK builds), so it is bit-exact wherever
+# numpy's generator stream is unchanged, and the digest rejects any machine where it isn't.
+# Regenerated matrices can be cached as one memory-mapped .npy per digest, which the app, the
+# daemon and evaluation workers then share through the page cache.
+SPEC_FIELDS = ('seed', 'size', 'input_dim', 'density', 'spectral_radius', 'input_scaling', 'scale', 'digest')
+
+
+def _draw(spec):
+    """W_input and the unscaled W_reservoir from the spec's seed; elementwise operations only."""
+    rng = np.random.Generator(np.random.PCG64(spec['seed']))
+    size = spec['size']
+    W_input = rng.uniform(-1.0, 1.0, (size, spec['input_dim'])) * spec['input_scaling']
+    W_reservoir = rng.uniform(-1.0, 1.0, (size, size))
+    W_reservoir[rng.random((size, size)) >= spec['density']] = 0.0
+    return W_input, W_reservoir
+
+
+def reservoir_digest(W_input, W_reservoir):
+    digest = hashlib.sha256()
+    for array in (W_input, W_reservoir):
+        digest.update(np.ascontiguousarray(array, dtype='<f8').tobytes())
+    return digest.hexdigest()
+
+
+def new_reservoir(seed, size, input_dim, density=0.1, spectral_radius=0.9, input_scaling=1.0):
+    """Draws a reservoir for training: (spec, W_input, W_reservoir), where the spec reproduces both matrices."""
+    spec = {"seed": int(seed), "size": int(size), "input_dim": int(input_dim), "density": float(density),
+            "spectral_radius": float(spectral_radius), "input_scaling": float(input_scaling)}
+    W_input, W_reservoir = _draw(spec)
+    radius = float(np.max(np.abs(np.linalg.eigvals(W_reservoir))))
+    spec['scale'] = spectral_radius / radius if radius > 0 else 1.0
+    W_reservoir *= spec['scale']
+    spec['digest'] = reservoir_digest(W_input, W_reservoir)
+    return spec, W_input, W_reservoir
+
+
+def regenerate(spec):
+    """W_input and W_reservoir rebuilt from `spec`; raises ValueError unless they match its digest."""
+    W_input, W_reservoir = _draw(spec)
+    W_reservoir *= spec['scale']
+    if reservoir_digest(W_input, W_reservoir) != spec['digest']:
+        raise ValueError(f"Reservoir regenerated from seed {spec['seed']} does not match its digest: the spec is "
+                         f"damaged or numpy {np.__version__} draws a different stream; use a model with stored matrices")
+    return W_input, W_reservoir
+
+
+def _cached(spec, cache_dir):
+    """regenerate(spec) through a memory-mapped cache file, rewritten if missing or corrupt."""
+    path = os.path.join(cache_dir, f"reservoir-{spec['digest'][:32]}.npy")
+    split = spec['input_dim']
+    try:
+        packed = np.load(path, mmap_mode='r')
+        if packed.shape == (spec['size'], split + spec['size']) and reservoir_digest(packed[:, :split], packed[:, split:]) == spec['digest']:
+            return packed[:, :split], packed[:, split:]
+    except (OSError, ValueError):
+        pass
+    W_input, W_reservoir = regenerate(spec)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, np.hstack([W_input, W_reservoir]))
+    os.replace(tmp_path, path)
+    packed = np.load(path, mmap_mode='r')
+    return packed[:, :split], packed[:, split:]
+
+
+def materialize(model, cache_dir=None):
+    """Fills in W_input and W_reservoir of a seed-defined model, in place; other models pass through."""
+    spec = model.get('reservoir_spec')
+    if spec is not None and 'W_reservoir' not in model:
+        model['W_input'], model['W_reservoir'] = _cached(spec, cache_dir) if cache_dir else regenerate(spec)
+    return model
+
+
+def read_model(path, cache_dir=RESERVOIR_CACHE_DIR):
+    """Unpickles a model file, regenerating its reservoir if it is seed-defined."""
+    with open(path, 'rb') as f:
+        return materialize(pickle.load(f), cache_dir)
+
+
+def portable(model):
+    """The model as it is pickled: no compiled maps, and no matrices its reservoir_spec regenerates."""
+    dropped = {'compiled'} | ({'W_input', 'W_reservoir'} if 'reservoir_spec' in model else set())
+    return {name: value for name, value in model.items() if name not in dropped}
+
+
+def pack(model, spec):
+    """`model` with its matrices replaced by `spec`; raises ValueError if the spec does not reproduce them."""
+    if reservoir_digest(model['W_input'], model['W_reservoir']) != spec['digest']:
+        raise ValueError("The model's reservoir was not drawn from this spec")
+    regenerate(spec)
+    return portable({**model, 'reservoir_spec': {name: spec[name] for name in SPEC_FIELDS}})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect, pack or unpack a model's seed-defined reservoir.")
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--pack', metavar='SPEC_JSON', help="Replace the matrices with this spec (as returned by new_reservoir)")
+    parser.add_argument('--unpack', action='store_true', help="Store the regenerated matrices in the model again")
+    parser.add_argument('--output', help="Where to write the packed or unpacked model")
+    args = parser.parse_args()
+
+    with open(args.model, 'rb') as f:
+        model = pickle.load(f)
+    spec = model.get('reservoir_spec')
+    print(f"{args.model}: {os.path.getsize(args.model):,} bytes, "
+          + (f"seed-defined reservoir (seed {spec['seed']}, {spec['size']} units, density {spec['density']})" if spec else "stored reservoir matrices"))
+    if spec:
+        start = time.perf_counter()
+        regenerate(spec)
+        print(f"Regenerated and verified against digest {spec['digest'][:16]} in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    if args.pack or args.unpack:
+        if not args.output:
+            parser.error("--pack and --unpack need --output")
+        if args.pack:
+            with open(args.pack, 'r', encoding='utf-8') as f:
+                result = pack(model, json.load(f))
+        else:
+            result = {name: value for name, value in materialize(model).items() if name != 'reservoir_spec'}
+        with open(args.output, 'wb') as f:
+            pickle.dump(result, f)
+        print(f"Wrote {args.output}: {os.path.getsize(args.output):,} bytes")
+    sys.exit(0)
@@ -0,0 +1,135 @@
+import numpy as np
+
+
+# Running statistics are recomputed from the buffer every N updates so the
+# floating-point error of Welford removals cannot accumulate over months of logins.
+RESYNC_INTERVAL = 64
+
+
+class RollingWindow:
+    """Fixed-capacity ring buffer of feature vectors with running mean and M2 (Welford).
+
+    Appending evicts the oldest vector once the window is full, and the mean,
+    per-dimension std and consistency metric are O(D) reads of the running state.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buffer = None
+        self._start = 0
+        self._count = 0
+        self._mean = None
+        self._m2 = None
+        self._updates_since_resync = 0
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    def _allocate(self, dim):
+        self._buffer = np.zeros((self.capacity, dim))
+        self._mean = np.zeros(dim)
+        self._m2 = np.zeros(dim)
+
+    def _add(self, vector):
+        self._count += 1
+        delta = vector - self._mean
+        self._mean += delta / self._count
+        self._m2 += delta * (vector - self._mean)
+
+    def _remove(self, vector):
+        if self._count <= 1:
+            self._count = 0
+            self._mean[:] = 0.0
+            self._m2[:] = 0.0
+            return
+        self._count -= 1
+        delta = vector - self._mean
+        self._mean -= delta / self._count
+        self._m2 -= delta * (vector - self._mean)
+        np.maximum(self._m2, 0.0, out=self._m2)
+
+    def append(self, vector):
+        vector = np.asarray(vector, dtype=float)
+        if self._buffer is None:
+            self._allocate(vector.shape[0])
+        if self._count == self.capacity:
+            self._remove(self._buffer[self._start])
+            self._buffer[self._start] = vector
+            self._start = (self._start + 1) % self.capacity
+            self._add(vector)
+        else:
+            self._buffer[(self._start + self._count) % self.capacity] = vector
+            self._add(vector)
+        self._updates_since_resync += 1
+        if self._updates_since_resync >= RESYNC_INTERVAL:
+            self.resync()
+
+    def extend(self, vectors):
+        for vector in vectors:
+            self.append(vector)
+
+    def clear(self):
+        self._start = 0
+        self._count = 0
+        self._updates_since_resync = 0
+        if self._buffer is not None:
+            self._mean[:] = 0.0
+            self._m2[:] = 0.0
+
+    def resync(self):
+        """Recomputes the running statistics exactly from the buffered vectors."""
+        self._updates_since_resync = 0
+        if self._count == 0:
+            return
+        vectors = self.to_array()
+        self._mean = vectors.mean(axis=0)
+        self._m2 = ((vectors - self._mean) ** 2).sum(axis=0)
+
+    def to_array(self):
+        """Returns the buffered vectors ordered oldest to newest."""
+        if self._count == 0:
+            return np.array([])
+        order = (self._start + np.arange(self._count)) % self.capacity
+        return self._buffer[order]
+
+    def mean(self):
+        return self._mean.copy()
+
+    def std(self):
+        # Population std, matching np.std(window, axis=0)
+        return np.sqrt(self._m2 / self._count)
+
+    def consistency(self):
+        """Mean per-dimension std of the window, i.e. np.mean(np.std(window, axis=0))."""
+        return float(np.mean(self.std()))
+
+    def state(self):
+        """Arrays persisted alongside the profile template."""
+        return {
+            'rolling_window': self.to_array(),
+            'rolling_window_mean': self._mean if self._count else np.array([]),
+            'rolling_window_m2': self._m2 if self._count else np.array([]),
+            'rolling_window_updates': np.array(self._updates_since_resync),
+        }
+
+    @classmethod
+    def from_state(cls, capacity, vectors, mean=None, m2=None, updates=0):
+        """Rebuilds a window from persisted arrays; stats are recomputed if absent (older profiles)."""
+        window = cls(capacity)
+        vectors = np.asarray(vectors, dtype=float)
+        if vectors.size == 0:
+            return window
+        stats_match = len(vectors) <= capacity and mean is not None and m2 is not None and np.size(mean) == vectors.shape[1]
+        vectors = vectors[-capacity:]
+        window._allocate(vectors.shape[1])
+        window._buffer[:len(vectors)] = vectors
+        window._count = len(vectors)
+        if stats_match:
+            window._mean = np.array(mean, dtype=float)
+            window._m2 = np.array(m2, dtype=float)
+            window._updates_since_resync = int(updates)
+        else:
+            window.resync()
+        return window
@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+import argparse
+import threading
+import subprocess
+
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(SRC_DIR, 'app.py')
+
+# Startup budget (enforced in CI with: python src/startup_budget.py)
+IMPORT_BUDGET_MS = 750
+FIRST_WINDOW_BUDGET_MS = 2000
+# Heavy packages that must stay off the startup path; they load on first use instead
+FORBIDDEN_STARTUP_MODULES = ('matplotlib', 'sklearn', 'scipy', 'pandas')
+PROBE_MARKER = 'STARTUP_PROBE first_window'
+PROBE_TIMEOUT_SECONDS = 60
+
+
+def profile_imports(module='app'):
+    """Imports `module` in a fresh interpreter under -X importtime and returns (self_us, cumulative_us, name) rows."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=SRC_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(self_us), int(cumulative_us), name.rstrip()))
+    return rows
+
+
+def top_level_packages(rows):
+    return {name.strip().split('.')[0] for _, _, name in rows}
+
+
+def measure_first_window(app_dir, timeout=PROBE_TIMEOUT_SECONDS):
+    """Launches the app in probe mode and returns the wall time until its first window is shown."""
+    env = dict(os.environ)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, APP_PATH, '--startup-probe'], cwd=app_dir, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    shown = []
+
+    def read_output():
+        # On its own thread so a child that prints nothing (e.g. blocked on a modal dialog) can't hang the check
+        for line in process.stdout:
+            if line.startswith(PROBE_MARKER):
+                shown.append(time.perf_counter() - start)
+                return
+
+    reader = threading.Thread(target=read_output, daemon=True)
+    reader.start()
+    try:
+        reader.join(timeout)
+        return shown[0] if shown else None
+    finally:
+        process.kill()
+        process.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time profile and startup budget check.")
+    parser.add_argument('--top', type=int, default=15, help="Number of slowest imports to list")
+    parser.add_argument('--budget-ms', type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument('--window', action='store_true', help="Also time the first window (needs the model file)")
+    parser.add_argument('--window-budget-ms', type=float, default=FIRST_WINDOW_BUDGET_MS)
+    parser.add_argument('--app-dir', default='.', help="Working directory the app is normally started from")
+    args = parser.parse_args()
+
+    rows = profile_imports()
+    total_ms = next((cumulative for _, cumulative, name in rows if name.strip() == 'app'), 0) / 1000
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for self_us, cumulative_us, name in sorted(rows, key=lambda r: r[1], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {name}")
+
+    failures = []
+    print(f"\nimport app: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    if total_ms > args.budget_ms:
+        failures.append(f"import time {total_ms:.1f} ms exceeds budget {args.budget_ms:.0f} ms")
+    leaked = sorted(top_level_packages(rows) & set(FORBIDDEN_STARTUP_MODULES))
+    if leaked:
+        failures.append(f"heavy modules imported at startup: {', '.join(leaked)}")
+
+    if args.window:
+        seconds = measure_first_window(args.app_dir)
+        if seconds is None:
+            failures.append("first window was never shown (is the model present?)")
+        else:
+            print(f"first window: {seconds * 1000:.1f} ms (budget {args.window_budget_ms:.0f} ms)")
+            if seconds * 1000 > args.window_budget_ms:
+                failures.append(f"time to first window {seconds * 1000:.1f} ms exceeds budget {args.window_budget_ms:.0f} ms")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
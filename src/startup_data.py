@@ -0,0 +1,153 @@
+import os
+import sys
+import csv
+import time
+import argparse
+
+from word_index import file_sha256, load_word_index
+
+
+# Pre-parsed quote cache: MAGIC | 64-byte hex SHA-256 of the source CSV | NUL-separated UTF-8 quotes
+QUOTE_CACHE_MAGIC = b'KSQC1'
+QUOTE_CSV_HEADER = 'Quote'
+DEFAULT_VERIFY_QUOTE = "What we plant in the soil of contemplation, we shall reap in the harvest of action."
+
+
+def parse_quotes_csv(path):
+    """Reads a single-column quote CSV, skipping the header, blank and malformed rows."""
+    quotes = []
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row_number, row in enumerate(csv.reader(f)):
+            if len(row) != 1 or not row[0].strip():
+                continue
+            if row_number == 0 and row[0].strip() == QUOTE_CSV_HEADER:
+                continue
+            quotes.append(row[0])
+    return quotes
+
+
+def _read_quote_cache(cache_path, source_hash):
+    try:
+        with open(cache_path, 'rb') as f:
+            blob = f.read()
+    except FileNotFoundError:
+        return None
+    prefix_len = len(QUOTE_CACHE_MAGIC) + 64
+    if blob[:len(QUOTE_CACHE_MAGIC)] != QUOTE_CACHE_MAGIC or blob[len(QUOTE_CACHE_MAGIC):prefix_len].decode('ascii', 'replace') != source_hash:
+        return None
+    payload = blob[prefix_len:]
+    return payload.decode('utf-8').split('\0') if payload else []
+
+
+def _write_quote_cache(cache_path, source_hash, quotes):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(QUOTE_CACHE_MAGIC + source_hash.encode('ascii') + '\0'.join(quotes).encode('utf-8'))
+    os.replace(tmp_path, cache_path)
+
+
+def load_quotes(path, cache_dir=None):
+    """Returns the quotes in `path`, using the binary cache when its source hash still matches."""
+    if cache_dir is None:
+        return parse_quotes_csv(path)
+    source_hash = file_sha256(path)
+    cache_path = os.path.join(cache_dir, os.path.basename(path) + '.cache')
+    quotes = _read_quote_cache(cache_path, source_hash)
+    if quotes is None:
+        quotes = parse_quotes_csv(path)
+        _write_quote_cache(cache_path, source_hash, quotes)
+    return quotes
+
+
+class StartupData:
+    """Loads quotes and the dictionary index on first use and keeps them for the process lifetime."""
+    def __init__(self, enroll_quotes_path, verify_quotes_path, dictionary_path, dictionary_index_path, cache_dir=None):
+        self.enroll_quotes_path = enroll_quotes_path
+        self.verify_quotes_path = verify_quotes_path
+        self.dictionary_path = dictionary_path
+        self.dictionary_index_path = dictionary_index_path
+        self.cache_dir = cache_dir
+        self.timings = {}
+        self._enroll_quotes = None
+        self._verify_quotes = None
+        self._dictionary_index = None
+
+    def missing_sources(self):
+        return [p for p in (self.enroll_quotes_path, self.verify_quotes_path, self.dictionary_path) if not os.path.exists(p)]
+
+    def _timed(self, name, loader):
+        start = time.perf_counter()
+        value = loader()
+        self.timings[name] = time.perf_counter() - start
+        return value
+
+    @property
+    def enroll_quotes(self):
+        if self._enroll_quotes is None:
+            self._enroll_quotes = self._timed('enroll_quotes', lambda: load_quotes(self.enroll_quotes_path, self.cache_dir))
+        return self._enroll_quotes
+
+    @property
+    def verify_quotes(self):
+        if self._verify_quotes is None:
+            quotes = self._timed('verify_quotes', lambda: load_quotes(self.verify_quotes_path, self.cache_dir))
+            if not any(quote_text.startswith(DEFAULT_VERIFY_QUOTE) for quote_text in quotes):
+                quotes = [DEFAULT_VERIFY_QUOTE] + quotes
+            self._verify_quotes = quotes
+        return self._verify_quotes
+
+    @property
+    def dictionary_index(self):
+        if self._dictionary_index is None:
+            self._dictionary_index = self._timed('dictionary_index', lambda: load_word_index(self.dictionary_path, self.dictionary_index_path))
+        return self._dictionary_index
+
+
+def _clear_caches(cache_dir, dictionary_index_path):
+    paths = [dictionary_index_path]
+    if os.path.isdir(cache_dir):
+        paths += [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith('.cache')]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def cold_start_report(enroll_quotes_path, verify_quotes_path, dictionary_path, dictionary_index_path, cache_dir):
+    """Times the legacy eager pandas path against cold (no cache) and warm (cached) lazy loads."""
+    rows = []
+    try:
+        start = time.perf_counter()
+        import pandas as pd
+        rows.append(("legacy: import pandas", time.perf_counter() - start))
+        start = time.perf_counter()
+        for path in (enroll_quotes_path, verify_quotes_path):
+            pd.read_csv(path, header=None, names=['Quote'], on_bad_lines='skip')['Quote'].dropna().tolist()
+        with open(dictionary_path, 'r', encoding='utf-8') as f:
+            set(line.strip().lower() for line in f)
+        rows.append(("legacy: read_csv x2 + dictionary set", time.perf_counter() - start))
+    except ImportError:
+        rows.append(("legacy: pandas not installed", 0.0))
+
+    _clear_caches(cache_dir, dictionary_index_path)
+    for label in ("cold", "warm"):
+        data = StartupData(enroll_quotes_path, verify_quotes_path, dictionary_path, dictionary_index_path, cache_dir)
+        data.verify_quotes, data.enroll_quotes, data.dictionary_index
+        for name, seconds in data.timings.items():
+            rows.append((f"{label}: {name}", seconds))
+        rows.append((f"{label}: total", sum(data.timings.values())))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold-start timing report for the lazy startup data layer.")
+    parser.add_argument('--enroll', default='./data/raw/enroll_quotes.csv')
+    parser.add_argument('--verify', default='./data/raw/verify_quotes.csv')
+    parser.add_argument('--dictionary', default='./data/raw/dictionary.txt')
+    parser.add_argument('--cache-dir', default='./data/app_data/cache/')
+    args = parser.parse_args()
+
+    index_path = os.path.join(args.cache_dir, 'dictionary.idx')
+    for name, seconds in cold_start_report(args.enroll, args.verify, args.dictionary, index_path, args.cache_dir):
+        print(f"{name:<40} {seconds * 1000:8.2f} ms")
+    sys.exit(0)
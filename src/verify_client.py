@@ -0,0 +1,155 @@
+import json
+import socket
+import struct
+
+import numpy as np
+
+
+# Wire protocol and client for verify_daemon.py. Every message is a u32 length prefix followed by
+# MESSAGE_HEADER (magic, version, op, JSON length), a JSON object and an optional binary blob.
+# VERIFY carries the session as raw little-endian float64 (press, release) pairs, one row per
+# keystroke, so front-ends only capture; feature extraction, scoring and storage stay in the daemon.
+# Only this module and numpy are needed on the front-end side.
+PROTOCOL_MAGIC = b'KSVP'
+PROTOCOL_VERSION = 1
+MESSAGE_HEADER = struct.Struct('<4sBBI')
+LENGTH_PREFIX = struct.Struct('<I')
+MAX_MESSAGE_BYTES = 1 << 20
+OP_VERIFY, OP_STEP_UP, OP_COMMIT, OP_STATS, OP_RESULT, OP_ERROR = range(1, 7)
+EVENT_DTYPE = np.dtype('<f8')
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class DaemonError(Exception):
+    """An error reported by the daemon for one request; the connection stays usable."""
+
+
+def parse_address(address):
+    """'unix:/path/to.sock' or 'host:port' -> (socket family, address)."""
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    host, _, port = address.rpartition(':')
+    return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode_message(op, body=None, blob=b''):
+    payload = json.dumps(body or {}, separators=(',', ':'), default=_json_default).encode('utf-8')
+    message = MESSAGE_HEADER.pack(PROTOCOL_MAGIC, PROTOCOL_VERSION, op, len(payload)) + payload + blob
+    if len(message) > MAX_MESSAGE_BYTES:
+        raise ProtocolError(f"Message of {len(message)} bytes exceeds {MAX_MESSAGE_BYTES}")
+    return LENGTH_PREFIX.pack(len(message)) + message
+
+
+def _read_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            if chunks:
+                raise ProtocolError("Connection closed mid-message")
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def read_message(sock):
+    """(op, body, blob) of the next message, or None if the peer closed the connection."""
+    prefix = _read_exact(sock, LENGTH_PREFIX.size)
+    if prefix is None:
+        return None
+    (length,) = LENGTH_PREFIX.unpack(prefix)
+    if not MESSAGE_HEADER.size <= length <= MAX_MESSAGE_BYTES:
+        raise ProtocolError(f"Invalid message length {length}")
+    message = _read_exact(sock, length)
+    if message is None:
+        raise ProtocolError("Connection closed mid-message")
+    magic, version, op, body_length = MESSAGE_HEADER.unpack_from(message)
+    if magic != PROTOCOL_MAGIC or version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Unsupported message (magic {magic!r}, version {version})")
+    end = MESSAGE_HEADER.size + body_length
+    if end > length:
+        raise ProtocolError("JSON body overruns the message")
+    return op, json.loads(message[MESSAGE_HEADER.size:end]), message[end:]
+
+
+def encode_events(events):
+    """(press, release) pairs, or the app's (key, press, release) events, as the VERIFY blob."""
+    pairs = [event[-2:] for event in events]
+    return np.asarray(pairs, dtype=EVENT_DTYPE).reshape(-1, 2).tobytes()
+
+
+def decode_events(blob):
+    if len(blob) % (2 * EVENT_DTYPE.itemsize):
+        raise ProtocolError("Event blob is not a whole number of (press, release) pairs")
+    return np.frombuffer(blob, dtype=EVENT_DTYPE).reshape(-1, 2)
+
+
+class VerifyClient:
+    """One connection to the daemon; requests are sent one at a time, so use a client per thread."""
+    def __init__(self, address, timeout=30.0):
+        family, self.address = parse_address(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(self.address)
+
+    def request(self, op, body=None, blob=b''):
+        self.sock.sendall(encode_message(op, body, blob))
+        reply = read_message(self.sock)
+        if reply is None:
+            raise ProtocolError("Daemon closed the connection")
+        op, body, _ = reply
+        if op == OP_ERROR:
+            raise DaemonError(body.get('error', 'Unknown error'))
+        return body
+
+    def verify(self, username, session_id, events):
+        """Scores a session. The result has a ticket, and status AUTHENTICATED, REJECTED or STEP_UP_REQUIRED."""
+        return self.request(OP_VERIFY, {"username": username, "session_id": session_id}, encode_events(events))
+
+    def step_up(self, ticket, password):
+        """Answers a STEP_UP_REQUIRED result; a password of None cancels it."""
+        return self.request(OP_STEP_UP, {"ticket": ticket, "password": password})
+
+    def commit(self, ticket, confirm_reanchor, accept_proactive):
+        """Records an authenticated login in the profile.
+
+        The daemon replies with a prompt whenever the template update needs an answer:
+        confirm_reanchor(reason) returns the user's password (None declines) and
+        accept_proactive() returns False to snooze the health prompt.
+        """
+        answers = {"reanchor": {}}
+        while True:
+            reply = self.commit_step(ticket, answers)
+            prompt = reply.get('prompt')
+            if prompt is None:
+                return reply
+            if prompt['kind'] == "REANCHOR":
+                answers['reanchor'][prompt['reason']] = confirm_reanchor(prompt['reason'])
+            else:
+                answers['proactive'] = bool(accept_proactive())
+
+    def commit_step(self, ticket, answers):
+        """One round of commit(): the result, or a reply whose 'prompt' must be answered in `answers` and resent."""
+        return self.request(OP_COMMIT, {"ticket": ticket, "answers": answers})
+
+    def stats(self):
+        return self.request(OP_STATS)
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
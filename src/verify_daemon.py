@@ -0,0 +1,402 @@
+import os
+import sys
+import copy
+import hmac
+import time
+import socket
+import secrets
+import argparse
+import threading
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, UTC
+
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.backends import default_backend
+
+from config import (MODEL_PATH, TEMPLATE_DIR, POLICY_PATH, LOG_FILE_PATH, LOG_RETENTION_DAYS, RATE_LIMIT_DB_PATH, KDF_ITERATIONS,
+                    PIPELINE_THREADS, MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_MS, SCORING_CASCADE,
+                    VERIFY_DAEMON_ADDRESS, VERIFY_SOCKET_PATH, VERIFY_TICKET_TTL_SECONDS, ANCHOR_INDEX_ENABLED)
+from esn import model_fingerprint, compile_model
+from reservoir import read_model
+from auth_core import (process_events_to_features, score_probe, decide, load_policy, advance_drift_counter, template_health,
+                       update_template, audit_record, typing_pattern)
+from profile_store import ProfileStore, ProfileIntegrityError, profile_key
+from rate_limiter import RateLimiter
+from audit_log import SecureLogger
+from batching import BatchedScoring
+from pipeline import Pipeline
+from anchor_index import AnchorIndex
+from verify_client import (OP_VERIFY, OP_STEP_UP, OP_COMMIT, OP_STATS, OP_RESULT, OP_ERROR, ProtocolError, encode_message,
+                           read_message, decode_events, parse_address)
+
+
+# Verification daemon: one process holds the warm model, the derived profile keys and decrypted
+# profiles, and serves any number of capture front-ends over a Unix socket or localhost TCP (see
+# verify_client.py for the protocol). A login is three requests:
+#   VERIFY   raw (press, release) pairs -> scores and a status; rejections and plain accepts are final
+#   STEP_UP  the password for a suspicious accept (or None to cancel)
+#   COMMIT   applies an accepted login to the profile, replying with a prompt whenever a re-anchor
+#            or the health prompt needs the user's answer, and persists it once all are answered
+# The daemon enforces rate limits and writes the audit records; front-ends only capture and render.
+# Concurrent VERIFY requests share the micro-batched embedding and SVM calls.
+
+def _timestamp():
+    return datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _verify_password(stored_hash_hex, salt_hex, provided_password):
+    kdf = PBKDF2HMAC(hashes.SHA256(), 32, bytes.fromhex(salt_hex), KDF_ITERATIONS, default_backend())
+    return hmac.compare_digest(kdf.derive(provided_password.encode()), bytes.fromhex(stored_hash_hex))
+
+
+class _NeedsAnswer(Exception):
+    def __init__(self, prompt):
+        super().__init__(prompt['kind'])
+        self.prompt = prompt
+
+
+class VerificationService:
+    """Verification, step-up and profile updates for the daemon's connections; thread-safe."""
+    def __init__(self, model_path=MODEL_PATH, policy_path=POLICY_PATH, log_path=LOG_FILE_PATH):
+        self.model = read_model(model_path)
+        self.fingerprint = model_fingerprint(self.model)
+        compile_model(self.model)
+        self.policy = load_policy(policy_path)
+        self.logger = SecureLogger(log_path, LOG_RETENTION_DAYS)
+        self.rate_limiter = RateLimiter(RATE_LIMIT_DB_PATH)
+        self.stage_pool = ThreadPoolExecutor(PIPELINE_THREADS * 4, thread_name_prefix="verify-stage")
+        self.scoring = BatchedScoring(lambda: self.model, MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_MS / 1000)
+        self.anchor_index = AnchorIndex(fingerprint=self.fingerprint) if ANCHOR_INDEX_ENABLED else None
+        self._stores = {} # username -> ProfileStore, so each key is derived once
+        self._profiles = {} # username -> (stamp, profile), read-only outside commit
+        self._user_locks = {}
+        self._tickets = {}
+        self._lock = threading.Lock()
+        self._counts = {"verify": 0, "step_up": 0, "commit": 0, "profile_loads": 0, "profile_cache_hits": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def _user_lock(self, username):
+        with self._lock:
+            return self._user_locks.setdefault(username, threading.Lock())
+
+    def _store(self, username):
+        with self._lock:
+            store = self._stores.get(username)
+        if store is None:
+            store = ProfileStore(username, profile_key(username, create=False)) # LookupError for a user without a secret
+            with self._lock:
+                store = self._stores.setdefault(username, store)
+        return store
+
+    def _load_profile(self, username):
+        """(store, profile, stamp) from the cache while the files are unchanged; raises on an unusable profile."""
+        store = self._store(username)
+        stamp = store.stamp()
+        with self._lock:
+            cached = self._profiles.get(username)
+        if cached and cached[0] == stamp:
+            self._count("profile_cache_hits")
+            return store, cached[1], stamp
+        stored_fingerprint = store.read_header().get('model_fingerprint')
+        if stored_fingerprint is not None and stored_fingerprint != self.fingerprint:
+            raise ValueError(f"ProfileModelMismatch: profile model {stored_fingerprint}, current model {self.fingerprint}")
+        profile = store.load()
+        self._count("profile_loads")
+        with self._lock:
+            self._profiles[username] = (stamp, profile)
+        return store, profile, stamp
+
+    def _log(self, record):
+        self.logger.log_event({"timestamp": _timestamp(), **record})
+
+    def _expire_tickets(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [t for t, entry in self._tickets.items() if entry['expires_at'] < now]
+            entries = [self._tickets.pop(t) for t in expired]
+        for entry in entries:
+            if entry['status'] == "STEP_UP_REQUIRED":
+                self._finish_step_up(entry, "STEP_UP_CANCEL")
+
+    def _take_ticket(self, ticket, status):
+        with self._lock:
+            entry = self._tickets.get(ticket)
+            if entry is None or entry['status'] != status or entry['expires_at'] < time.monotonic():
+                raise ValueError("Unknown or expired ticket")
+            return entry
+
+    def verify(self, username, session_id, pairs):
+        self._count("verify")
+        self._expire_tickets()
+        start = time.perf_counter()
+        # The username comes off the socket and becomes a file name
+        if not username or '..' in username or any(c in username for c in ('/', '\\', '\0')):
+            raise ValueError("Invalid username")
+        lockout_scope, retry_after = self.rate_limiter.check(username)
+        if lockout_scope:
+            return {"status": "LOCKED", "scope": lockout_scope, "retry_after": retry_after}
+        # Checked before any key is derived, so unknown names cost no keyring write, PBKDF2 run or cache entry
+        user_found = os.path.exists(os.path.join(TEMPLATE_DIR, f"{username}.dat"))
+        if user_found:
+            try:
+                self._store(username)
+            except LookupError:
+                user_found = False
+        if not user_found:
+            self._log({"event_type": "AUTH_FAIL", "username": username, "error": "UserNotFound", "session_id": session_id})
+            return {"status": "USER_NOT_FOUND"}
+        timings = process_events_to_features([(None, press, release) for press, release in pairs.tolist()])
+        if not timings:
+            raise ValueError("Could not generate features from keystrokes")
+
+        pipeline = Pipeline(self.stage_pool)
+        pipeline.stage("load", lambda: self._load_profile(username))
+        pipeline.stage("embed", lambda: self.scoring.embed(timings))
+        pipeline.stage("score", lambda loaded, probe: self._score(loaded, probe, timings), "load", "embed")
+        try:
+            results, report = pipeline.run()
+        except ProfileIntegrityError:
+            self._log({"event_type": "TAMPER_ALERT", "file": f"{username}.dat"})
+            return self._profile_error(username, session_id, "ProfileTampered")
+        except ValueError as e:
+            if str(e).startswith("ProfileModelMismatch"):
+                self._log({"event_type": "AUTH_FAIL", "username": username, "error": "ProfileModelMismatch", "details": str(e)})
+                return self._profile_error(username, session_id, "ProfileModelMismatch")
+            raise
+        except Exception:
+            return self._profile_error(username, session_id, "ProfileUnreadable")
+
+        result = results["score"]
+        if 'error' in result:
+            self._log({"event_type": "AUTH_FAIL", "username": username, "error": "ProfileModelMismatch", "details": result['details']})
+            return self._profile_error(username, session_id, "ProfileModelMismatch")
+        metadata, scores = result['profile']['metadata'], result['scores']
+        is_authenticated, confidence_override, is_suspicious = decide(
+            scores['svm_adaptive'], scores['svm_anchor'], result['is_adaptive_match'], result['is_anchor_match'],
+            self.policy['confidence_floor'], self.policy['suspicious_threshold'])
+        is_authenticated, is_suspicious = bool(is_authenticated), bool(is_suspicious)
+        if is_authenticated:
+            self.rate_limiter.reset(username)
+        else:
+            self.rate_limiter.record_failure(username)
+
+        step_up = is_authenticated and is_suspicious and not metadata.get("first_login_pending", False)
+        status = "STEP_UP_REQUIRED" if step_up else ("AUTHENTICATED" if is_authenticated else "REJECTED")
+        entry = {**result, "username": username, "session_id": session_id, "status": status,
+                 "confidence_override": bool(confidence_override), "is_suspicious": is_suspicious,
+                 "latency_ms": (time.perf_counter() - start) * 1000, "pipeline": report,
+                 "expires_at": time.monotonic() + VERIFY_TICKET_TTL_SECONDS}
+        ticket = secrets.token_hex(16)
+        if status != "REJECTED":
+            with self._lock:
+                self._tickets[ticket] = entry
+        if not step_up:
+            self._log_decision(entry, is_authenticated)
+        return {"ticket": ticket, **self._public(entry)}
+
+    def _score(self, loaded, probe, timings):
+        store, profile, stamp = loaded
+        if probe.shape[0] != profile['esn_anchor'].shape[0]:
+            return {"error": "ProfileModelMismatch", "details": f"Live vector shape: {probe.shape}, Stored anchor shape: {profile['esn_anchor'].shape}"}
+        probe_result = score_probe(self.model, probe, profile['esn_anchor'], profile['rolling_window'], profile['metadata'],
+                                   self.policy, self.scoring.score, SCORING_CASCADE)
+        return {**probe_result, "profile": profile, "stamp": stamp, "new_feature_vector": probe,
+                "typing_pattern": typing_pattern(timings, profile['statistical_template'])}
+
+    def _profile_error(self, username, session_id, error):
+        self._log({"event_type": "AUTH_FAIL", "username": username, "error": "ProfileCorruptOrUnreadable", "session_id": session_id})
+        return {"status": "PROFILE_ERROR", "error": error}
+
+    @staticmethod
+    def _public(entry):
+        return {name: entry[name] for name in ("status", "scores", "is_adaptive_match", "is_anchor_match", "threshold_mode",
+                                               "typing_pattern", "confidence_override", "is_suspicious", "latency_ms", "decided_by")}
+
+    def _log_decision(self, entry, is_authenticated):
+        metadata = entry['profile']['metadata']
+        entry['drift_counter'] = advance_drift_counter(metadata.get('drift_counter', 0), is_authenticated,
+                                                       entry['is_adaptive_match'], entry['is_anchor_match'])
+        self._log({
+            "event_type": "AUTH_SUCCESS" if is_authenticated else "AUTH_FAIL",
+            "user_id": metadata.get("user_id", ""), "username": entry['username'], "session_id": entry['session_id'],
+            "scores": entry['scores'],
+            "thresholds": {name: float(metadata[name]) for name in ('svm_threshold', 'cosine_threshold', 'distance_threshold')},
+            "is_adaptive_match": entry['is_adaptive_match'], "is_anchor_match": entry['is_anchor_match'],
+            "confidence_override": entry['confidence_override'],
+            "latency_ms": entry['latency_ms'], "drift_counter": entry['drift_counter'],
+            "critical_path": entry['pipeline']['critical_path'],
+            "stage_ms": {name: round(ms, 1) for name, ms in entry['pipeline']['stage_ms'].items()},
+            "threshold_mode": entry['threshold_mode'],
+            "method": "ADAPTIVE" if entry['is_adaptive_match'] else ("ANCHOR" if entry['is_anchor_match'] else "NONE"),
+            "typing_pattern": entry['typing_pattern'], "decided_by": entry['decided_by'],
+            **({"is_suspicious": entry['is_suspicious']} if entry['decided_by'] == "svm" else {})
+        })
+
+    def _finish_step_up(self, entry, event_type):
+        metadata = entry['profile']['metadata']
+        self._log({"event_type": event_type, "user_id": metadata.get("user_id", ""), "username": entry['username'],
+                   "session_id": entry['session_id']})
+        entry['status'] = "AUTHENTICATED" if event_type == "STEP_UP_SUCCESS" else "REJECTED"
+        self._log_decision(entry, entry['status'] == "AUTHENTICATED")
+
+    def step_up(self, ticket, password):
+        self._count("step_up")
+        entry = self._take_ticket(ticket, "STEP_UP_REQUIRED")
+        metadata = entry['profile']['metadata']
+        if password is None:
+            event_type = "STEP_UP_CANCEL"
+        elif _verify_password(metadata['password_hash'], metadata['salt'], password):
+            event_type = "STEP_UP_SUCCESS"
+        else:
+            event_type = "STEP_UP_FAIL"
+        self._finish_step_up(entry, event_type)
+        if entry['status'] != "AUTHENTICATED":
+            with self._lock:
+                self._tickets.pop(ticket, None)
+        return {"status": entry['status']}
+
+    def commit(self, ticket, answers):
+        """Applies an authenticated login to the profile, or returns the prompt that still needs an answer."""
+        self._count("commit")
+        entry = self._take_ticket(ticket, "AUTHENTICATED")
+        username = entry['username']
+        with self._user_lock(username):
+            self._take_ticket(ticket, "AUTHENTICATED") # A concurrent commit of the same ticket has already applied it
+            # The cached profile is shared with concurrent verifications, so the update runs on a copy
+            store, profile, _ = self._load_profile(username)
+            profile = copy.deepcopy(profile)
+            denied = []
+
+            def confirm_reanchor(reason):
+                password = answers.get('reanchor', {}).get(reason, ...)
+                if password is ...:
+                    raise _NeedsAnswer({"kind": "REANCHOR", "reason": reason})
+                metadata = profile['metadata']
+                if password and _verify_password(metadata['password_hash'], metadata['salt'], password):
+                    return True
+                denied.append(reason)
+                return False
+
+            def accept_proactive():
+                if 'proactive' not in answers:
+                    raise _NeedsAnswer({"kind": "PROACTIVE"})
+                return bool(answers['proactive'])
+
+            try:
+                events = update_template(profile, entry['scores'], entry['is_anchor_match'], entry['new_feature_vector'],
+                                         entry['drift_counter'], confirm_reanchor, accept_proactive, self.policy)
+            except _NeedsAnswer as e:
+                return {"prompt": e.prompt}
+            timestamp = _timestamp()
+            store.append_events(profile, events, timestamp=timestamp, session_id=entry['session_id'])
+            if self.anchor_index and any(event['event_type'] == "REANCHOR_SUCCESS" for event in events):
+                self.anchor_index.upsert(username, profile['esn_anchor'])
+            with self._lock:
+                self._profiles[username] = (store.stamp(), profile)
+                self._tickets.pop(ticket, None)
+
+        metadata = profile['metadata']
+        records = [audit_record(event) for event in events if event['event_type'] != "LOGIN_RECORDED"]
+        for record in records:
+            self._log({**record, "user_id": metadata.get('user_id'), "username": username, "session_id": entry['session_id']})
+        health, consistency, performance = template_health(profile['rolling_window'], metadata['recent_anchor_scores'],
+                                                           profile.get('baseline_variability'))
+        return {
+            "events": records, "reanchor_denied": denied,
+            "dashboard": {"health": float(health), "consistency": float(consistency), "performance": float(performance),
+                          "scores": [float(s) for s in metadata['recent_anchor_scores']], "logins": metadata['login_count'],
+                          "drift": metadata['drift_counter'], "anomalies": metadata['consecutive_anomaly_count']}
+        }
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts, cached_profiles=len(self._profiles), open_tickets=len(self._tickets))
+        return {**counts, "batching": self.scoring.stats(), "audit_writer": self.logger.stats()}
+
+    def close(self):
+        self.scoring.close()
+        self.stage_pool.shutdown()
+        self.logger.close()
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        service = self.server.service
+        while True:
+            try:
+                message = read_message(self.request)
+            except (ProtocolError, ValueError, OSError):
+                return # Malformed stream: there is no way to resynchronise, so drop the connection
+            if message is None:
+                return
+            op, body, blob = message
+            try:
+                if op == OP_VERIFY:
+                    reply = service.verify(str(body['username']), body.get('session_id'), decode_events(blob))
+                elif op == OP_STEP_UP:
+                    reply = service.step_up(body['ticket'], body.get('password'))
+                elif op == OP_COMMIT:
+                    reply = service.commit(body['ticket'], body.get('answers') or {})
+                elif op == OP_STATS:
+                    reply = service.stats()
+                else:
+                    raise ValueError(f"Unknown op {op}")
+                response = encode_message(OP_RESULT, reply)
+            except Exception as e:
+                response = encode_message(OP_ERROR, {"error": f"{type(e).__name__}: {e}"})
+            self.request.sendall(response)
+
+
+class ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128 # Front-ends connect in bursts at peak; the default backlog of 5 refuses them
+
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+def serve(address, service):
+    """Binds `address` ('unix:/path' or 'host:port') and returns the server; call serve_forever() on it."""
+    family, bind_to = parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(bind_to):
+            os.remove(bind_to) # Left behind by a previous daemon
+        old_umask = os.umask(0o177) # The socket is created owner-only
+        try:
+            server = ThreadingUnixServer(bind_to, _Handler)
+        finally:
+            os.umask(old_umask)
+    else:
+        if bind_to[0] not in ('127.0.0.1', 'localhost', '::1'):
+            raise ValueError("The daemon only listens on localhost")
+        server = ThreadingTCPServer(bind_to, _Handler)
+    server.service = service
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve keystroke verification to local front-ends.")
+    parser.add_argument('--address', default=VERIFY_DAEMON_ADDRESS or f"unix:{VERIFY_SOCKET_PATH}",
+                        help="unix:/path/to.sock or 127.0.0.1:port")
+    args = parser.parse_args()
+
+    service = VerificationService()
+    service.logger.purge_old_logs()
+    server = serve(args.address, service)
+    print(f"Verification daemon listening on {args.address} (model {service.fingerprint})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    sys.exit(0)
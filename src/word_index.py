@@ -0,0 +1,200 @@
+import os
+import sys
+import json
+import math
+import hashlib
+import argparse
+
+import numpy as np
+
+
+# Index file layout:
+#   MAGIC | uint32 header length | JSON header | padding to SECTION_ALIGN
+#   words     : n_words fixed-width byte strings, sorted (binary-searchable)
+#   ngram_keys: n_ngrams uint32 packed character n-grams, sorted
+#   ngram_logp: n_ngrams float32 log-probabilities matching ngram_keys
+INDEX_MAGIC = b'KSWI'
+INDEX_FORMAT_VERSION = 1
+SECTION_ALIGN = 64
+NGRAM_SIZE = 3
+# Percentile of dictionary word scores used as the "looks like a word" cut-off
+PLAUSIBLE_PERCENTILE = 5.0
+WORD_BOUNDARY = b'^'
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _aligned(offset):
+    return (offset + SECTION_ALIGN - 1) // SECTION_ALIGN * SECTION_ALIGN
+
+
+def _word_ngrams(word_bytes, n=NGRAM_SIZE):
+    padded = WORD_BOUNDARY + word_bytes + WORD_BOUNDARY
+    if len(padded) < n:
+        padded = padded.ljust(n, WORD_BOUNDARY)
+    # Pack each n-byte window into one integer so lookups are plain searchsorted calls
+    return [int.from_bytes(padded[i:i + n], 'big') for i in range(len(padded) - n + 1)]
+
+
+def _ngram_log_probs(words, n=NGRAM_SIZE):
+    counts = {}
+    for word in words:
+        for key in _word_ngrams(word, n):
+            counts[key] = counts.get(key, 0) + 1
+    keys = np.array(sorted(counts), dtype=np.uint32)
+    total = float(sum(counts.values()))
+    log_probs = np.array([math.log(counts[int(k)] / total) for k in keys], dtype=np.float32)
+    # Unseen n-grams are scored as if they had been seen half a time
+    unseen_log_prob = math.log(0.5 / total)
+    return keys, log_probs, unseen_log_prob
+
+
+def build_word_index(dictionary_path, index_path):
+    """Compiles a dictionary text file into a memory-mappable word index."""
+    with open(dictionary_path, 'r', encoding='utf-8') as f:
+        words = sorted({line.strip().lower().encode('utf-8') for line in f} - {b''})
+    if not words:
+        raise ValueError(f"Dictionary file is empty: {dictionary_path}")
+
+    word_width = max(len(w) for w in words)
+    word_array = np.array(words, dtype=f'S{word_width}')
+    ngram_keys, ngram_logp, unseen_log_prob = _ngram_log_probs(words)
+
+    header = {
+        "version": INDEX_FORMAT_VERSION,
+        "source_sha256": file_sha256(dictionary_path),
+        "word_width": word_width,
+        "n_words": len(words),
+        "ngram_size": NGRAM_SIZE,
+        "n_ngrams": int(ngram_keys.size),
+        "unseen_log_prob": unseen_log_prob,
+    }
+    index = WordIndex(header, word_array, ngram_keys, ngram_logp)
+    header["plausible_log_prob"] = float(np.percentile(index.word_scores(words), PLAUSIBLE_PERCENTILE))
+
+    # Offsets depend on the header length, so settle them before writing anything
+    header_bytes, words_offset = b'', None
+    while words_offset != _aligned(len(INDEX_MAGIC) + 4 + len(header_bytes)):
+        words_offset = _aligned(len(INDEX_MAGIC) + 4 + len(header_bytes))
+        keys_offset = _aligned(words_offset + word_array.nbytes)
+        logp_offset = keys_offset + ngram_keys.nbytes
+        header.update(words_offset=words_offset, keys_offset=keys_offset, logp_offset=logp_offset)
+        header_bytes = json.dumps(header, sort_keys=True).encode('utf-8')
+
+    os.makedirs(os.path.dirname(index_path) or '.', exist_ok=True)
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(INDEX_MAGIC + len(header_bytes).to_bytes(4, 'little') + header_bytes)
+        f.write(b'\0' * (words_offset - f.tell()))
+        f.write(word_array.tobytes())
+        f.write(b'\0' * (keys_offset - f.tell()))
+        f.write(ngram_keys.astype('<u4').tobytes())
+        f.write(ngram_logp.astype('<f4').tobytes())
+    os.replace(tmp_path, index_path)
+    return header
+
+
+def read_index_header(index_path):
+    with open(index_path, 'rb') as f:
+        if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+            raise ValueError(f"Not a word index file: {index_path}")
+        header_len = int.from_bytes(f.read(4), 'little')
+        return json.loads(f.read(header_len))
+
+
+class WordIndex:
+    """Sorted fixed-width word array with an optional character n-gram model."""
+    def __init__(self, header, words, ngram_keys, ngram_logp):
+        self.header = header
+        self.words = words
+        self.ngram_keys = ngram_keys
+        self.ngram_logp = ngram_logp
+        self.word_width = header['word_width']
+
+    @classmethod
+    def open(cls, index_path):
+        header = read_index_header(index_path)
+        if header.get('version') != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported word index version: {header.get('version')}")
+        words = np.memmap(index_path, dtype=f"S{header['word_width']}", mode='r',
+                          offset=header['words_offset'], shape=(header['n_words'],))
+        ngram_keys = np.memmap(index_path, dtype='<u4', mode='r',
+                               offset=header['keys_offset'], shape=(header['n_ngrams'],))
+        ngram_logp = np.memmap(index_path, dtype='<f4', mode='r',
+                               offset=header['logp_offset'], shape=(header['n_ngrams'],))
+        return cls(header, words, ngram_keys, ngram_logp)
+
+    def __len__(self):
+        return self.header['n_words']
+
+    def __contains__(self, word):
+        return bool(self.contains([word])[0])
+
+    def contains(self, words):
+        """Vectorised exact lookup; returns a boolean array aligned with `words`."""
+        encoded = [w.encode('utf-8') if isinstance(w, str) else w for w in words]
+        if not encoded:
+            return np.zeros(0, dtype=bool)
+        # Words wider than the index cannot be present (and numpy would truncate them)
+        fits = np.array([len(w) <= self.word_width for w in encoded], dtype=bool)
+        probe = np.array([w if ok else b'' for w, ok in zip(encoded, fits)], dtype=f'S{self.word_width}')
+        positions = np.minimum(np.searchsorted(self.words, probe), len(self.words) - 1)
+        return fits & (self.words[positions] == probe) & (probe != b'')
+
+    def word_scores(self, words):
+        """Mean n-gram log-probability of each word; higher means more word-like."""
+        encoded = [w.encode('utf-8') if isinstance(w, str) else w for w in words]
+        grams = [_word_ngrams(w, self.header['ngram_size']) for w in encoded]
+        lengths = np.array([len(g) for g in grams])
+        if lengths.sum() == 0:
+            return np.full(len(encoded), self.header['unseen_log_prob'])
+        flat = np.fromiter((k for g in grams for k in g), dtype=np.uint32, count=int(lengths.sum()))
+        positions = np.minimum(np.searchsorted(self.ngram_keys, flat), len(self.ngram_keys) - 1)
+        found = self.ngram_keys[positions] == flat
+        log_probs = np.where(found, self.ngram_logp[positions], self.header['unseen_log_prob'])
+        return np.add.reduceat(log_probs, np.r_[0, np.cumsum(lengths)[:-1]]) / lengths
+
+    def lookup(self, words, ngram_fallback=False):
+        """Marks each word as valid; unknown words may be rescued by the n-gram model."""
+        valid = self.contains(words)
+        if ngram_fallback and not valid.all():
+            unknown = np.flatnonzero(~valid)
+            scores = self.word_scores([words[i] for i in unknown])
+            valid[unknown] = scores >= self.header['plausible_log_prob']
+        return valid
+
+
+def load_word_index(dictionary_path, index_path):
+    """Opens the compiled index, rebuilding it when the source dictionary has changed."""
+    source_hash = file_sha256(dictionary_path)
+    try:
+        header = read_index_header(index_path)
+        if header.get('version') == INDEX_FORMAT_VERSION and header.get('source_sha256') == source_hash:
+            return WordIndex.open(index_path)
+    except (FileNotFoundError, ValueError, json.JSONDecodeError):
+        pass
+    build_word_index(dictionary_path, index_path)
+    return WordIndex.open(index_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the compiled dictionary index.")
+    parser.add_argument('dictionary', help="Path to the source dictionary.txt")
+    parser.add_argument('index', help="Path of the compiled index file")
+    parser.add_argument('--check', nargs='*', default=[], help="Words to look up after building")
+    parser.add_argument('--ngram', action='store_true', help="Use the n-gram fallback for --check")
+    args = parser.parse_args()
+
+    built = build_word_index(args.dictionary, args.index)
+    print(f"Indexed {built['n_words']} words and {built['n_ngrams']} {built['ngram_size']}-grams into {args.index}")
+    if args.check:
+        word_index = WordIndex.open(args.index)
+        for word, ok, score in zip(args.check, word_index.lookup(args.check, args.ngram), word_index.word_scores(args.check)):
+            print(f"{word}: {'valid' if ok else 'unknown'} (score {score:.2f})")
+    sys.exit(0)
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from sklearn.preprocessing import StandardScaler
+
+from esn import compile_model, embed_samples, extract_esn_features, embedding_dim
+
+
+INPUT_DIM = 4
+RESERVOIR_SIZE = 30
+WASHOUT = 10
+
+
+def make_model(seed=0, projection_k=None):
+    """A small model with fitted, non-trivial scalers (and optionally a PCA-style projection)."""
+    rng = np.random.default_rng(seed)
+    W_res = rng.standard_normal((RESERVOIR_SIZE, RESERVOIR_SIZE))
+    model = {
+        'W_input': rng.uniform(-0.5, 0.5, (RESERVOIR_SIZE, INPUT_DIM)),
+        'W_reservoir': W_res * 0.9 / np.max(np.abs(np.linalg.eigvals(W_res))),
+        'washout_period': WASHOUT,
+        'leak_rate': 0.3,
+        'input_scaler': StandardScaler().fit(rng.gamma(2.0, 0.08, (500, INPUT_DIM)) + [0.1, 0.0, 0.2, 0.05]),
+    }
+    train = [model['input_scaler'].transform(s) for s in random_samples(rng, [60] * 40)]
+    states = np.array([extract_esn_features(model, s, np.ones(len(s), dtype=bool)) for s in train])
+    model['feature_scaler'] = StandardScaler().fit(states)
+    if projection_k is not None:
+        components, _ = np.linalg.qr(rng.standard_normal((RESERVOIR_SIZE, projection_k)))
+        model['projection'] = {'mean': rng.standard_normal(RESERVOIR_SIZE) * 0.1, 'components': components.T}
+    return model
+
+
+def random_samples(rng, lengths):
+    return [rng.gamma(2.0, 0.08, (length, INPUT_DIM)) for length in lengths]
+
+
+def reference_embedding(model, timings):
+    """The per-sample path the folded model replaces: scale, run the reservoir, scale and project."""
+    scaled = model['input_scaler'].transform(np.asarray(timings))
+    state = extract_esn_features(model, scaled, np.ones(len(scaled), dtype=bool))
+    features = model['feature_scaler'].transform(state.reshape(1, -1))[0]
+    projection = model.get('projection')
+    return features if projection is None else (features - projection['mean']) @ projection['components'].T
+
+
+@pytest.mark.parametrize("projection_k", [None, 8])
+def test_folded_embeddings_match_per_sample_path(projection_k):
+    model = compile_model(make_model(projection_k=projection_k))
+    # Shorter than, equal to and just past the washout (last-state fallback), then mixed longer lengths
+    lengths = [2, 5, WASHOUT - 1, WASHOUT, WASHOUT + 1, 17, 33, 64]
+    samples = random_samples(np.random.default_rng(1), lengths)
+
+    folded = embed_samples(model, samples)
+
+    assert folded.shape == (len(samples), embedding_dim(model))
+    expected = np.array([reference_embedding(model, s) for s in samples])
+    np.testing.assert_allclose(folded, expected, rtol=1e-9, atol=1e-9)
+
+
+def test_single_sample_matches_batch():
+    model = compile_model(make_model(seed=3))
+    samples = random_samples(np.random.default_rng(2), [4, 25, 50])
+    batch = embed_samples(model, samples)
+    for sample, embedding in zip(samples, batch):
+        np.testing.assert_allclose(embed_samples(model, [sample])[0], embedding, rtol=1e-12, atol=1e-12)
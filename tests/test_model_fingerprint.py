@@ -0,0 +1,45 @@
+import copy
+
+import numpy as np
+from sklearn.preprocessing import MinMaxScaler, StandardScaler
+from sklearn.svm import SVC
+
+from esn import model_fingerprint
+
+
+def make_model():
+    rng = np.random.default_rng(0)
+    differences = np.abs(rng.normal(0.0, 1.0, (80, 6)))
+    return {
+        'W_input': rng.uniform(-0.5, 0.5, (6, 3)),
+        'W_reservoir': rng.normal(0.0, 0.3, (6, 6)),
+        'washout_period': 4,
+        'leak_rate': 0.3,
+        'input_scaler': StandardScaler().fit(rng.gamma(2.0, 0.1, (50, 3))),
+        'feature_scaler': StandardScaler().fit(rng.normal(0.0, 1.0, (50, 6))),
+        'svm_classifier': SVC(probability=True, random_state=0).fit(differences, differences.sum(axis=1) < 4.5),
+    }
+
+
+def test_fingerprint_is_stable():
+    assert model_fingerprint(make_model()) == model_fingerprint(make_model())
+
+
+def test_fingerprint_covers_svm_hyperparameters_and_calibration():
+    model = make_model()
+    fingerprint = model_fingerprint(model)
+
+    regularized = copy.deepcopy(model)
+    regularized['svm_classifier'].set_params(C=2.0)
+    assert model_fingerprint(regularized) != fingerprint
+
+    recalibrated = copy.deepcopy(model)
+    recalibrated['svm_classifier']._probA = recalibrated['svm_classifier']._probA * 1.1
+    assert model_fingerprint(recalibrated) != fingerprint
+
+
+def test_fingerprint_accepts_any_foldable_scaler():
+    model = make_model()
+    rescaled = copy.deepcopy(model)
+    rescaled['input_scaler'] = MinMaxScaler().fit(np.random.default_rng(1).gamma(2.0, 0.1, (50, 3)))
+    assert model_fingerprint(rescaled) != model_fingerprint(model)
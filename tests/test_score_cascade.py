@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from sklearn.svm import SVC
+
+from auth_core import DEFAULT_POLICY, CascadeMismatchError, score_probe, decide, enrollment_from_vectors
+from rolling_window import RollingWindow
+
+
+DIM = 16
+USERS = 6
+
+
+def typist_vectors(rng, center, count, noise=0.35):
+    return center + rng.normal(0.0, noise, (count, DIM))
+
+
+@pytest.fixture(scope="module")
+def population():
+    """Synthetic embeddings for a few users and an SVM trained on |a - b| of same/different-user pairs."""
+    rng = np.random.default_rng(0)
+    centers = rng.normal(0.0, 1.0, (USERS, DIM))
+    samples = [typist_vectors(rng, center, 20) for center in centers]
+    pairs, labels = [], []
+    for u in range(USERS):
+        for _ in range(60):
+            a, b = rng.integers(20, size=2)
+            pairs.append(np.abs(samples[u][a] - samples[u][b])); labels.append(1)
+            other = (u + rng.integers(1, USERS)) % USERS
+            pairs.append(np.abs(samples[u][a] - samples[other][b])); labels.append(0)
+    model = {'svm_classifier': SVC(probability=True, random_state=0).fit(np.array(pairs), labels)}
+    return model, centers, rng
+
+
+def enroll(model, rng, center, window_samples=0):
+    anchor, thresholds, _ = enrollment_from_vectors(model, typist_vectors(rng, center, 5))
+    window = RollingWindow(20)
+    window.extend(typist_vectors(rng, center, window_samples))
+    return anchor, window, thresholds
+
+
+def decision(result, policy=DEFAULT_POLICY):
+    scores = result['scores']
+    return tuple(bool(v) for v in decide(scores['svm_adaptive'], scores['svm_anchor'], result['is_adaptive_match'],
+                                         result['is_anchor_match'], policy['confidence_floor'], policy['suspicious_threshold'])[:2])
+
+
+@pytest.mark.parametrize("window_samples", [0, 12])
+def test_verify_mode_agrees_with_full_scoring(population, window_samples):
+    model, centers, rng = population
+    decided_by, accepted = [], {True: 0, False: 0}
+    for user, center in enumerate(centers):
+        anchor, window, thresholds = enroll(model, rng, center, window_samples)
+        probes = [(p, True) for p in typist_vectors(rng, center, 10)]
+        probes += [(p, False) for other in np.delete(centers, user, axis=0) for p in typist_vectors(rng, other, 3)]
+        for probe, genuine in probes:
+            verified = score_probe(model, probe, anchor, window, thresholds, cascade="verify")
+            full = score_probe(model, probe, anchor, window, thresholds, cascade="full")
+            assert decision(verified) == decision(full)
+            assert verified['scores'] == full['scores']
+            decided_by.append(verified['decided_by'])
+            accepted[genuine] += decision(full)[0]
+    # Both stages settled some logins, and the synthetic typists are separable
+    assert {"vector", "svm"} <= set(decided_by)
+    assert accepted[True] > 0.8 * len(centers) * 10
+    assert accepted[False] < 0.05 * len(centers) * (USERS - 1) * 3
+
+
+def test_verify_mode_raises_when_the_stages_disagree(population):
+    model, centers, rng = population
+    anchor, window, thresholds = enroll(model, rng, centers[0])
+    impostor = typist_vectors(rng, centers[1], 1)[0]
+
+    # A scorer whose vector scores differ from the cascade's own makes the full path accept what the gates reject
+    def lenient_scorer(probes, templates):
+        return np.full(len(probes), 0.99), np.ones(len(probes)), np.zeros(len(probes))
+
+    assert score_probe(model, impostor, anchor, window, thresholds, scorer=lenient_scorer, cascade="cascade")['decided_by'] == "vector"
+    with pytest.raises(CascadeMismatchError):
+        score_probe(model, impostor, anchor, window, thresholds, scorer=lenient_scorer, cascade="verify")